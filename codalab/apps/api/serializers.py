@@ -71,6 +71,7 @@ class LeaderBoardSerial(serializers.ModelSerializer):
     entries =  CompetitionSubmissionSerial(read_only=True, source='submissions')
     class Meta:
         model = webmodels.PhaseLeaderBoard
+        read_only_fields = ('version', 'last_modified')
 
 class CompetitionDataSerial(serializers.ModelSerializer):
     image_url = serializers.URLField(source='image.url', read_only=True)
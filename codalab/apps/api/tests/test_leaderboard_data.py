@@ -0,0 +1,140 @@
+"""
+Tests for the paginated and conditional leaderboard data API
+"""
+import datetime
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet,
+                             add_submission_to_leaderboard)
+
+User = get_user_model()
+
+
+class LeaderBoardDataTests(TestCase):
+
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="organizer", password="pass")
+        self.competition = Competition.objects.create(creator=self.organizer, modified_by=self.organizer, published=True)
+        self.phase = CompetitionPhase.objects.create(
+            competition=self.competition,
+            phasenumber=1,
+            start_date=datetime.datetime.now() - datetime.timedelta(days=30),
+        )
+        PhaseLeaderBoard.objects.create(phase=self.phase)
+
+        result_group = SubmissionResultGroup.objects.create(
+            competition=self.competition,
+            key="results",
+            label="Results",
+            ordering=1
+        )
+        SubmissionResultGroupPhase.objects.create(phase=self.phase, group=result_group)
+        self.score_def = SubmissionScoreDef.objects.create(
+            competition=self.competition,
+            key="score",
+            label="Score",
+        )
+        SubmissionScoreDefGroup.objects.create(scoredef=self.score_def, group=result_group)
+        SubmissionScoreSet.objects.create(
+            competition=self.competition,
+            key="score",
+            label="Score",
+            scoredef=self.score_def,
+        )
+
+        approved = ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+        finished = CompetitionSubmissionStatus.objects.create(name="finished", codename="finished")
+        # Scores 1..7, ranked by ascending score
+        self.submissions = []
+        for i in range(7):
+            user = User.objects.create_user(username="participant%s" % i, password="pass")
+            participant = CompetitionParticipant.objects.create(user=user, competition=self.competition, status=approved)
+            submission = CompetitionSubmission.objects.create(participant=participant, phase=self.phase, status=finished)
+            submission.status = finished
+            submission.save()
+            self.score = SubmissionScore.objects.create(result=submission, scoredef=self.score_def, value=i + 1)
+            add_submission_to_leaderboard(submission)
+            self.submissions.append(submission)
+
+        self.url = reverse("api_phase_leaderboarddata", kwargs={
+            "competition_id": self.competition.pk,
+            "phase_id": self.phase.phasenumber
+        })
+
+    def _ids(self, group):
+        return [score['id'] for (rank, score) in group['scores']]
+
+    def test_full_leaderboard_is_returned_without_parameters(self):
+        resp = self.client.get(self.url)
+        self.assertEquals(resp.status_code, 200)
+        groups = json.loads(resp.content)
+        self.assertEquals(len(groups), 1)
+        self.assertEquals(len(groups[0]['scores']), 7)
+        self.assertNotIn('total', groups[0])
+
+    def test_offset_and_limit(self):
+        resp = self.client.get(self.url, {'offset': 2, 'limit': 3})
+        group = json.loads(resp.content)[0]
+        self.assertEquals(group['total'], 7)
+        self.assertEquals(group['offset'], 2)
+        self.assertEquals(self._ids(group), [s.pk for s in self.submissions][2:5])
+
+    def test_around_centers_the_window_on_the_submission(self):
+        resp = self.client.get(self.url, {'around': self.submissions[6].pk, 'limit': 4})
+        group = json.loads(resp.content)[0]
+        # The highest score is the last row of the leaderboard
+        self.assertEquals(group['offset'], 4)
+        self.assertEquals(self._ids(group), [s.pk for s in self.submissions][4:])
+
+    def test_group_filter(self):
+        resp = self.client.get(self.url, {'group': 'results'})
+        self.assertEquals(len(json.loads(resp.content)), 1)
+        resp = self.client.get(self.url, {'group': 'unknown'})
+        self.assertEquals(json.loads(resp.content), [])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEquals(self.client.get(self.url, {'limit': 'many'}).status_code, 400)
+        self.assertEquals(self.client.get(self.url, {'limit': 0}).status_code, 400)
+        self.assertEquals(self.client.get(self.url, {'offset': -1}).status_code, 400)
+
+    def test_unchanged_leaderboard_is_not_modified(self):
+        resp = self.client.get(self.url)
+        self.assertTrue(resp.has_header('ETag'))
+        self.assertTrue(resp.has_header('Last-Modified'))
+
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEquals(resp.status_code, 304)
+
+    def test_score_change_modifies_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.score.value = 10
+        self.score.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(resp.status_code, 200)
+        self.assertNotEquals(resp['ETag'], etag)
+
+    def test_etag_depends_on_the_window(self):
+        etag = self.client.get(self.url, {'offset': 2, 'limit': 3})['ETag']
+        resp = self.client.get(self.url, {'offset': 3, 'limit': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(resp.status_code, 200)
+        self.assertNotEquals(resp['ETag'], etag)
+        self.assertEquals(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Equivalent parameters are the same window
+        resp = self.client.get(self.url, {'offset': '2', 'limit': '3', 'unused': 'x'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(resp.status_code, 304)
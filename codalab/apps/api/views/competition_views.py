@@ -1,6 +1,7 @@
 """
 Defines Django views for 'apps.api' app for competitions
 """
+import hashlib
 import json
 import logging
 
@@ -23,12 +24,13 @@ from django.template import Context
 from django.template.loader import render_to_string
 from django.utils.decorators import method_decorator
 from django.utils.html import escape
+from django.views.decorators.http import condition
 
 
 from apps.api import serializers
 from apps.jobs.models import Job
 from apps.web import models as webmodels
-from apps.web.tasks import (create_competition, evaluate_submission)
+from apps.web.tasks import (create_competition, evaluate_submission, refresh_leaderboard_snapshot)
 
 from codalab.azure_storage import make_blob_sas_url, PREFERRED_STORAGE_X_MS_VERSION
 
@@ -567,6 +569,7 @@ class CompetitionSubmissionViewSet(viewsets.ModelViewSet):
             lb = webmodels.PhaseLeaderBoard.objects.get(phase=submission.phase)
             lbe = webmodels.PhaseLeaderBoardEntry.objects.get(board=lb, result=submission)
             lbe.delete()
+            refresh_leaderboard_snapshot(submission.phase)
             response['status'] = lbe.id
             return Response(response, status=response['status'], content_type="application/json")
         except ObjectDoesNotExist:
@@ -590,6 +593,7 @@ class CompetitionSubmissionViewSet(viewsets.ModelViewSet):
             raise ParseError(detail='Invalid submission')
         response = dict()
         _, cr = webmodels.add_submission_to_leaderboard(submission)
+        refresh_leaderboard_snapshot(submission.phase)
         response['status'] = (201 if cr else 200)
         return Response(response, status=response['status'], content_type="application/json")
 
@@ -615,10 +619,73 @@ class LeaderBoardViewSet(viewsets.ModelViewSet):
 leaderboard_list = LeaderBoardViewSet.as_view({'get':'list', 'post':'create'})
 leaderboard_retrieve = LeaderBoardViewSet.as_view({'get':'retrieve', 'put':'update', 'patch':'partial_update'})
 
+def _leaderboard_state(competition_id, phase_id):
+    """
+    Returns the (version, last_modified) pair of the leaderboard of a phase, or None when the
+    leaderboard does not exist yet.
+    """
+    state = webmodels.PhaseLeaderBoard.objects.filter(
+        phase__competition_id=competition_id,
+        phase__phasenumber=phase_id
+    ).order_by('pk').values_list('phase_id', 'version', 'last_modified')[:1]
+    return state[0] if state else None
+
+
+def _leaderboard_etag(request, competition_id=None, phase_id=None):
+    state = _leaderboard_state(competition_id, phase_id)
+    if state is not None:
+        etag = "leaderboard-%s-%s" % (state[0], state[1])
+        window = _leaderboard_window(request.GET, LeaderBoardDataViewSet.default_around_limit)
+        if window != (None, 0, None, None):
+            # Windows of the same version are different representations
+            etag += "-%s" % hashlib.sha1(json.dumps(window)).hexdigest()[:16]
+        return etag
+
+
+def _leaderboard_last_modified(request, competition_id=None, phase_id=None):
+    state = _leaderboard_state(competition_id, phase_id)
+    if state is not None:
+        return state[2]
+
+
+def _int_param(params, name, default=None, minimum=0):
+    value = params.get(name, None)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ParseError(detail='Invalid %s.' % name)
+    if value < minimum:
+        raise ParseError(detail='Invalid %s.' % name)
+    return value
+
+
+def _leaderboard_window(params, default_around_limit):
+    """
+    Returns the normalized (group, offset, limit, around) query parameters of a leaderboard request.
+    """
+    around = _int_param(params, 'around')
+    offset = _int_param(params, 'offset', default=0)
+    limit = _int_param(params, 'limit', default=default_around_limit if around is not None else None, minimum=1)
+    return (params.get('group', None), offset, limit, around)
+
+
 class LeaderBoardDataViewSet(views.APIView):
     """
     Provides a web API to get the leaderboard data for a phase of a competition
+
+    Query parameters:
+        group: key of the result group to return, all groups are returned when missing.
+        offset, limit: window of rows returned for every group.
+        around: id of a submission, returns the window of `limit` rows centered on it.
+
+    Responses carry ETag and Last-Modified headers which change with the version of the
+    leaderboard, the ETag also depends on the query parameters, so conditional requests of unchanged leaderboards are answered with a 304.
     """
+    default_around_limit = 20
+
+    @method_decorator(condition(etag_func=_leaderboard_etag, last_modified_func=_leaderboard_last_modified))
     def get(self, request, *args, **kwargs):
         competition_id = self.kwargs.get('competition_id', None)
         phase_id = self.kwargs.get('phase_id', None)
@@ -626,7 +693,28 @@ class LeaderBoardDataViewSet(views.APIView):
         phase = webmodels.CompetitionPhase.objects.filter(competition=competition, phasenumber=phase_id)[0]
         if phase.is_blind:
             return Response(status=403)
-        groups = phase.scores()
+
+        (group_key, offset, limit, around) = _leaderboard_window(request.QUERY_PARAMS, self.default_around_limit)
+
+        groups = phase.leaderboard_snapshot()
+        if group_key is not None:
+            # Snapshots taken before groups had a key can still be matched by label
+            groups = [g for g in groups if g.get('key', g['label']) == group_key]
+
+        if around is not None or offset > 0 or limit is not None:
+            for group in groups:
+                scores = group['scores']
+                start = offset
+                if around is not None:
+                    for index, (rank, score) in enumerate(scores):
+                        if score['id'] == around:
+                            start = max(0, index - limit // 2)
+                            break
+                end = start + limit if limit is not None else len(scores)
+                group['total'] = len(scores)
+                group['offset'] = start
+                group['scores'] = scores[start:end]
+
         response = Response(groups, status=status.HTTP_200_OK)
         return response
 
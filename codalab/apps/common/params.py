@@ -0,0 +1,24 @@
+'''
+This file contains utilities to parse request parameters
+'''
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def parse_bool(value, default=None):
+    '''
+    Function to parse a boolean query string or form parameter.
+
+    :param value: Value of the parameter, None when it is missing.
+    :param default: Value returned when the parameter is missing or not recognized.
+    :rtype: bool
+    '''
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return default
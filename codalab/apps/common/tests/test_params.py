@@ -0,0 +1,18 @@
+from django.test import TestCase
+
+from apps.common.params import parse_bool
+
+
+class ParseBoolTests(TestCase):
+
+    def test_recognized_values(self):
+        for value in ('1', 'true', 'Yes', ' on '):
+            self.assertIs(parse_bool(value), True)
+        for value in ('0', 'False', 'no', 'off'):
+            self.assertIs(parse_bool(value), False)
+
+    def test_missing_or_unknown_values_give_the_default(self):
+        self.assertIsNone(parse_bool(None))
+        self.assertIsNone(parse_bool('maybe'))
+        self.assertIs(parse_bool(None, False), False)
+        self.assertIs(parse_bool('', False), False)
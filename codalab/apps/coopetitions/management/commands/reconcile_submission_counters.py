@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from apps.coopetitions.models import reconcile_submission_counters
+from apps.web.models import CompetitionSubmission
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = "Recounts the likes, dislikes and downloads of submissions and fixes the counters which drifted."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--competition',
+                    dest='competition',
+                    type='int',
+                    default=None,
+                    help="Only reconcile the submissions of this competition."),
+        make_option('--dry-run',
+                    dest='dry_run',
+                    action='store_true',
+                    default=False,
+                    help="Only report the counters which drifted."),
+    )
+
+    def handle(self, *args, **options):
+        submissions = CompetitionSubmission.objects.all()
+        if options['competition']:
+            submissions = submissions.filter(phase__competition_id=options['competition'])
+
+        drifted = reconcile_submission_counters(submissions, dry_run=options['dry_run'])
+        for (pk, changes) in sorted(drifted.items()):
+            for (field, (stored, value)) in sorted(changes.items()):
+                self.stdout.write("Submission %s: %s %s -> %s" % (pk, field, stored, value))
+        self.stdout.write("%s submission(s) %s." % (len(drifted), "drifted" if options['dry_run'] else "fixed"))
@@ -1,7 +1,41 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F
 
 
-class Like(models.Model):
+class SubmissionCountedRecord(models.Model):
+    """
+    Base model of the records counted on their submission.
+
+    The counter of the submission, named by counter_field, is incremented and decremented with
+    an UPDATE in the transaction creating or deleting the record, so concurrent records never
+    rewrite the submission. Records deleted in bulk are not counted down, see
+    reconcile_submission_counters.
+    """
+    counter_field = None
+
+    class Meta:
+        abstract = True
+
+    def _count(self, delta):
+        submission_model = self._meta.get_field('submission').rel.to
+        submission_model.objects.filter(pk=self.submission_id).update(**{
+            self.counter_field: F(self.counter_field) + delta
+        })
+
+    def save(self, **kwargs):
+        adding = self._state.adding
+        with transaction.commit_on_success():
+            super(SubmissionCountedRecord, self).save(**kwargs)
+            if adding:
+                self._count(1)
+
+    def delete(self, **kwargs):
+        with transaction.commit_on_success():
+            super(SubmissionCountedRecord, self).delete(**kwargs)
+            self._count(-1)
+
+
+class Like(SubmissionCountedRecord):
     """
     Base model to allow user to like a submission.
     """
@@ -13,11 +47,13 @@ class Like(models.Model):
     user = models.ForeignKey('authenz.ClUser')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    counter_field = 'like_count'
+
     def __str__(self):
         return "%s liked %s" % (self.user, self.submission)
 
 
-class Dislike(models.Model):
+class Dislike(SubmissionCountedRecord):
     """
     Base model to allow authenticated user to dislike a submission
     """
@@ -29,11 +65,13 @@ class Dislike(models.Model):
     user = models.ForeignKey('authenz.ClUser')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    counter_field = 'dislike_count'
+
     def __str__(self):
         return "%s disliked %s" % (self.user, self.submission)
 
 
-class DownloadRecord(models.Model):
+class DownloadRecord(SubmissionCountedRecord):
     """
     Base model to keep track of the amount of times a submission has been downloaded.
     """
@@ -45,10 +83,42 @@ class DownloadRecord(models.Model):
     user = models.ForeignKey('authenz.ClUser')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    counter_field = 'download_count'
+
     def __str__(self):
         return "%s downloaded %s" % (self.user, self.submission)
 
-    def save(self, **kwargs):
-        super(DownloadRecord, self).save(**kwargs)
-        self.submission.download_count = self.submission.downloads.all().count()
-        self.submission.save()
+
+def reconcile_submission_counters(submissions, dry_run=False):
+    """
+    Recounts the likes, dislikes and downloads of the given submissions and fixes the counters
+    which drifted, e.g. after bulk deletions.
+
+    :param submissions: QuerySet of CompetitionSubmission.
+    :param dry_run: When set the counters are only compared.
+    :return: Dict of submission id to {counter field: (stored value, actual value)} of the
+             counters which differ.
+    """
+    actual = {}
+    for model in (Like, Dislike, DownloadRecord):
+        rows = model.objects.filter(submission__in=submissions).order_by().values('submission').annotate(
+            count=Count('pk')
+        )
+        for row in rows:
+            actual[(row['submission'], model.counter_field)] = row['count']
+
+    fields = [model.counter_field for model in (Like, Dislike, DownloadRecord)]
+    drifted = {}
+    for row in submissions.order_by().values('pk', *fields):
+        changes = dict((field, (row[field], actual.get((row['pk'], field), 0))) for field in fields
+                       if row[field] != actual.get((row['pk'], field), 0))
+        if changes:
+            drifted[row['pk']] = changes
+
+    if not dry_run:
+        for (pk, changes) in drifted.items():
+            # Relative updates, so records changed since they were counted are not lost
+            submissions.model.objects.filter(pk=pk).update(**dict(
+                (field, F(field) + (value - stored)) for (field, (stored, value)) in changes.items()
+            ))
+    return drifted
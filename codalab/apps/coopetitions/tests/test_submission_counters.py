@@ -0,0 +1,70 @@
+import StringIO
+
+import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import CompetitionSubmission
+from apps.coopetitions.models import Like, Dislike, DownloadRecord, reconcile_submission_counters
+
+
+class SubmissionCountersTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=3, submissions=1)
+        self.submission = self.synthetic.phase.submissions.order_by('pk')[0]
+        self.users = [participant.user for participant in self.synthetic.competition.participants.all()]
+
+    def _counts(self):
+        return CompetitionSubmission.objects.filter(pk=self.submission.pk).values_list(
+            'like_count', 'dislike_count', 'download_count'
+        )[0]
+
+    def test_records_update_counters_without_saving_the_submission(self):
+        with mock.patch.object(CompetitionSubmission, 'save') as save:
+            like = Like.objects.create(submission=self.submission, user=self.users[0])
+            Like.objects.create(submission=self.submission, user=self.users[1])
+            Dislike.objects.create(submission=self.submission, user=self.users[2])
+            DownloadRecord.objects.create(submission=self.submission, user=self.users[0])
+            self.assertEquals(self._counts(), (2, 1, 1))
+
+            like.delete()
+            self.assertEquals(self._counts(), (1, 1, 1))
+
+            # Saving a record again does not count it twice
+            DownloadRecord.objects.get(submission=self.submission).save()
+            self.assertEquals(self._counts(), (1, 1, 1))
+            self.assertFalse(save.called)
+
+    def test_saving_a_stale_submission_keeps_the_counters(self):
+        stale = CompetitionSubmission.objects.get(pk=self.submission.pk)
+        Like.objects.create(submission=self.submission, user=self.users[0])
+        stale.description = "Updated"
+        stale.save()
+        self.assertEquals(self._counts(), (1, 0, 0))
+        self.assertEquals(CompetitionSubmission.objects.get(pk=self.submission.pk).description, "Updated")
+
+    def test_reconcile_fixes_drifted_counters(self):
+        Like.objects.create(submission=self.submission, user=self.users[0])
+        Like.objects.create(submission=self.submission, user=self.users[1])
+        # Bulk deletions do not count the records down
+        Like.objects.filter(user=self.users[0]).delete()
+        self.assertEquals(self._counts(), (2, 0, 0))
+
+        submissions = CompetitionSubmission.objects.filter(phase=self.synthetic.phase)
+        expected = {self.submission.pk: {'like_count': (2, 1)}}
+        self.assertEquals(reconcile_submission_counters(submissions, dry_run=True), expected)
+        self.assertEquals(self._counts(), (2, 0, 0))
+
+        self.assertEquals(reconcile_submission_counters(submissions), expected)
+        self.assertEquals(self._counts(), (1, 0, 0))
+        self.assertEquals(reconcile_submission_counters(submissions), {})
+
+    def test_reconcile_command(self):
+        CompetitionSubmission.objects.filter(pk=self.submission.pk).update(download_count=3)
+        out = StringIO.StringIO()
+        call_command('reconcile_submission_counters', competition=self.synthetic.competition.pk, stdout=out)
+        self.assertIn("Submission %s: download_count 3 -> 0" % self.submission.pk, out.getvalue())
+        self.assertEquals(self._counts(), (0, 0, 0))
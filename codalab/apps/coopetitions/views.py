@@ -31,8 +31,8 @@ def like(request, submission_pk):
         except Dislike.DoesNotExist:
             pass
 
-    # Force re-calculating of likes/dislikes
-    submission.save()
+    # Likes and dislikes updated the counters of the submission
+    submission = CompetitionSubmission.objects.get(pk=submission.pk)
 
     return HttpResponse(status=200, content=submission.get_overall_like_count())
 
@@ -62,7 +62,7 @@ def dislike(request, submission_pk):
         except Like.DoesNotExist:
             pass
 
-    # Force re-calculating of likes/dislikes
-    submission.save()
+    # Likes and dislikes updated the counters of the submission
+    submission = CompetitionSubmission.objects.get(pk=submission.pk)
 
     return HttpResponse(status=200, content=submission.get_overall_like_count())
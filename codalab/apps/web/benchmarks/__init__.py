@@ -0,0 +1,7 @@
+"""
+Performance benchmarks of the leaderboards.
+
+:mod:`.fixtures` builds synthetic competitions with bulk inserts and :mod:`.runner` times the
+scoring, ranking, CSV export and results views against them. Use the ``benchmark_leaderboards``
+management command to run them.
+"""
@@ -0,0 +1,169 @@
+"""
+Synthetic competitions for the leaderboard benchmarks.
+
+The shape follows the ``random_competitions`` command, but users, participants, submissions,
+scores and leaderboard entries are created with bulk inserts so phases with tens of thousands
+of submissions can be built in seconds.
+"""
+import datetime
+import random
+import uuid
+
+import pytz
+
+from django.contrib.auth import get_user_model
+
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             PhaseLeaderBoardEntry,
+                             SubmissionComputedScore,
+                             SubmissionComputedScoreField,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet,
+                             bump_leaderboard_versions)
+
+User = get_user_model()
+
+
+class SyntheticCompetition(object):
+    """The objects created by :func:`build_competition`."""
+    def __init__(self, competition, phase, organizer, password):
+        self.competition = competition
+        self.phase = phase
+        self.organizer = organizer
+        self.password = password
+        self.submission_count = 0
+        self.score_count = 0
+        self.entry_count = 0
+
+    def delete(self):
+        """Deletes the competition and the users created for it."""
+        prefix = self.organizer.username.rsplit('_', 1)[0]
+        self.competition.delete()
+        User.objects.filter(username__startswith=prefix).delete()
+
+
+def build_competition(participants=100, submissions=2, groups=1, columns=3, column_groups=0, computed=1,
+                      seed=0, password='testing'):
+    """
+    Creates a competition with a single phase and a populated leaderboard.
+
+    :param participants: Number of approved participants.
+    :param submissions: Number of finished submissions per participant; the last one of each
+        participant is put on the leaderboard.
+    :param groups: Number of leaderboards (result groups) of the phase.
+    :param columns: Number of scored columns per leaderboard.
+    :param column_groups: Number of column groups per leaderboard the columns are spread over,
+        0 to keep every column at the top level.
+    :param computed: Number of computed columns (averages of the scored columns) per leaderboard.
+    :param seed: Seed of the random scores.
+    :rtype: SyntheticCompetition
+    """
+    rng = random.Random(seed)
+    prefix = "benchmark_%s" % uuid.uuid4().hex[:8]
+
+    organizer = User.objects.create_user(username="%s_organizer" % prefix,
+                                         email="%s_organizer@test.com" % prefix,
+                                         password=password)
+    competition = Competition.objects.create(title="Benchmark %s" % prefix,
+                                             description="Synthetic competition for the leaderboard benchmarks",
+                                             creator=organizer,
+                                             modified_by=organizer,
+                                             published=True)
+    phase = CompetitionPhase.objects.create(competition=competition,
+                                            phasenumber=1,
+                                            label="Phase 1",
+                                            start_date=datetime.datetime.now(pytz.utc) - datetime.timedelta(days=30),
+                                            max_submissions=submissions)
+    board = PhaseLeaderBoard.objects.create(phase=phase)
+    result = SyntheticCompetition(competition, phase, organizer, password)
+
+    # Leaderboard definition: groups of scored and computed columns
+    scoredefs = []
+    for g in range(1, groups + 1):
+        group = SubmissionResultGroup.objects.create(competition=competition, key="results_%s" % g,
+                                                     label="Results %s" % g, ordering=g)
+        SubmissionResultGroupPhase.objects.create(phase=phase, group=group)
+        parents = [SubmissionScoreSet.objects.create(competition=competition, key="group_%s_%s" % (g, p),
+                                                     label="Group %s" % p, ordering=p)
+                   for p in range(1, column_groups + 1)]
+        group_scoredefs = []
+        for c in range(1, columns + computed + 1):
+            is_computed = c > columns
+            sdef = SubmissionScoreDef.objects.create(competition=competition,
+                                                     key="score_%s_%s" % (g, c),
+                                                     label="Score %s" % c,
+                                                     sorting=rng.choice(['asc', 'desc']),
+                                                     numeric_format="4",
+                                                     show_rank=not is_computed,
+                                                     selection_default=1 if c == 1 else 0,
+                                                     computed=is_computed,
+                                                     ordering=c)
+            SubmissionScoreDefGroup.objects.create(scoredef=sdef, group=group)
+            parent = parents[(c - 1) % len(parents)] if parents else None
+            SubmissionScoreSet.objects.create(competition=competition, parent=parent, key=sdef.key,
+                                              label=sdef.label, scoredef=sdef, ordering=c)
+            if is_computed:
+                computed_score = SubmissionComputedScore.objects.create(scoredef=sdef, operation='Avg')
+                for dependency in group_scoredefs:
+                    SubmissionComputedScoreField.objects.create(computed=computed_score, scoredef=dependency)
+            else:
+                group_scoredefs.append(sdef)
+        scoredefs.extend(group_scoredefs)
+
+    # Participants and their submissions
+    approved = ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+    finished = CompetitionSubmissionStatus.objects.get_or_create(name='finished',
+                                                                 codename=CompetitionSubmissionStatus.FINISHED)[0]
+    User.objects.bulk_create([
+        User(username="%s_participant_%s" % (prefix, i), email="%s_participant_%s@test.com" % (prefix, i))
+        for i in range(participants)
+    ])
+    users = User.objects.filter(username__startswith="%s_participant_" % prefix)
+    CompetitionParticipant.objects.bulk_create([
+        CompetitionParticipant(user=user, competition=competition, status=approved) for user in users
+    ])
+    participant_ids = list(competition.participants.values_list('pk', flat=True))
+
+    CompetitionSubmission.objects.bulk_create([
+        CompetitionSubmission(participant_id=participant_id,
+                              phase=phase,
+                              status=finished,
+                              submission_number=number,
+                              file="competition/%s/%s/submissions/%s/%s/submission.zip" % (
+                                  competition.pk, phase.pk, participant_id, number),
+                              readable_filename="submission_%s.zip" % number)
+        for participant_id in participant_ids
+        for number in range(1, submissions + 1)
+    ])
+    submission_rows = list(phase.submissions.values_list('pk', 'participant_id', 'submission_number'))
+    result.submission_count = len(submission_rows)
+
+    # Scores of every scored column
+    score_batch = []
+    for (pk, participant_id, number) in submission_rows:
+        for sdef in scoredefs:
+            score_batch.append(SubmissionScore(result_id=pk, scoredef=sdef, value=round(rng.random(), 6)))
+    SubmissionScore.objects.bulk_create(score_batch)
+    result.score_count = len(score_batch)
+
+    # The last submission of every participant is on the leaderboard
+    PhaseLeaderBoardEntry.objects.bulk_create([
+        PhaseLeaderBoardEntry(board=board, result_id=pk)
+        for (pk, participant_id, number) in submission_rows
+        if number == submissions
+    ])
+    result.entry_count = board.entries.count()
+
+    # Bulk inserts do not send signals, so invalidate the cached leaderboards explicitly
+    bump_leaderboard_versions(pk=board.pk)
+    return result
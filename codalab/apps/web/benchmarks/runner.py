@@ -0,0 +1,135 @@
+"""
+Times the leaderboard code paths against a synthetic competition.
+
+Every benchmark is run a number of times; the report keeps the best and the mean wall time
+in seconds and the number of queries of the last run, so reports of two commits can be diffed.
+"""
+import gc
+import time
+
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.test.client import Client
+
+from apps.web.exports import csv_lines, leaderboard_rows
+from apps.web.models import SubmissionScore, bump_leaderboard_versions
+from apps.web.ranking import ScoreMatrix
+
+
+class Benchmark(object):
+    """
+    A timed operation.
+
+    :param name: Name of the benchmark in the report.
+    :param func: Callable timed by the benchmark, its return value is ignored.
+    :param setup: Optional callable run, untimed, before every repetition.
+    """
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+    def run(self, repeat=3):
+        timings = []
+        queries = 0
+        old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            for _ in range(repeat):
+                if self.setup is not None:
+                    self.setup()
+                gc.collect()
+                reset_queries()
+                start = time.time()
+                self.func()
+                timings.append(time.time() - start)
+                queries = len(connection.queries)
+        finally:
+            connection.use_debug_cursor = old_debug_cursor
+            reset_queries()
+        return {
+            'best': min(timings),
+            'mean': sum(timings) / len(timings),
+            'queries': queries,
+        }
+
+
+def _consume(response):
+    """Reads a response, streamed or not, so the time of producing the content is measured."""
+    if getattr(response, 'streaming', False):
+        for chunk in response.streaming_content:
+            pass
+    else:
+        response.content
+    return response
+
+
+def leaderboard_benchmarks(synthetic):
+    """
+    Returns the benchmarks of a synthetic competition created by
+    :func:`apps.web.benchmarks.fixtures.build_competition`.
+    """
+    competition = synthetic.competition
+    phase = synthetic.phase
+
+    def invalidate():
+        bump_leaderboard_versions(phase_id=phase.pk)
+
+    def warm():
+        phase.refresh_leaderboard_snapshot()
+        phase.refresh_leaderboard_snapshot(include_scores_not_on_leaderboard=True)
+
+    matrices = []
+
+    def load_scores():
+        qs = SubmissionScore.objects.filter(result__phase=phase, scoredef__computed=False)
+        rows = list(qs.values_list('result_id', 'scoredef_id', 'value'))
+        matrix = ScoreMatrix(set(r[0] for r in rows), set(r[1] for r in rows))
+        for (result_id, scoredef_id, value) in rows:
+            matrix.set(result_id, scoredef_id, value)
+        matrices[:] = [matrix]
+
+    def rank():
+        matrices[0].rank([True] * len(matrices[0].scoredef_ids))
+
+    client = Client()
+    client.login(username=synthetic.organizer.username, password=synthetic.password)
+    results_url = reverse('competitions:competition_results_page',
+                          kwargs={'id': competition.pk, 'phase': phase.pk})
+    complete_results_url = reverse('competitions:competition_results_complete_download',
+                                   kwargs={'id': competition.pk, 'phase': phase.pk})
+    submissions_url = "%s?phase=%s" % (reverse('my_competition_submissions',
+                                               kwargs={'competition_id': competition.pk}), phase.pk)
+    submissions_data_url = "%s?phase=%s" % (reverse('my_competition_submissions_data',
+                                                    kwargs={'competition_id': competition.pk}), phase.pk)
+
+    return [
+        Benchmark('scores', phase.scores, setup=invalidate),
+        Benchmark('scores_all_submissions',
+                  lambda: phase.scores(include_scores_not_on_leaderboard=True), setup=invalidate),
+        Benchmark('scores_cached', phase.scores, setup=phase.scores),
+        Benchmark('ranking', rank, setup=load_scores),
+        Benchmark('snapshot_refresh', phase.refresh_leaderboard_snapshot, setup=invalidate),
+        Benchmark('csv_export', lambda: ''.join(csv_lines(leaderboard_rows(phase.leaderboard_snapshot()))),
+                  setup=warm),
+        Benchmark('results_csv', lambda: competition.get_results_csv(phase.pk), setup=warm),
+        Benchmark('view_results_page', lambda: _consume(client.get(results_url)), setup=warm),
+        Benchmark('view_complete_results_download', lambda: _consume(client.get(complete_results_url)), setup=warm),
+        Benchmark('view_my_competition_submissions', lambda: _consume(client.get(submissions_url)), setup=warm),
+        Benchmark('view_my_competition_submissions_data', lambda: _consume(client.get(submissions_data_url)),
+                  setup=warm),
+    ]
+
+
+def run_benchmarks(benchmarks, repeat=3, names=None):
+    """
+    Runs benchmarks and returns their results keyed by name.
+
+    :param names: Optional list of names of the benchmarks to run, all are run when empty.
+    """
+    results = {}
+    for benchmark in benchmarks:
+        if names and benchmark.name not in names:
+            continue
+        results[benchmark.name] = benchmark.run(repeat)
+    return results
@@ -0,0 +1,209 @@
+"""
+Coopetition bundles given to the scoring programs.
+
+Every scored submission receives a ``coopetition.zip`` describing the submissions, likes, scores
+and downloads of its competition. Only ``current_user.txt`` depends on the submission, so the
+rest is built once per change and shared: it is stored in the bundle storage under a fingerprint
+of the data it was built from, computed with a handful of aggregate queries, and the bundle of
+the submission only holds ``current_user.txt`` and lists the shared bundle under its ``shared``
+key, whose files compute workers extract next to it. A scoring run only builds the shared bundle
+when the data changed since the previous run. Superseded shared bundles are removed by the
+``remove_coopetition_artifacts`` command once they are older than a grace period.
+"""
+import csv
+import datetime
+import hashlib
+import logging
+import StringIO
+import zipfile
+
+from django.core.files.base import ContentFile
+from django.db.models import Count, Max, Sum
+
+from apps.coopetitions.models import DownloadRecord, Dislike, Like
+from apps.web.models import BundleStorage, CompetitionSubmission, CompetitionSubmissionStatus, PhaseLeaderBoard
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_FIELD_NAMES = (
+    "participant__user__username",
+    "pk",
+    "when_made_public",
+    "when_unmade_public",
+    "started_at",
+    "completed_at",
+    "download_count",
+    "submission_number",
+)
+
+
+def artifact_dir(competition):
+    return "competition/%s/coopetition" % competition.pk
+
+
+def artifact_path(competition, fingerprint):
+    return "%s/%s.zip" % (artifact_dir(competition), fingerprint)
+
+
+def _fingerprint(*values):
+    return hashlib.sha1(repr(values)).hexdigest()
+
+
+def phase_fingerprints(competition, phases):
+    """
+    Returns a dict of phase id to the fingerprint of the data of the phase artifact: the
+    leaderboard version and aggregates of the finished submissions, likes and dislikes.
+    """
+    finished = CompetitionSubmission.objects.filter(
+        phase__competition=competition,
+        status__codename=CompetitionSubmissionStatus.FINISHED
+    )
+    versions = dict(PhaseLeaderBoard.objects.filter(phase__competition=competition).values_list('phase_id', 'version'))
+    submissions = dict((row['phase'], row) for row in finished.order_by().values('phase').annotate(
+        count=Count('pk'),
+        last_pk=Max('pk'),
+        last_started_at=Max('started_at'),
+        last_completed_at=Max('completed_at'),
+        last_made_public=Max('when_made_public'),
+        last_unmade_public=Max('when_unmade_public'),
+        downloads=Sum('download_count'),
+    ))
+    feedback = {}
+    for model in (Like, Dislike):
+        rows = model.objects.filter(submission__phase__competition=competition).order_by().values(
+            'submission__phase'
+        ).annotate(count=Count('pk'), last_pk=Max('pk'))
+        for row in rows:
+            feedback.setdefault(row['submission__phase'], []).append((model.__name__, row['count'], row['last_pk']))
+
+    fingerprints = {}
+    for phase in phases:
+        row = submissions.get(phase.pk, {})
+        fingerprints[phase.pk] = _fingerprint(
+            phase.phasenumber,
+            versions.get(phase.pk),
+            sorted(row.items()),
+            sorted(feedback.get(phase.pk, [])),
+        )
+    return fingerprints
+
+
+def downloads_fingerprint(competition):
+    aggregates = DownloadRecord.objects.filter(submission__phase__competition=competition).aggregate(
+        count=Count('pk'),
+        last_pk=Max('pk'),
+    )
+    return _fingerprint(sorted(aggregates.items()))
+
+
+def phase_files(phase):
+    """Returns the (name, content) of the coopetition files of a phase."""
+    annotated_submissions = phase.submissions.filter(status__codename=CompetitionSubmissionStatus.FINISHED).values(
+        *SUBMISSION_FIELD_NAMES
+    ).annotate(like_count=Count("likes"), dislike_count=Count("dislikes"))
+
+    coopetition_csv = StringIO.StringIO()
+    writer = csv.DictWriter(coopetition_csv, SUBMISSION_FIELD_NAMES + ("like_count", "dislike_count"))
+    writer.writeheader()
+    for row in annotated_submissions:
+        writer.writerow(row)
+
+    return [
+        ('coopetition_phase_%s.txt' % phase.phasenumber, coopetition_csv.getvalue().encode('utf-8')),
+        ('coopetition_scores_phase_%s.txt' % phase.phasenumber,
+         phase.competition.get_results_csv(phase.pk, include_scores_not_on_leaderboard=True)),
+    ]
+
+
+def downloads_files(competition):
+    """Returns the (name, content) of the coopetition downloads file of a competition."""
+    coopetition_downloads_csv = StringIO.StringIO()
+    writer = csv.writer(coopetition_downloads_csv)
+    writer.writerow((
+        "submission_pk",
+        "submission_owner",
+        "downloaded_by",
+        "time_of_download",
+    ))
+    records = DownloadRecord.objects.filter(submission__phase__competition=competition).values_list(
+        'submission_id', 'submission__participant__user__username', 'user__username', 'timestamp'
+    ).order_by('pk')
+    for (submission_pk, owner, downloaded_by, timestamp) in records:
+        writer.writerow((submission_pk, owner, downloaded_by, str(timestamp)))
+    return [('coopetition_downloads.txt', coopetition_downloads_csv.getvalue().encode('utf-8'))]
+
+
+def competition_files(competition, phases):
+    """Returns the (name, content) of the coopetition files of a competition."""
+    files = []
+    for phase in phases:
+        files.extend(phase_files(phase))
+    files.extend(downloads_files(competition))
+    return files
+
+
+def current_artifact_path(competition, phases=None):
+    """Returns the name of the shared coopetition bundle of the current data of a competition."""
+    if phases is None:
+        phases = list(competition.phases.all())
+    fingerprints = phase_fingerprints(competition, phases)
+    return artifact_path(competition, _fingerprint(
+        sorted(fingerprints.items()),
+        downloads_fingerprint(competition),
+    ))
+
+
+def shared_artifact(competition):
+    """
+    Returns the name in the bundle storage of the shared coopetition bundle of a competition,
+    building and storing it first when its data changed.
+    """
+    phases = list(competition.phases.all())
+    path = current_artifact_path(competition, phases)
+    if BundleStorage.exists(path):
+        return path
+
+    logger.debug("Building coopetition artifact %s", path)
+    buf = StringIO.StringIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for (name, content) in competition_files(competition, phases):
+            z.writestr(name, content)
+    return BundleStorage.save(path, ContentFile(buf.getvalue()))
+
+
+def coopetition_zip(submission):
+    """Returns the content of the coopetition bundle of a submission."""
+    buf = StringIO.StringIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr('current_user.txt', submission.participant.user.username.encode('utf-8'))
+        z.writestr('metadata', ("shared: %s\n" % shared_artifact(submission.phase.competition)).encode('utf-8'))
+    return buf.getvalue()
+
+
+def remove_superseded_artifacts(competition, grace_period):
+    """
+    Removes the shared coopetition bundles of a competition built from outdated data. Bundles
+    are kept for the grace period after they were stored, since the scoring runs staged
+    meanwhile may still have to download them.
+
+    :param grace_period: A ``datetime.timedelta``.
+    :return: The names of the bundles removed.
+    """
+    directory = artifact_dir(competition)
+    try:
+        (_, names) = BundleStorage.listdir(directory)
+    except OSError:
+        # The directories of the local storage only exist once a bundle is stored
+        return []
+    if not names:
+        return []
+    current = current_artifact_path(competition)
+    limit = datetime.datetime.now() - grace_period
+    removed = []
+    for name in names:
+        name = "%s/%s" % (directory, name)
+        if name != current and BundleStorage.modified_time(name) < limit:
+            logger.debug("Removing superseded coopetition artifact %s", name)
+            BundleStorage.delete(name)
+            removed.append(name)
+    return removed
@@ -0,0 +1,120 @@
+"""
+Reuse of the evaluation of identical submissions.
+
+A submission whose file, phase bundles and scoring configuration are the same as the ones of a
+submission which already finished gets the results of that submission instead of being run
+again: re-runs, migrations to a phase with the same scoring program and duplicate uploads are
+then finished without queueing compute.
+
+Evaluations are identified by a key digesting the content of the bundles involved, stored on
+the submission when it is dispatched. Only programs which declare they do not read the history,
+scores or coopetition inputs are reused, since these change with the other submissions of the
+competition (see CompetitionPhase.scoring_program_inputs).
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.web.models import CompetitionSubmission, CompetitionSubmissionStatus
+from apps.web.scores import save_scores
+
+logger = logging.getLogger(__name__)
+
+# Inputs which depend on other submissions, programs reading them are always run
+STATEFUL_INPUTS = ('history', 'scores', 'coopetition')
+
+# Results given to a submission reusing an evaluation, the bundles are shared and not copied
+RESULT_FILE_FIELDS = (
+    'output_file',
+    'private_output_file',
+    'detailed_results_file',
+    'stdout_file',
+    'stderr_file',
+    'prediction_runfile',
+    'prediction_output_file',
+    'prediction_stdout_file',
+    'prediction_stderr_file',
+)
+
+
+def bundle_digest(field_file):
+    """
+    Returns a digest of the content of a bundle, or None when the field has no file.
+
+    The digest comes from the blob properties when the storage provides them: the Content-MD5
+    when the blob has one, the ETag of the blob otherwise. Only storages without blob properties,
+    like the local file system, read the content of the bundle. Bundles are never rewritten under
+    the same name, so digests are cached by name.
+    """
+    if not field_file or not field_file.name:
+        return None
+    key = "bundle_digest:%s" % hashlib.sha1(field_file.name.encode('utf-8')).hexdigest()
+    digest = cache.get(key)
+    if digest is None:
+        if hasattr(field_file.storage, 'properties'):
+            digest = _blob_digest(field_file)
+        else:
+            digest = _content_digest(field_file)
+        cache.set(key, digest, settings.BUNDLE_DIGEST_CACHE_TIMEOUT)
+    return digest
+
+
+def _blob_digest(field_file):
+    """Digest from the blob properties, an ETag only identifies the content of a single blob."""
+    properties = field_file.storage.properties(field_file.name)
+    content_md5 = properties.get('content-md5')
+    if content_md5:
+        return "md5:%s" % content_md5
+    return "etag:%s:%s" % (field_file.name, properties.get('etag', '').strip('"'))
+
+
+def _content_digest(field_file):
+    sha = hashlib.sha1()
+    field_file.open()
+    try:
+        for chunk in field_file.chunks():
+            sha.update(chunk)
+    finally:
+        field_file.close()
+    return "sha1:%s" % sha.hexdigest()
+
+
+def evaluation_key(submission, predict):
+    """
+    Returns the key of the evaluation of a submission, or None when it can not be reused.
+
+    :param predict: True when the submission is a program generating predictions.
+    """
+    phase = submission.phase
+    if set(STATEFUL_INPUTS) & phase.scoring_program_inputs():
+        return None
+    parts = [
+        phase.competition_id,
+        bool(predict),
+        bundle_digest(submission.file),
+        bundle_digest(phase.scoring_program),
+        bundle_digest(phase.reference_data),
+        phase.execution_time_limit,
+    ]
+    if predict:
+        parts.append(bundle_digest(phase.input_data))
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+
+def find_evaluation(submission, key):
+    """Returns the last finished submission evaluated with the given key, or None."""
+    evaluations = CompetitionSubmission.objects.filter(
+        evaluation_key=key,
+        status__codename=CompetitionSubmissionStatus.FINISHED
+    ).exclude(pk=submission.pk).order_by('-pk')[:1]
+    return evaluations[0] if evaluations else None
+
+
+def copy_evaluation(source, submission):
+    """Gives the results of the source submission to the submission, without changing its status."""
+    CompetitionSubmission.objects.filter(pk=submission.pk).update(**dict(
+        (name, getattr(source, name).name or '') for name in RESULT_FILE_FIELDS
+    ))
+    save_scores(submission, source.scores.filter(scoredef__computed=False).values_list('scoredef__key', 'value'))
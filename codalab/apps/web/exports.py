@@ -0,0 +1,130 @@
+"""
+Generator based CSV exports of leaderboards.
+
+Rows are produced one at a time from the leaderboard groups returned by
+:meth:`apps.web.models.CompetitionPhase.leaderboard_snapshot`, so downloads can be handed to a
+``StreamingHttpResponse`` and files written to storage without holding the whole CSV in memory.
+"""
+import csv
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class Echo(object):
+    """File-like object whose write returns the value instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def encode_row(row):
+    return [unicode(value).encode("utf-8") for value in row]
+
+
+def csv_lines(rows):
+    """
+    Formats rows as CSV.
+
+    :param rows: Iterable of rows, each row a list of values.
+    :return: Generator of utf-8 encoded CSV lines.
+    """
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(encode_row(row))
+
+
+def _score_cell(value):
+    if 'rnk' in value:
+        return "%s (%s)" % (value['val'], value['rnk'])
+    return "%s (%s)" % (value['val'], value['hidden_rnk'])
+
+
+def leaderboard_rows(groups):
+    """
+    Rows of the leaderboard download, which is also the scores.txt file given to scoring programs.
+
+    :param groups: Leaderboard groups in the format of :meth:`CompetitionPhase.scores`.
+    """
+    for group in groups:
+        headers = ["User"]
+        sub_headers = [""]
+        # This ordering dict will contain {<header key>: <order of the column>}
+        ordering = {}
+
+        for count, header in enumerate(group['headers']):
+            ordering[header['key']] = count
+            subs = header['subs']
+            if subs:
+                for sub in subs:
+                    headers.append(header['label'])
+                    sub_headers.append(sub['label'])
+            else:
+                headers.append(header['label'])
+        yield ['submission_pk'] + headers
+        if sub_headers != ['']:
+            yield sub_headers
+
+        try:
+            if len(group['scores']) <= 0:
+                yield ["No data available"]
+            else:
+                for pk, scores in group['scores']:
+                    row = [scores['username']] + ([''] * (len(ordering) + 1))
+                    for v in scores['values']:
+                        # Based on the header label insert the score into the proper column
+                        row[ordering[v['name']] + 1] = _score_cell(v)
+                    yield [scores['id']] + row
+        except:
+            yield ["Exception parsing scores!"]
+            logger.error("Error parsing scores of leaderboard group %s" % group['label'])
+
+        yield []
+        yield []
+
+
+def complete_results_rows(groups, submissions, leaderboard_ids):
+    """
+    Rows of the complete results download, listing every finished submission of a phase.
+
+    :param groups: Leaderboard groups of all finished submissions.
+    :param submissions: Dictionary of (submission pk, submission) pairs, fetched in bulk.
+    :param leaderboard_ids: Set with the pks of the submissions on the leaderboard.
+    """
+    for group in groups:
+        yield [group['label']]
+        yield []
+
+        headers = ["User"]
+        sub_headers = [""]
+        for header in group['headers']:
+            subs = header['subs']
+            if subs:
+                for sub in subs:
+                    headers.append(header['label'])
+                    sub_headers.append(sub['label'])
+            else:
+                headers.append(header['label'])
+        headers.extend(['Description', 'Date', 'Filename', 'Is on leaderboard?'])
+        yield headers
+        yield sub_headers
+
+        if len(group['scores']) <= 0:
+            yield ["No data available"]
+        else:
+            for pk, scores in group['scores']:
+                row = [scores['username']]
+                row.extend(_score_cell(v) for v in scores['values'])
+
+                submission = submissions.get(scores['id'])
+                if submission is not None:
+                    # Avoid get_filename(), which saves the submission when readable_filename is unset.
+                    filename = submission.readable_filename or os.path.basename(submission.file.name or '')
+                    row.extend([submission.description, submission.submitted_at, filename])
+                else:
+                    row.extend(['', '', ''])
+                row.append(scores['id'] in leaderboard_ids)
+                yield row
+
+        yield []
+        yield []
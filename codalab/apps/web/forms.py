@@ -56,6 +56,7 @@ class CompetitionPhaseForm(forms.ModelForm):
             'color',
             'is_scoring_only',
             'auto_migration',
+            'include_history',
             'leaderboard_management_mode',
             'input_data_organizer_dataset',
             'reference_data_organizer_dataset',
@@ -0,0 +1,285 @@
+"""
+Server side paging, ordering and filtering of the competition administration tables.
+
+The submissions and participants tables are filled by JSON endpoints which let the database
+order, filter and slice the rows, and only serialize the rows of the requested page, so the cost
+of a request does not depend on the number of submissions or participants of a competition.
+
+Query string parameters understood by every grid:
+
+* ``page``: 1 based page number, out of range pages return the last page.
+* ``per_page``: number of rows per page, capped to :data:`MAX_PER_PAGE`.
+* ``order``: name of a sortable column.
+* ``direction``: ``asc`` or ``desc``.
+* ``q``: text searched in the search fields of the grid.
+"""
+import os
+
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Count, Q
+
+from apps.common.params import parse_bool
+from apps.web import models
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+
+def _datetime(value):
+    return value.isoformat() if value is not None else None
+
+
+class GridColumn(object):
+    """
+    A column of a grid.
+
+    :param name: Key of the column in the serialized rows.
+    :param label: Header of the column.
+    :param order_by: Field the database orders by for this column, None when the column
+        cannot be sorted.
+    :param annotations: Optional annotations the ordering field needs, only added to the
+        query when the grid is ordered by this column.
+    """
+    def __init__(self, name, label, order_by=None, annotations=None):
+        self.name = name
+        self.label = label
+        self.order_by = order_by
+        self.annotations = annotations or {}
+
+    @property
+    def sortable(self):
+        return self.order_by is not None
+
+    def as_dict(self):
+        return {'name': self.name, 'label': self.label, 'sortable': self.sortable}
+
+
+class Grid(object):
+    """
+    A paginated, ordered and filtered table over a queryset.
+
+    Subclasses provide the queryset, the columns, the filters and the serialization of the rows.
+    """
+    default_order = None
+    default_direction = 'asc'
+    search_fields = ()
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_columns(self):
+        raise NotImplementedError()
+
+    def get_queryset(self):
+        raise NotImplementedError()
+
+    def filter_queryset(self, qs):
+        """Applies the text search, subclasses extend it with their own filters."""
+        text = self.params.get('q', '').strip()
+        if text and self.search_fields:
+            condition = Q()
+            for field in self.search_fields:
+                condition |= Q(**{field + '__icontains': text})
+            qs = qs.filter(condition)
+        return qs
+
+    def serialize(self, objects, offset):
+        """Returns the rows of a page of objects; ``offset`` is the index of the first one."""
+        raise NotImplementedError()
+
+    def get_order(self):
+        """Returns the sortable column and the direction requested, or the defaults."""
+        columns = dict((column.name, column) for column in self.get_columns() if column.sortable)
+        column = columns.get(self.params.get('order')) or columns.get(self.default_order)
+        direction = self.params.get('direction')
+        if direction not in ('asc', 'desc'):
+            direction = self.default_direction
+        return column, direction
+
+    def order_queryset(self, qs, column, direction):
+        if column is None:
+            return qs.order_by('pk')
+        if column.annotations:
+            qs = qs.annotate(**column.annotations)
+        prefix = '-' if direction == 'desc' else ''
+        # The primary key breaks ties so rows do not move between pages
+        return qs.order_by(prefix + column.order_by, prefix + 'pk')
+
+    def get_per_page(self):
+        try:
+            per_page = int(self.params.get('per_page', DEFAULT_PER_PAGE))
+        except (TypeError, ValueError):
+            per_page = DEFAULT_PER_PAGE
+        return max(1, min(per_page, MAX_PER_PAGE))
+
+    def data(self):
+        """Returns the requested page of the grid as a JSON serializable dict."""
+        column, direction = self.get_order()
+        qs = self.order_queryset(self.filter_queryset(self.get_queryset()), column, direction)
+        paginator = Paginator(qs, self.get_per_page())
+        try:
+            page = paginator.page(self.params.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        return {
+            'columns': [c.as_dict() for c in self.get_columns()],
+            'order': column.name if column is not None else None,
+            'direction': direction,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'per_page': paginator.per_page,
+            'count': paginator.count,
+            'results': self.serialize(list(page.object_list), page.start_index() - 1 if paginator.count else 0),
+        }
+
+
+class SubmissionGrid(Grid):
+    """
+    Submissions of a phase.
+
+    Filters: ``status`` (status codename), ``user`` (username of the participant) and
+    ``leaderboard`` (whether the submission is on the leaderboard).
+    """
+    default_order = 'submitted_at'
+    search_fields = ('participant__user__username', 'readable_filename', 'description')
+
+    def __init__(self, phase, params):
+        super(SubmissionGrid, self).__init__(params)
+        self.phase = phase
+        self._snapshot = None
+
+    def leaderboard_snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self.phase.leaderboard_snapshot()
+        return self._snapshot
+
+    def get_columns(self):
+        columns = [
+            GridColumn('submitted_at', 'SUBMITTED', 'submitted_at'),
+            GridColumn('submitted_by', 'SUBMITTED BY', 'participant__user__username'),
+            GridColumn('submission_pk', 'SUBMISSION ID', 'pk'),
+            GridColumn('filename', 'FILENAME', 'readable_filename'),
+            GridColumn('status_name', 'STATUS', 'status__name'),
+            GridColumn('is_in_leaderboard', 'LEADERBOARD', 'leaderboard_entries',
+                       annotations={'leaderboard_entries': Count('leaderboard_entry_result')}),
+        ]
+        # Scores are ranked in the leaderboard snapshot, not in the database, so they are not sortable
+        for index, group in enumerate(self.leaderboard_snapshot()):
+            columns.append(GridColumn('score_%s' % index, group['label']))
+        return columns
+
+    def get_queryset(self):
+        return models.CompetitionSubmission.objects.filter(phase=self.phase).select_related(
+            'participant__user', 'status'
+        )
+
+    def filter_queryset(self, qs):
+        qs = super(SubmissionGrid, self).filter_queryset(qs)
+        status = self.params.get('status')
+        if status:
+            qs = qs.filter(status__codename=status)
+        user = self.params.get('user')
+        if user:
+            qs = qs.filter(participant__user__username=user)
+        on_leaderboard = parse_bool(self.params.get('leaderboard'))
+        if on_leaderboard is not None:
+            entries = models.PhaseLeaderBoardEntry.objects.filter(board__phase=self.phase).values('result_id')
+            if on_leaderboard:
+                qs = qs.filter(pk__in=entries)
+            else:
+                qs = qs.exclude(pk__in=entries)
+        return qs
+
+    def serialize(self, submissions, offset):
+        ids = [s.pk for s in submissions]
+        leaderboard_ids = set(models.PhaseLeaderBoardEntry.objects.filter(
+            board__phase=self.phase, result_id__in=ids
+        ).values_list('result_id', flat=True)) if ids else set()
+        leaderboard_rows = {}
+        if leaderboard_ids:
+            leaderboard_rows = models.CompetitionPhase.index_leaderboard_rows(self.leaderboard_snapshot())
+
+        rows = []
+        for position, submission in enumerate(submissions):
+            row = {
+                'position': offset + position + 1,
+                'id': submission.pk,
+                'submission_pk': submission.pk,
+                'number': submission.submission_number,
+                'submitted_by': submission.participant.user.username,
+                'user_pk': submission.participant.user_id,
+                'filename': submission.readable_filename or os.path.basename(submission.file.name or ''),
+                'submitted_at': _datetime(submission.submitted_at),
+                'status': submission.status.codename,
+                'status_name': submission.status.name,
+                'is_in_leaderboard': submission.pk in leaderboard_ids,
+                'is_public': submission.is_public,
+                'is_migrated': submission.is_migrated,
+                'exception_details': submission.exception_details,
+                'description': submission.description,
+                'method_name': submission.method_name,
+                'method_description': submission.method_description,
+                'project_url': submission.project_url,
+                'publication_url': submission.publication_url,
+                'bibtex': submission.bibtex,
+                'team_name': submission.team_name,
+                'organization_or_affiliation': submission.organization_or_affiliation,
+            }
+            if row['is_in_leaderboard']:
+                for index, leaderboard_row in enumerate(leaderboard_rows.get(submission.pk, [])):
+                    if leaderboard_row is not None:
+                        row['score_%s' % index] = leaderboard_row['main_score']
+            rows.append(row)
+        return rows
+
+
+class ParticipantGrid(Grid):
+    """
+    Participants of a competition.
+
+    Filters: ``status`` (participation status codename).
+    """
+    default_order = 'number'
+    search_fields = ('user__username', 'user__email')
+
+    def __init__(self, competition, params):
+        super(ParticipantGrid, self).__init__(params)
+        self.competition = competition
+
+    def get_columns(self):
+        return [
+            GridColumn('number', '#', 'pk'),
+            GridColumn('name', 'NAME', 'user__username'),
+            GridColumn('email', 'EMAIL', 'user__email'),
+            GridColumn('status', 'STATUS', 'status__codename'),
+            GridColumn('entries', 'ENTRIES', 'entry_count', annotations={'entry_count': Count('submissions')}),
+        ]
+
+    def get_queryset(self):
+        return models.CompetitionParticipant.objects.filter(competition=self.competition).select_related(
+            'user', 'status'
+        )
+
+    def filter_queryset(self, qs):
+        qs = super(ParticipantGrid, self).filter_queryset(qs)
+        status = self.params.get('status')
+        if status:
+            qs = qs.filter(status__codename=status)
+        return qs
+
+    def serialize(self, participants, offset):
+        ids = [p.pk for p in participants]
+        entries = dict(models.CompetitionSubmission.objects.filter(participant__in=ids).order_by().values(
+            'participant'
+        ).annotate(count=Count('pk')).values_list('participant', 'count')) if ids else {}
+        return [{
+            'pk': participant.pk,
+            'number': offset + position + 1,
+            'name': participant.user.username,
+            'email': participant.user.email,
+            'user_pk': participant.user_id,
+            'status': participant.status.codename,
+            'entries': entries.get(participant.pk, 0),
+        } for position, participant in enumerate(participants)]
@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.benchmarks.runner import leaderboard_benchmarks, run_benchmarks
+
+from optparse import make_option
+
+import json
+
+
+class Command(BaseCommand):
+    help = "Builds a synthetic competition and times the leaderboard code paths, printing a JSON report."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--participants',
+                    dest='participants',
+                    type='int',
+                    default=100,
+                    help="Number of participants."),
+        make_option('--submissions',
+                    dest='submissions',
+                    type='int',
+                    default=2,
+                    help="Number of submissions per participant."),
+        make_option('--groups',
+                    dest='groups',
+                    type='int',
+                    default=1,
+                    help="Number of leaderboards (score groups) of the phase."),
+        make_option('--columns',
+                    dest='columns',
+                    type='int',
+                    default=3,
+                    help="Number of scored columns per leaderboard."),
+        make_option('--column_groups',
+                    dest='column_groups',
+                    type='int',
+                    default=0,
+                    help="Number of column groups per leaderboard."),
+        make_option('--computed',
+                    dest='computed',
+                    type='int',
+                    default=1,
+                    help="Number of computed columns per leaderboard."),
+        make_option('--seed',
+                    dest='seed',
+                    type='int',
+                    default=0,
+                    help="Seed of the random scores."),
+        make_option('--repeat',
+                    dest='repeat',
+                    type='int',
+                    default=3,
+                    help="Number of runs of every benchmark."),
+        make_option('--only',
+                    dest='only',
+                    default='',
+                    help="Comma separated names of the benchmarks to run, all by default."),
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help="Path of the JSON report, printed when missing."),
+        make_option('--keep',
+                    dest='keep',
+                    action='store_true',
+                    default=False,
+                    help="Keep the synthetic competition instead of deleting it."),
+    )
+
+    def handle(self, *args, **options):
+        parameters = dict((name, options[name]) for name in (
+            'participants', 'submissions', 'groups', 'columns', 'column_groups', 'computed', 'seed', 'repeat'
+        ))
+        synthetic = build_competition(participants=options['participants'],
+                                      submissions=options['submissions'],
+                                      groups=options['groups'],
+                                      columns=options['columns'],
+                                      column_groups=options['column_groups'],
+                                      computed=options['computed'],
+                                      seed=options['seed'])
+        try:
+            names = [name.strip() for name in options['only'].split(',') if name.strip()]
+            results = run_benchmarks(leaderboard_benchmarks(synthetic), repeat=options['repeat'], names=names)
+        finally:
+            if not options['keep']:
+                synthetic.delete()
+
+        report = {
+            'database': connection.vendor,
+            'parameters': parameters,
+            'data': {
+                'submissions': synthetic.submission_count,
+                'scores': synthetic.score_count,
+                'leaderboard_entries': synthetic.entry_count,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
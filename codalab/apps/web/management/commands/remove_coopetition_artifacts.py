@@ -0,0 +1,41 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.web import coopetition
+from apps.web.models import Competition
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = "Removes the shared coopetition bundles built from outdated data once their grace period is over."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--competition',
+                    dest='competition',
+                    type='int',
+                    default=None,
+                    help="Only remove the bundles of this competition."),
+        make_option('--grace-period',
+                    dest='grace_period',
+                    type='int',
+                    default=None,
+                    help="Seconds superseded bundles are kept, defaults to COOPETITION_ARTIFACT_GRACE_PERIOD."),
+    )
+
+    def handle(self, *args, **options):
+        competitions = Competition.objects.all()
+        if options['competition']:
+            competitions = competitions.filter(pk=options['competition'])
+        grace_period = options['grace_period']
+        if grace_period is None:
+            grace_period = settings.COOPETITION_ARTIFACT_GRACE_PERIOD
+
+        count = 0
+        for competition in competitions:
+            for name in coopetition.remove_superseded_artifacts(competition, datetime.timedelta(seconds=grace_period)):
+                self.stdout.write("Removed %s" % name)
+                count += 1
+        self.stdout.write("%s bundle(s) removed." % count)
@@ -1,12 +1,12 @@
 import csv
 import datetime
 import exceptions
+import hashlib
 import io
 import json
 import logging
-import operator
+import numpy
 import os
-import StringIO
 import uuid
 import yaml
 import zipfile
@@ -24,8 +24,8 @@ from django.core.urlresolvers import reverse
 from django.db import IntegrityError
 from django.db import models
 from django.db import transaction
-from django.db.models import Max
-from django.db.models.signals import post_save
+from django.db.models import F, Max
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import now
 
@@ -38,6 +38,9 @@ from django.utils.functional import cached_property
 
 from apps.forums.models import Forum
 from apps.coopetitions.models import DownloadRecord
+from apps.web.exports import csv_lines, leaderboard_rows
+from apps.web.ranking import COMPUTED_OPERATIONS, rank_matrix, RankIndex, ScoreMatrix
+from apps.web.signals import leaderboard_ranks_changed, submission_status_changed
 
 
 User = settings.AUTH_USER_MODEL
@@ -417,60 +420,21 @@ class Competition(models.Model):
         :param include_scores_not_on_leaderboard: Flag to includes scores that are not part of leaderboard.
         :return: csv file.
 
+        """
+        return ''.join(self.iter_results_csv(phase_pk, include_scores_not_on_leaderboard))
+
+    def iter_results_csv(self, phase_pk, include_scores_not_on_leaderboard=False):
+        """
+        Same as :meth:`get_results_csv`, but yields the csv one line at a time.
         """
         phase = self.phases.get(pk=phase_pk)
         if phase.is_blind:
-            return 'Not allowed, phase is blind.'
-
-        groups = phase.scores(include_scores_not_on_leaderboard=include_scores_not_on_leaderboard)
-
-        csvfile = StringIO.StringIO()
-        csvwriter = csv.writer(csvfile)
-
-        for group in groups:
-            #csvwriter.writerow([group['label']])
-            #csvwriter.writerow([])
-
-            headers = ["User"]
-            sub_headers = [""]
-            # This ordering dict will contain {<header key>: <order of the column>}
-            ordering = {}
-
-            for count, header in enumerate(group['headers']):
-                ordering[header['key']] = count
-                subs = header['subs']
-                if subs:
-                    for sub in subs:
-                        headers.append(header['label'])
-                        sub_headers.append(sub['label'])
-                else:
-                    headers.append(header['label'])
-            csvwriter.writerow(['submission_pk',] + headers)
-            if sub_headers != ['']:
-                csvwriter.writerow(sub_headers)
-
-            try:
-                if len(group['scores']) <= 0:
-                    csvwriter.writerow(["No data available"])
-                else:
-                    for pk, scores in group['scores']:
-                        #print pk, scores
-                        row = [scores['username']] + (['']*(len(ordering) + 1))
-                        for v in scores['values']:
-                            if 'rnk' in v:
-                                # Based on the header label insert the score into the proper column
-                                row[ordering[v['name']] + 1] = "%s (%s)" % (v['val'], v['rnk'])
-                            else:
-                                row[ordering[v['name']] + 1] = "%s (%s)" % (v['val'], v['hidden_rnk'])
-                        csvwriter.writerow([scores['id'],] + row)
-            except:
-                csvwriter.writerow(["Exception parsing scores!"])
-                logger.error("Error parsing scores for competition PK=%s" % self.pk)
-
-            csvwriter.writerow([])
-            csvwriter.writerow([])
+            yield 'Not allowed, phase is blind.'
+            return
 
-        return csvfile.getvalue()
+        groups = phase.leaderboard_snapshot(include_scores_not_on_leaderboard=include_scores_not_on_leaderboard)
+        for line in csv_lines(leaderboard_rows(groups)):
+            yield line
 
     def get_score_headers(self):
         """
@@ -673,6 +637,11 @@ class _LeaderboardManagementMode(object):
 
 LeaderboardManagementMode = _LeaderboardManagementMode()
 
+# Inputs a scoring program can consume, see CompetitionPhase.scoring_program_inputs
+SCORING_INPUTS = ('ref', 'res', 'history', 'scores', 'coopetition')
+# Inputs snapshotting the state of the competition at the time the scoring run is staged
+SNAPSHOT_SCORING_INPUTS = ('history', 'scores', 'coopetition')
+
 
 # Competition Phase
 class CompetitionPhase(models.Model):
@@ -704,6 +673,7 @@ class CompetitionPhase(models.Model):
     leaderboard_management_mode = models.CharField(max_length=50, default=LeaderboardManagementMode.DEFAULT, verbose_name="Leaderboard Mode")
     auto_migration = models.BooleanField(default=False)
     is_migrated = models.BooleanField(default=False)
+    include_history = models.BooleanField(default=True, verbose_name="Give the scoring program the outputs of previous submissions")
     execution_time_limit = models.PositiveIntegerField(default=(5 * 60), verbose_name="Execution time limit (in seconds)")
     color = models.CharField(max_length=24, choices=COLOR_CHOICES, blank=True, null=True)
 
@@ -751,49 +721,67 @@ class CompetitionPhase(models.Model):
         """
         return self.leaderboard_management_mode == LeaderboardManagementMode.HIDE_RESULTS
 
+    def scoring_program_inputs(self):
+        """
+        Returns the set of inputs the scoring program consumes, among :data:`SCORING_INPUTS`.
+
+        Programs declare them with an ``inputs`` list in their ``metadata`` file, e.g.
+        ``inputs: [ref, res]``; every input is given to programs which do not declare any. The
+        declaration is cached per scoring program file, so the program is read once. The history
+        is given to programs declaring it, and to the other ones when the phase includes it.
+        """
+        if not self.scoring_program.name:
+            return self._included_inputs(SCORING_INPUTS, False)
+        key = "scoring_program_inputs:%s" % hashlib.sha1(self.scoring_program.name.encode('utf-8')).hexdigest()
+        declaration = cache.get(key)
+        if declaration is None:
+            declaration = {'inputs': list(SCORING_INPUTS), 'declared': False}
+            try:
+                with zipfile.ZipFile(io.BytesIO(self.scoring_program.read())) as program:
+                    metadata = yaml.safe_load(program.read('metadata'))
+                declared = metadata.get('inputs') if isinstance(metadata, dict) else None
+                if isinstance(declared, list):
+                    declaration = {
+                        'inputs': [name for name in SCORING_INPUTS if name in declared or name == 'res'],
+                        'declared': True,
+                    }
+            except Exception:
+                logger.exception("Unable to read the inputs of the scoring program (phase_id=%s)", self.pk)
+            finally:
+                self.scoring_program.close()
+            cache.set(key, declaration, settings.SCORING_PROGRAM_CACHE_TIMEOUT)
+        return self._included_inputs(declaration['inputs'], declaration['declared'])
+
+    def _included_inputs(self, inputs, declared):
+        inputs = set(inputs)
+        if not declared and not self.include_history:
+            inputs.discard('history')
+        return inputs
+
     @staticmethod
     def rank_values(ids, id_value_pairs, sort_ascending=True, eps=1.0e-12):
         """ Given a set of identifiers (ids) and a set of (id, value)-pairs
             computes a ranking based on the value. The ranking is provided
             as a set of (id, rank) pairs for all id in ids.
         """
-        ranks = {}
-        # Only keep pairs for which the key is in the list of ids
-        valid_pairs = {k: v for k, v in id_value_pairs.iteritems() if k in ids}
-        if len(valid_pairs) == 0:
-            return {id: 1 for id in ids}
-        # Sort and compute ranks
-        sorted_pairs = sorted(valid_pairs.iteritems(), key = operator.itemgetter(1), reverse=not sort_ascending)
-        r = 1
-        k, v = sorted_pairs[0]
-        ranks[k] = r
-        for i in range(1, len(sorted_pairs)):
-            k, vnow = sorted_pairs[i]
-            # Increment the rank only when values are different
-            if abs(vnow - v) > eps:
-                r = r + 1
-                v = vnow
-            ranks[k] = r
-        # Fill in ranks for ids which were not seen in the input
-        r = r + 1
-        for id in ids:
-            if id not in ranks:
-                ranks[id] = r
-        return ranks
+        ids = list(ids)
+        column = numpy.array([float(id_value_pairs[id]) if id in id_value_pairs else numpy.nan for id in ids],
+                             dtype=numpy.float64).reshape(len(ids), 1)
+        ranks = rank_matrix(column, [sort_ascending], eps)
+        return dict(zip(ids, ranks[:, 0].tolist()))
+
+    @staticmethod
+    def rank_sort_key(rank):
+        """Returns the sort key of a rank, ranks which are not numbers sort last."""
+        try:
+            return int(rank)
+        except exceptions.ValueError:
+            return 1000000
 
     @staticmethod
     def rank_submissions(ranks_by_id):
         def compare_ranks(a, b):
-            limit = 1000000
-            try:
-                ia = int(ranks_by_id[a])
-            except exceptions.ValueError:
-                ia = limit
-            try:
-                ib = int(ranks_by_id[b])
-            except exceptions.ValueError:
-                ib = limit
-            return ia - ib
+            return CompetitionPhase.rank_sort_key(ranks_by_id[a]) - CompetitionPhase.rank_sort_key(ranks_by_id[b])
         return compare_ranks
 
     @staticmethod
@@ -815,42 +803,72 @@ class CompetitionPhase(models.Model):
         :return: Scores.
         """
 
+        lb, created = PhaseLeaderBoard.objects.get_or_create(phase=self)
+
+        # Results are cached under the version of the leaderboard, which is bumped whenever
+        # something they depend on changes, so stale entries are simply never read again.
+        cache_key = None
+        if not kwargs:
+            cache_key = self.leaderboard_cache_key(lb.version, include_scores_not_on_leaderboard)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        results = self._scores(lb, created, include_scores_not_on_leaderboard, **kwargs)[0]
+        if cache_key is not None:
+            cache.set(cache_key, results, settings.LEADERBOARD_CACHE_TIMEOUT)
+        return results
+
+    def _scores(self, lb, created, include_scores_not_on_leaderboard=False, with_index=False, **kwargs):
+        """
+        Computes the scores returned by :meth:`scores`.
+
+        :param lb: The PhaseLeaderBoard of the phase.
+        :param created: True when the leaderboard was just created, so it has no entries.
+        :param with_index: Flag to also return the rank indexes of the scores, see
+            :meth:`PhaseLeaderBoardSnapshot.update_rows`.
+        :rtype: tuple
+        :return: The scores and their rank indexes, None unless with_index is set.
+        """
         # Get the list of submissions in this leaderboard
         submissions = []
-        result_location = []
-        lb, created = PhaseLeaderBoard.objects.get_or_create(phase=self)
-        if not created:
-            if include_scores_not_on_leaderboard:
-                qs = CompetitionSubmission.objects.filter(
-                    phase=self,
-                    status__codename=CompetitionSubmissionStatus.FINISHED
-                )
-                for submission in qs:
-                    result_location.append(submission.file.name)
-                    submissions.append((submission.pk, submission.participant.user))
-            else:
-                qs = PhaseLeaderBoardEntry.objects.filter(board=lb)
-                for entry in qs:
-                    result_location.append(entry.result.file.name)
 
-                for entry in qs:
-                    submissions.append((entry.result.id, entry.result.participant.user))
+        # The submissions, their participants and users are read in a single joined query, and
+        # the same filter selects their scores further down, so the number of queries does not
+        # depend on the size of the leaderboard.
+        submission_filter = None
+        if include_scores_not_on_leaderboard:
+            submission_filter = {
+                'phase': self,
+                'status__codename': CompetitionSubmissionStatus.FINISHED
+            }
+            qs = CompetitionSubmission.objects.filter(**submission_filter).values_list(
+                'pk', 'file', 'participant__user__pk', 'participant__user__username', 'participant__user__team_name'
+            )
+            submissions = list(qs)
+        elif not created:
+            submission_filter = {'leaderboard_entry_result__board': lb}
+            qs = PhaseLeaderBoardEntry.objects.filter(board=lb).values_list(
+                'result__pk', 'result__file', 'result__participant__user__pk',
+                'result__participant__user__username', 'result__participant__user__team_name'
+            )
+            submissions = list(qs)
 
         results = []
-        for count, g in enumerate(SubmissionResultGroup.objects.filter(phases__in=[self]).order_by('ordering')):
+        for g in SubmissionResultGroup.objects.filter(phases__in=[self]).order_by('ordering'):
             label = g.label
             headers = []
             scores = {}
 
             # add the location of the results on the blob storage to the scores
-            for (pk, user) in submissions:
+            for (pk, file_name, user_pk, username, team_name) in submissions:
                 scores[pk] = {
-                    'username': user.username,
-                    'user_pk': user.pk,
-                    'team_name': user.team_name,
+                    'username': username,
+                    'user_pk': user_pk,
+                    'team_name': team_name,
                     'id': pk,
                     'values': [],
-                    'resultLocation': result_location[count]
+                    'resultLocation': file_name
                 }
 
             scoreDefs = []
@@ -892,60 +910,83 @@ class CompetitionPhase(models.Model):
                 if (selection_key is None) or (scoreDefs[i].selection_default > selection_order):
                     selection_key, selection_order = scoreDefs[i].key, scoreDefs[i].selection_default
 
-            results.append({ 'label': label, 'headers': headers, 'total_span' : column_span, 'selection_key': selection_key,
+            results.append({ 'key': g.key, 'label': label, 'headers': headers, 'total_span' : column_span, 'selection_key': selection_key,
                              'scores': scores, 'scoredefs': scoreDefs })
 
-        if len(submissions) > 0:
-            # Figure out which submission scores we need to read from the database.
-            submission_ids = [id for (id,name) in submissions]
-            # not_computed_scoredefs: map (scoredef.id, scoredef) to keep track of non-computed scoredefs
-            not_computed_scoredefs = {}
-            computed_scoredef_ids = []
-            # computed_deps: maps id of a computed scoredef to a list of ids for scoredefs which are
-            #                input to the computation
-            computed_deps = {}
+        # Figure out which submission scores we need to read from the database.
+        submission_ids = [submission[0] for submission in submissions]
+        # not_computed_scoredefs: map (scoredef.id, scoredef) to keep track of non-computed scoredefs
+        not_computed_scoredefs = {}
+        computed_scoredef_ids = []
+        # computed_deps: maps id of a computed scoredef to a list of ids for scoredefs which are
+        #                input to the computation
+        computed_deps = {}
+        computed_weights = {}
+        for result in results:
+            for sdef in result['scoredefs']:
+                if sdef.computed is True:
+                    computed_scoredef_ids.append(sdef.id)
+                else:
+                    not_computed_scoredefs[sdef.id] = sdef
+        if len(computed_scoredef_ids) > 0 and (len(submissions) > 0 or with_index):
+            computed_ids = SubmissionComputedScore.objects.filter(scoredef_id__in=computed_scoredef_ids).values_list('id')
+            fields = SubmissionComputedScoreField.objects.filter(computed_id__in=computed_ids).select_related('scoredef', 'computed')
+            for field in fields:
+                if not field.scoredef.computed:
+                    not_computed_scoredefs[field.scoredef.id] = field.scoredef
+                if field.computed.scoredef_id not in computed_deps:
+                    computed_deps[field.computed.scoredef_id] = []
+                    computed_weights[field.computed.scoredef_id] = []
+                computed_deps[field.computed.scoredef_id].append(field.scoredef)
+                computed_weights[field.computed.scoredef_id].append(field.weight)
+
+        values = {}
+        index = None
+        if with_index:
+            index = {'groups': [], 'scoredefs': {}}
+            for result in results:
+                index['groups'].append({
+                    'selection': next((sdef.id for sdef in result['scoredefs'] if sdef.key == result['selection_key']), None),
+                    'scoredefs': [(sdef.id, sdef.key, sdef.numeric_format, sdef.show_rank) for sdef in result['scoredefs']],
+                })
+            for (sdef_id, sdef) in not_computed_scoredefs.iteritems():
+                index['scoredefs'][sdef_id] = {'sort_ascending': sdef.sorting == 'asc'}
             for result in results:
                 for sdef in result['scoredefs']:
-                    if sdef.computed is True:
-                        computed_scoredef_ids.append(sdef.id)
-                    else:
-                        not_computed_scoredefs[sdef.id] = sdef
-                if len(computed_scoredef_ids) > 0:
-                    computed_ids = SubmissionComputedScore.objects.filter(scoredef_id__in=computed_scoredef_ids).values_list('id')
-                    fields = SubmissionComputedScoreField.objects.filter(computed_id__in=computed_ids).select_related('scoredef', 'computed')
-                    for field in fields:
-                        if not field.scoredef.computed:
-                            not_computed_scoredefs[field.scoredef.id] = field.scoredef
-                        if field.computed.scoredef_id not in computed_deps:
-                            computed_deps[field.computed.scoredef_id] = []
-                        computed_deps[field.computed.scoredef_id].append(field.scoredef)
-            # Now read the submission scores
-            values = {}
+                    if sdef.computed and len(computed_deps.get(sdef.id, [])) > 0:
+                        index['scoredefs'][sdef.id] = {
+                            'sort_ascending': sdef.sorting == 'asc',
+                            'operation': sdef.computed_score.operation,
+                            'dependencies': [d.id for d in computed_deps[sdef.id]],
+                            'weights': computed_weights[sdef.id],
+                        }
+
+        if len(submissions) > 0:
+            # Now read the submission scores into a submissions x scoredefs matrix
             scoredef_ids = [sdef_id for (sdef_id, sdef) in not_computed_scoredefs.iteritems()]
-            for s in SubmissionScore.objects.filter(scoredef_id__in=scoredef_ids, result_id__in=submission_ids):
-                if s.scoredef_id not in values:
-                    values[s.scoredef_id] = {}
-                values[s.scoredef_id][s.result_id] = s.value
+            score_matrix = ScoreMatrix(submission_ids, scoredef_ids)
+            score_filter = dict(('result__%s' % key, value) for (key, value) in submission_filter.iteritems())
+            qs = SubmissionScore.objects.filter(scoredef_id__in=scoredef_ids, **score_filter).values_list(
+                'result_id', 'scoredef_id', 'value'
+            )
+            for (result_id, scoredef_id, value) in qs:
+                if scoredef_id not in values:
+                    values[scoredef_id] = {}
+                values[scoredef_id][result_id] = value
+                score_matrix.set(result_id, scoredef_id, value)
 
-            # rank values per scoredef.key (not computed)
-            ranks = {}
-            for (sdef_id, v) in values.iteritems():
-                sdef = not_computed_scoredefs[sdef_id]
-                ranks[sdef_id] = self.rank_values(submission_ids, v, sort_ascending=sdef.sorting=='asc')
+            # rank values per scoredef.key (not computed), every column in one pass
+            ranks = score_matrix.rank([not_computed_scoredefs[sdef_id].sorting == 'asc' for sdef_id in scoredef_ids])
 
             # compute values for computed scoredefs
             for result in results:
                 for sdef in result['scoredefs']:
-                    if sdef.computed:
-                        operation = getattr(models, sdef.computed_score.operation)
-                        if (operation.name == 'Avg'):
-                            cnt = len(computed_deps[sdef.id])
-                            if (cnt > 0):
-                                computed_values = {}
-                                for id in submission_ids:
-                                    computed_values[id] = sum([ranks[d.id][id] for d in computed_deps[sdef.id]]) / float(cnt)
-                                values[sdef.id] = computed_values
-                                ranks[sdef.id] = self.rank_values(submission_ids, computed_values, sort_ascending=sdef.sorting=='asc')
+                    if sdef.computed and len(computed_deps.get(sdef.id, [])) > 0:
+                        computed_values = score_matrix.compute(sdef.computed_score.operation,
+                                                               [d.id for d in computed_deps[sdef.id]],
+                                                               computed_weights[sdef.id])
+                        values[sdef.id] = computed_values
+                        ranks[sdef.id] = self.rank_values(submission_ids, computed_values, sort_ascending=sdef.sorting=='asc')
 
             #format values
             for result in results:
@@ -974,7 +1015,117 @@ class CompetitionPhase(models.Model):
                 final_scores = [(overall_ranks[id], scores[id]) for id in ranked_submissions]
                 result['scores'] = final_scores
                 del result['scoredefs']
-        return results
+        else:
+            for result in results:
+                result['scores'] = []
+                del result['scoredefs']
+        if index is not None:
+            for (sdef_id, column) in index['scoredefs'].iteritems():
+                column['index'] = RankIndex.from_values(submission_ids, values.get(sdef_id, {}),
+                                                        sort_ascending=column['sort_ascending']).to_dict()
+        return (results, index)
+
+    @staticmethod
+    def index_leaderboard_rows(groups):
+        """
+        Indexes leaderboard groups, in the format produced by :meth:`scores`, by submission.
+
+        :param groups: Leaderboard groups, e.g. from :meth:`leaderboard_snapshot`.
+        :rtype: dict
+        :return: Maps the id of every submission on the leaderboard to a list with, for each group,
+            None when the submission is not in the group or a dictionary with the 'rank' and 'row'
+            of the submission and the 'main_score' value of the group's selected column.
+        """
+        index = {}
+        for group_index, group in enumerate(groups):
+            for rank, row in group['scores']:
+                main_score = None
+                for value in row['values']:
+                    if value['name'] == group['selection_key']:
+                        main_score = value['val']
+                        break
+                rows = index.setdefault(row['id'], [None] * len(groups))
+                rows[group_index] = {'rank': rank, 'row': row, 'main_score': main_score}
+        return index
+
+    def leaderboard_cache_key(self, version, include_scores_not_on_leaderboard=False):
+        """
+        Returns the cache key of the results of :meth:`scores` for a version of the leaderboard.
+        """
+        return "leaderboard:phase_%s:v%s:%s" % (self.pk, version, 'all' if include_scores_not_on_leaderboard else 'lb')
+
+    def leaderboard_version(self):
+        """
+        Returns the current version of the leaderboard of this phase, see :class:`.PhaseLeaderBoard`.
+        """
+        lb, _ = PhaseLeaderBoard.objects.get_or_create(phase=self)
+        return lb.version
+
+    def leaderboard_snapshot(self, include_scores_not_on_leaderboard=False):
+        """
+        Returns the leaderboard groups of this phase, in the format produced by :meth:`scores`,
+        from the persisted :class:`.PhaseLeaderBoardSnapshot`. Snapshots are only written by the
+        changes to the leaderboard, see :meth:`refresh_leaderboard_snapshot`; when the snapshot is
+        missing or was taken from an older version of the leaderboard, the groups come from
+        :meth:`scores`, which caches them per version, and the snapshot is left as it is.
+
+        :param include_scores_not_on_leaderboard: Flag to read the snapshot of all finished submissions.
+        :rtype: list.
+        """
+        version = self.leaderboard_version()
+        snapshot = PhaseLeaderBoardSnapshot.objects.filter(
+            phase=self,
+            include_scores_not_on_leaderboard=include_scores_not_on_leaderboard,
+            version=version
+        ).values_list('data', flat=True)[:1]
+        if snapshot:
+            return json.loads(snapshot[0])
+        return self.scores(include_scores_not_on_leaderboard=include_scores_not_on_leaderboard)
+
+    def leaderboard_snapshot_is_current(self, include_scores_not_on_leaderboard=False):
+        """
+        Returns True when the persisted leaderboard snapshot of this phase was taken from, or kept
+        up to date by :func:`update_leaderboard_rows` until, the current version of the leaderboard.
+
+        :param include_scores_not_on_leaderboard: Flag to check the snapshot of all finished submissions.
+        """
+        return PhaseLeaderBoardSnapshot.objects.filter(
+            phase=self,
+            include_scores_not_on_leaderboard=include_scores_not_on_leaderboard,
+            version=self.leaderboard_version()
+        ).exists()
+
+    def update_leaderboard_snapshot(self, include_scores_not_on_leaderboard=False):
+        """
+        Rebuilds the persisted leaderboard snapshot of this phase unless it is current. Rebuilding
+        ranks the whole leaderboard, so it is done by the site workers, see
+        :func:`apps.web.tasks.refresh_leaderboard_snapshot`.
+
+        :param include_scores_not_on_leaderboard: Flag to update the snapshot of all finished submissions.
+        """
+        if not self.leaderboard_snapshot_is_current(include_scores_not_on_leaderboard):
+            self.refresh_leaderboard_snapshot(include_scores_not_on_leaderboard)
+
+    def refresh_leaderboard_snapshot(self, include_scores_not_on_leaderboard=False):
+        """
+        Rebuilds the persisted leaderboard snapshot of this phase, and its rank indexes, from the
+        current scores. Afterwards the changes to the rows of single submissions update the
+        snapshot in place, see :func:`update_leaderboard_rows`.
+
+        :param include_scores_not_on_leaderboard: Flag to rebuild the snapshot of all finished submissions.
+        :rtype: :class:`.PhaseLeaderBoardSnapshot`
+        """
+        lb, created = PhaseLeaderBoard.objects.get_or_create(phase=self)
+        (groups, index) = self._scores(lb, created, include_scores_not_on_leaderboard, with_index=True)
+        snapshot, _ = PhaseLeaderBoardSnapshot.objects.get_or_create(
+            phase=self,
+            include_scores_not_on_leaderboard=include_scores_not_on_leaderboard
+        )
+        snapshot.version = lb.version
+        snapshot.data = json.dumps(groups)
+        snapshot.rank_indexes = json.dumps(index)
+        snapshot.save()
+        return snapshot
 
 
 # Competition Participant
@@ -1025,6 +1176,9 @@ class CompetitionSubmissionStatus(models.Model):
     CANCELLED = "cancelled"
     FINISHED = "finished"
 
+    # Statuses a submission never leaves, see transition_submission_status
+    FINAL_STATES = (FINISHED, FAILED, CANCELLED)
+
     name = models.CharField(max_length=20)
     codename = models.SlugField(max_length=20,unique=True)
 
@@ -1032,6 +1186,72 @@ class CompetitionSubmissionStatus(models.Model):
         return self.name
 
 
+class CompetitionSubmissionCounter(models.Model):
+    """
+    Submission counters of a participant in a phase, used to number new submissions and to
+    enforce the submission limits of the phase without aggregating over the submissions.
+
+    Rows are created with the counts of the existing submissions the first time a participant
+    submits to a phase, and then locked and updated with every new submission. Deleting a
+    submission takes it out of the counts, numbers are not reused.
+    """
+    phase = models.ForeignKey(CompetitionPhase, related_name='submission_counters')
+    participant = models.ForeignKey(CompetitionParticipant, related_name='submission_counters')
+    next_number = models.PositiveIntegerField(default=1)
+    failed_count = models.PositiveIntegerField(default=0)
+    day = models.DateField(null=True, blank=True)
+    day_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('phase', 'participant'),)
+
+    def __unicode__(self):
+        return "%s %s %s" % (self.phase_id, self.participant_id, self.next_number)
+
+    @classmethod
+    def reserve_number(cls, phase, participant, check_limits=True, number=None):
+        """
+        Returns the number of a new submission of the participant in the phase and counts it.
+
+        Must run in a transaction, which should also create the submission: the counter row stays
+        locked until it ends, so concurrent submissions are numbered and limited one at a time.
+
+        :param number: The number requested for the submission instead of the next one, it is
+            incremented until no submission of the participant in the phase has it.
+        :raises PermissionDenied: When check_limits is set and a limit of the phase is reached.
+        """
+        today = datetime.date.today()
+        submissions = CompetitionSubmission.objects.filter(phase=phase, participant=participant)
+        cls.objects.get_or_create(phase=phase, participant=participant, defaults={
+            'next_number': (submissions.aggregate(Max('submission_number'))['submission_number__max'] or 0) + 1,
+            'failed_count': submissions.filter(status__codename=CompetitionSubmissionStatus.FAILED).count(),
+            'day': today,
+            'day_count': submissions.filter(submitted_at__gte=today).count(),
+        })
+        counter = cls.objects.select_for_update().get(phase=phase, participant=participant)
+        if counter.day != today:
+            counter.day = today
+            counter.day_count = 0
+
+        if check_limits:
+            offset_submission_count = counter.next_number - counter.failed_count
+            if offset_submission_count > phase.max_submissions:
+                raise PermissionDenied("The maximum number of submissions has been reached.")
+            max_per_day = phase.max_submissions_per_day
+            if counter.day_count + 1 - counter.failed_count > max_per_day or max_per_day == 0:
+                raise PermissionDenied("The maximum number of submissions this day have been reached.")
+
+        if number is None:
+            number = counter.next_number
+        else:
+            while submissions.filter(submission_number=number).exists():
+                number += 1
+        counter.next_number = max(counter.next_number, number + 1)
+        counter.day_count += 1
+        counter.save()
+        return number
+
+
 # Competition Submission
 class CompetitionSubmission(models.Model):
     """Represents a submission from a competition participant."""
@@ -1084,6 +1304,11 @@ class CompetitionSubmission(models.Model):
     dislike_count = models.IntegerField(default=0)
 
     is_migrated = models.BooleanField(default=False) # Will be used to auto  migrate
+    # Identifies the inputs of the evaluation, see apps.web.evaluations
+    evaluation_key = models.CharField(max_length=40, blank=True, default="", db_index=True)
+
+    # Maintained by the records counted on the submission, see apps.coopetitions.models
+    COUNTER_FIELDS = ('like_count', 'dislike_count', 'download_count')
 
     class Meta:
         unique_together = (('submission_number','phase','participant'),)
@@ -1118,9 +1343,6 @@ class CompetitionSubmission(models.Model):
             if self.status.codename == CompetitionSubmissionStatus.FINISHED:
                 self.completed_at = datetime.datetime.utcnow()
 
-        self.like_count = self.likes.all().count()
-        self.dislike_count = self.dislikes.all().count()
-
         if not self.readable_filename:
             if hasattr(self, 'file'):
                 if self.file.name:
@@ -1129,62 +1351,47 @@ class CompetitionSubmission(models.Model):
                     except:
                         self.readable_filename = split(self.file.name)[1]
 
-        # only at save on object creation should it be submitted
-        if not self.pk:
-            if not ignore_submission_limits:
-                print "This is a new submission, getting the submission number."
-                subnum = CompetitionSubmission.objects.filter(phase=self.phase, participant=self.participant).aggregate(Max('submission_number'))['submission_number__max']
-                if subnum is not None:
-                    self.submission_number = subnum + 1
-                else:
-                    self.submission_number = 1
-
-                failed_count = CompetitionSubmission.objects.filter(phase=self.phase,
-                                                                    participant=self.participant,
-                                                                    status__name=CompetitionSubmissionStatus.FAILED).count()
-
-                print "This is submission number %d, and %d submissions have failed" % (self.submission_number, failed_count)
-                offset_submission_count = self.submission_number - failed_count
-
-                if (offset_submission_count > self.phase.max_submissions):
-                    print "Checking to see if the offset_submission_count (%d) is greater than the maximum allowed (%d)" % (offset_submission_count, self.phase.max_submissions)
-                    raise PermissionDenied("The maximum number of submissions has been reached.")
-                else:
-                    print "Submission number below maximum."
-
-                if hasattr(self.phase, 'max_submissions_per_day'):
-                    print 'Checking submissions per day count'
-
-                    submissions_from_today_count = len(CompetitionSubmission.objects.filter(
-                        phase__competition=self.phase.competition,
-                        participant=self.participant,
-                        phase=self.phase,
-                        submitted_at__gte=datetime.date.today()
-                    ))
-
-                    print 'Count is %s and maximum is %s' % (submissions_from_today_count, self.phase.max_submissions_per_day)
-
-                    if submissions_from_today_count + 1 - failed_count > self.phase.max_submissions_per_day or self.phase.max_submissions_per_day == 0:
-                        print 'PERMISSION DENIED'
-                        raise PermissionDenied("The maximum number of submissions this day have been reached.")
-            else:
-                # Make sure we're incrementing the number if we're forcing in a new entry
-                while CompetitionSubmission.objects.filter(
-                    phase=self.phase,
-                    participant=self.participant,
-                    submission_number=self.submission_number
-                ).exists():
-                    self.submission_number += 1
-
-            self.status = CompetitionSubmissionStatus.objects.get_or_create(codename=CompetitionSubmissionStatus.SUBMITTING)[0]
-
         print "Setting the file url base."
         self.file_url_base = self.file.storage.url('')
 
+        # only at save on object creation should it be submitted
+        if not self.pk:
+            # The number is reserved in the transaction creating the submission, so it is not
+            # consumed when the submission can not be saved. Committing would also end the
+            # transaction of a caller, which gets a savepoint instead.
+            if transaction.is_managed():
+                sid = transaction.savepoint()
+                try:
+                    res = self._submit(ignore_submission_limits, *args, **kwargs)
+                except Exception:
+                    transaction.savepoint_rollback(sid)
+                    raise
+                transaction.savepoint_commit(sid)
+                return res
+            with transaction.commit_on_success():
+                return self._submit(ignore_submission_limits, *args, **kwargs)
+
+        if not self._state.adding and not kwargs.get('force_insert') and 'update_fields' not in kwargs:
+            # The counters are only changed by atomic increments, see apps.coopetitions.models,
+            # writing the values loaded with the submission could lose concurrent changes
+            kwargs['update_fields'] = [field.name for field in self._meta.fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+
         print "Calling super save."
         res = super(CompetitionSubmission, self).save(*args,**kwargs)
         return res
 
+    def _submit(self, ignore_submission_limits, *args, **kwargs):
+        """Numbers and inserts a new submission, a number set with ignore_submission_limits is kept."""
+        self.submission_number = CompetitionSubmissionCounter.reserve_number(
+            self.phase,
+            self.participant,
+            check_limits=not ignore_submission_limits,
+            number=self.submission_number if ignore_submission_limits and self.submission_number else None
+        )
+        self.status = CompetitionSubmissionStatus.objects.get_or_create(codename=CompetitionSubmissionStatus.SUBMITTING)[0]
+        return super(CompetitionSubmission, self).save(*args, **kwargs)
+
     def get_filename(self):
         """
         Returns the short name of the file which was uploaded to create the submission.
@@ -1347,6 +1554,32 @@ class CompetitionDefBundle(models.Model):
             dt = utc.localize(dt)
         return dt
 
+    @staticmethod
+    def computed_fields(key, computed):
+        """
+        Returns the (field, weight) pairs of a computed leaderboard column.
+
+        key: Key of the computed column, used in error messages.
+        computed: The 'computed' mapping of the column. Its fields and weights may each be given as a
+            YAML list or as a comma-separated string; weights default to 1.0.
+        """
+        def as_list(value):
+            if isinstance(value, (list, tuple)):
+                return [unicode(v).strip() for v in value]
+            return [v.strip() for v in unicode(value).split(",")]
+
+        fields = as_list(computed['fields'])
+        if 'weights' not in computed:
+            return [(f, 1.0) for f in fields]
+        try:
+            weights = [float(w) for w in as_list(computed['weights'])]
+        except ValueError:
+            raise ValueError("Computed column '%s' has non-numeric weights: %s" % (key, computed['weights']))
+        if len(weights) != len(fields):
+            raise ValueError("Computed column '%s' has %d field(s) but %d weight(s)." %
+                             (key, len(fields), len(weights)))
+        return zip(fields, weights)
+
     @transaction.commit_on_success
     def unpack(self):
         """
@@ -1675,12 +1908,13 @@ class CompetitionDefBundle(models.Model):
                                 computed=is_computed,
                                 defaults=sdefaults)
                     sc, cr = SubmissionComputedScore.objects.get_or_create(scoredef=sd, operation=vals['computed']['operation'])
-                    for f in vals['computed']['fields'].split(","):
-                        f=f.strip()
+                    for f, w in CompetitionDefBundle.computed_fields(key, vals['computed']):
+                        if f not in columns:
+                            raise ValueError("Computed column '%s' references unknown column '%s'." % (key, f))
                         # Note the lookup in brats_score_defs. The assumption is that computed properties are defined in
                         # brats_leaderboard_defs after the fields they reference.
                         # This is not a safe assumption -- given we can't control key/value ordering in a dictionary.
-                        SubmissionComputedScoreField.objects.get_or_create(computed=sc, scoredef=columns[f])
+                        SubmissionComputedScoreField.objects.get_or_create(computed=sc, scoredef=columns[f], defaults={'weight': w})
                     columns[sd.key] = sd
 
                     # Associate the score definition with its column group
@@ -1728,12 +1962,16 @@ class SubmissionScoreDefGroup(models.Model):
 class SubmissionComputedScore(models.Model):
     scoredef = models.OneToOneField(SubmissionScoreDef, related_name='computed_score')
     operation = models.CharField(max_length=10, choices=(('Max', 'Max'),
-                                                        ('Avg', 'Average')))
+                                                        ('Min', 'Min'),
+                                                        ('Avg', 'Average'),
+                                                        ('WAvg', 'Weighted Average'),
+                                                        ('Median', 'Median')))
 
 
 class SubmissionComputedScoreField(models.Model):
     computed = models.ForeignKey(SubmissionComputedScore, related_name='fields')
     scoredef = models.ForeignKey(SubmissionScoreDef)
+    weight = models.FloatField(default=1.0)
 
     def save(self, *args, **kwargs):
         if self.scoredef.computed is True:
@@ -1771,8 +2009,14 @@ class SubmissionScore(models.Model):
 
 
 class PhaseLeaderBoard(models.Model):
+    """
+    Leaderboard of a phase. The version is bumped every time the scores, the score definitions,
+    the entries or the phase itself change; it keys the cached leaderboard results.
+    """
     phase = models.OneToOneField(CompetitionPhase, related_name='board')
     is_open = models.BooleanField(default=True)
+    version = models.PositiveIntegerField(default=1)
+    last_modified = models.DateTimeField(default=now)
 
     def submissions(self):
         return CompetitionSubmission.objects.filter(leaderboard_entry_result__board=self)
@@ -1799,6 +2043,320 @@ class PhaseLeaderBoardEntry(models.Model):
         unique_together = (('board', 'result'),)
 
 
+class PhaseLeaderBoardSnapshot(models.Model):
+    """
+    Persisted copy of the ranked and formatted leaderboard of a phase, so results pages and
+    downloads do not have to recompute :meth:`CompetitionPhase.scores` on every request.
+    """
+    phase = models.ForeignKey(CompetitionPhase, related_name='leaderboard_snapshots')
+    include_scores_not_on_leaderboard = models.BooleanField(default=False)
+    data = models.TextField(default='[]')
+    # Layout of the groups and apps.web.ranking.RankIndex of every column, see update_rows
+    rank_indexes = models.TextField(default='{}')
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('phase', 'include_scores_not_on_leaderboard'),)
+
+    def __unicode__(self):
+        return "%s [%s]" % (self.phase, 'All' if self.include_scores_not_on_leaderboard else 'Leaderboard')
+
+    @property
+    def groups(self):
+        return json.loads(self.data)
+
+    def update_rows(self, submission_id, board_id):
+        """
+        Updates the rows of a submission from its current scores, status and leaderboard entry.
+
+        The change is applied to the rank indexes saved with the snapshot, which report the
+        submissions whose ranks it shifted, and only the cells of those submissions are written:
+        the leaderboard is neither read nor ranked again. Computed columns are evaluated again for
+        the submissions whose ranks they depend on changed.
+
+        :param submission_id: PK of the CompetitionSubmission which changed.
+        :param board_id: PK of the PhaseLeaderBoard of the phase.
+        :rtype: dict
+        :return: None when the snapshot has no rank indexes, otherwise maps the id of every
+            scoredef shown whose ranks changed to a dictionary of (submission id, (old rank, new rank))
+            pairs, where ranks are None for the submission entering or leaving the snapshot.
+        """
+        index = json.loads(self.rank_indexes)
+        if not index:
+            return None
+        groups = json.loads(self.data)
+        scoredefs = dict((int(sdef_id), column) for (sdef_id, column) in index['scoredefs'].iteritems())
+        indexes = dict((sdef_id, RankIndex.from_dict(column['index'])) for (sdef_id, column) in scoredefs.iteritems())
+
+        if self.include_scores_not_on_leaderboard:
+            submission_filter = {'phase_id': self.phase_id, 'status__codename': CompetitionSubmissionStatus.FINISHED}
+        else:
+            submission_filter = {'leaderboard_entry_result__board_id': board_id}
+        rows = list(CompetitionSubmission.objects.filter(pk=submission_id, **submission_filter).values_list(
+            'file', 'participant__user__pk', 'participant__user__username', 'participant__user__team_name'
+        )[:1])
+        values = {}
+        if rows:
+            values = dict(SubmissionScore.objects.filter(
+                result_id=submission_id,
+                scoredef_id__in=[sdef_id for (sdef_id, column) in scoredefs.iteritems() if 'operation' not in column]
+            ).values_list('scoredef_id', 'value'))
+
+        # shifted: maps the id of a scoredef to the submissions whose cell may have changed
+        shifted = {}
+        for (sdef_id, column) in scoredefs.iteritems():
+            if 'operation' in column:
+                continue
+            rank_index = indexes[sdef_id]
+            had_values = rank_index.has_values
+            if rows:
+                shifted[sdef_id] = rank_index.set(submission_id, values.get(sdef_id))
+                shifted[sdef_id].add(submission_id)
+            elif submission_id in rank_index:
+                shifted[sdef_id] = rank_index.remove(submission_id)
+            else:
+                shifted[sdef_id] = set()
+            if rank_index.has_values != had_values:
+                # Columns without any value are shown without ranks
+                shifted[sdef_id] = set(rank_index)
+        computed_values = {}
+        for (sdef_id, column) in scoredefs.iteritems():
+            if 'operation' not in column:
+                continue
+            rank_index = indexes[sdef_id]
+            shifted[sdef_id] = set()
+            if not rows and submission_id in rank_index:
+                shifted[sdef_id].update(rank_index.remove(submission_id))
+            recomputed = set()
+            for dependency in column['dependencies']:
+                recomputed.update(shifted[dependency])
+            recomputed.discard(submission_id)
+            if rows:
+                recomputed.add(submission_id)
+            weights = numpy.asarray(column['weights'], dtype=numpy.float64)
+            computed_values[sdef_id] = {}
+            for id in recomputed:
+                dependency_ranks = numpy.array([[indexes[dependency].rank(id) for dependency in column['dependencies']]],
+                                               dtype=numpy.float64)
+                value = COMPUTED_OPERATIONS[column['operation']](dependency_ranks, weights).tolist()[0]
+                computed_values[sdef_id][id] = value
+                shifted[sdef_id].update(rank_index.set(id, value))
+                shifted[sdef_id].add(id)
+
+        def cell_rank(sdef_id, id):
+            if sdef_id in indexes and ('operation' in scoredefs[sdef_id] or indexes[sdef_id].has_values):
+                return indexes[sdef_id].rank(id)
+            return "-"
+
+        changes = {}
+        for (group, layout) in zip(groups, index['groups']):
+            order = [row['id'] for (rank, row) in group['scores']]
+            entries = dict((row['id'], [rank, row]) for (rank, row) in group['scores'])
+            old_row = None
+            if submission_id in entries:
+                old_row = entries.pop(submission_id)[1]
+            if rows:
+                (file_name, user_pk, username, team_name) = rows[0]
+                cells = []
+                for (sdef_id, key, numeric_format, show_rank) in layout['scoredefs']:
+                    v = "-"
+                    if sdef_id in values:
+                        v = CompetitionPhase.format_value(values[sdef_id], numeric_format)
+                    elif submission_id in computed_values.get(sdef_id, {}):
+                        v = CompetitionPhase.format_value(computed_values[sdef_id][submission_id], numeric_format)
+                    cells.append({'val': v, 'rnk' if show_rank else 'hidden_rnk': "-", 'name': key})
+                if old_row is None:
+                    order.append(submission_id)
+                entries[submission_id] = [None, {
+                    'username': username,
+                    'user_pk': user_pk,
+                    'team_name': team_name,
+                    'id': submission_id,
+                    'values': cells,
+                    'resultLocation': file_name
+                }]
+
+            for (position, (sdef_id, key, numeric_format, show_rank)) in enumerate(layout['scoredefs']):
+                rank_key = 'rnk' if show_rank else 'hidden_rnk'
+                ids = shifted.get(sdef_id, set())
+                if submission_id in entries:
+                    ids = ids | set([submission_id])
+                for id in ids:
+                    if id not in entries:
+                        continue
+                    cell = entries[id][1]['values'][position]
+                    old_rank = cell[rank_key]
+                    if id == submission_id:
+                        old_rank = old_row['values'][position][rank_key] if old_row is not None else None
+                    cell[rank_key] = cell_rank(sdef_id, id)
+                    if id in computed_values.get(sdef_id, {}):
+                        cell['val'] = CompetitionPhase.format_value(computed_values[sdef_id][id], numeric_format)
+                    if cell[rank_key] != old_rank:
+                        changes.setdefault(sdef_id, {})[id] = (old_rank, cell[rank_key])
+                if old_row is not None and submission_id not in entries:
+                    changes.setdefault(sdef_id, {})[submission_id] = (old_row['values'][position][rank_key], None)
+
+            selection = layout['selection']
+            ids = shifted.get(selection, set()) | set([submission_id])
+            for id in ids:
+                if id in entries:
+                    entries[id][0] = cell_rank(selection, id)
+            group['scores'] = sorted((entries[id] for id in order if id in entries),
+                                     key=lambda entry: CompetitionPhase.rank_sort_key(entry[0]))
+
+        for (sdef_id, column) in scoredefs.iteritems():
+            column['index'] = indexes[sdef_id].to_dict()
+        self.data = json.dumps(groups)
+        self.rank_indexes = json.dumps(index)
+        return changes
+
+
+def bump_leaderboard_versions(**filters):
+    """
+    Bumps the version of the leaderboards matching the given filters, which invalidates their
+    cached results. Done with a single UPDATE so concurrent bumps are never lost.
+    """
+    PhaseLeaderBoard.objects.filter(**filters).update(version=F('version') + 1, last_modified=now())
+
+
+def update_leaderboard_rows(submission_id, **filters):
+    """
+    Records a change to the leaderboard rows of a submission, that is to its scores, its status or
+    its leaderboard entry. Bumps the version of the leaderboard, like :func:`bump_leaderboard_versions`,
+    and updates the rows of the submission in the snapshots taken from the previous version, see
+    :meth:`PhaseLeaderBoardSnapshot.update_rows`, which then sends leaderboard_ranks_changed. Snapshots
+    of older versions are left stale, as they miss other changes.
+
+    :param submission_id: PK of the CompetitionSubmission.
+    :param filters: Filters selecting the leaderboard of the submission, by default its phase's.
+    """
+    filters = filters or {'phase__submissions__id': submission_id}
+    boards = list(PhaseLeaderBoard.objects.filter(**filters).values_list('pk', 'phase_id', 'version')[:1])
+    if not boards:
+        return
+    (board_id, phase_id, version) = boards[0]
+    snapshots = list(PhaseLeaderBoardSnapshot.objects.filter(phase_id=phase_id, version=version))
+    bump_leaderboard_versions(pk=board_id)
+    if not snapshots or not PhaseLeaderBoard.objects.filter(pk=board_id, version=version + 1).exists():
+        # Nothing to update, or the leaderboard changed meanwhile and the snapshots are stale
+        return
+
+    for snapshot in snapshots:
+        changes = snapshot.update_rows(submission_id, board_id)
+        if changes is None:
+            continue
+        # Only written when no other change updated the snapshot meanwhile
+        updated = PhaseLeaderBoardSnapshot.objects.filter(pk=snapshot.pk, version=version).update(
+            data=snapshot.data,
+            rank_indexes=snapshot.rank_indexes,
+            version=version + 1,
+            updated_at=now()
+        )
+        if updated and changes:
+            leaderboard_ranks_changed.send(sender=PhaseLeaderBoardSnapshot, phase_id=phase_id,
+                                           include_scores_not_on_leaderboard=snapshot.include_scores_not_on_leaderboard,
+                                           changes=changes)
+
+
+def transition_submission_status(submission_id, status_codename, override_final=False):
+    """
+    Moves a submission to the given status unless it already is in a final one.
+
+    Only the status and its timestamps are written, with a single conditional UPDATE, so the
+    side effects of CompetitionSubmission.save() are skipped and concurrent transitions to a
+    final status can not be overwritten. Sends submission_status_changed on success.
+
+    :param submission_id: PK of the CompetitionSubmission.
+    :param status_codename: Codename of the new status.
+    :param override_final: Also moves submissions in a final status other than the new one, such
+        as finished submissions an organizer marks as failed.
+    :return: True when the status was changed, False when the submission is in a final status.
+    """
+    statuses = dict(CompetitionSubmissionStatus.objects.filter(
+        codename__in=CompetitionSubmissionStatus.FINAL_STATES + (status_codename,)
+    ).values_list('codename', 'pk'))
+    if status_codename not in statuses:
+        raise CompetitionSubmissionStatus.DoesNotExist("Unknown submission status: %s" % status_codename)
+
+    fields = {'status': statuses[status_codename]}
+    if status_codename == CompetitionSubmissionStatus.RUNNING:
+        fields['started_at'] = datetime.datetime.utcnow()
+    if status_codename == CompetitionSubmissionStatus.FINISHED:
+        fields['completed_at'] = datetime.datetime.utcnow()
+    final_status_ids = [pk for (codename, pk) in statuses.items() if codename in CompetitionSubmissionStatus.FINAL_STATES
+                        and (not override_final or codename == status_codename)]
+    updated = CompetitionSubmission.objects.filter(pk=submission_id).exclude(
+        status__in=final_status_ids
+    ).update(**fields)
+
+    if updated and status_codename == CompetitionSubmissionStatus.FAILED:
+        # Failed submissions do not count against the submission limits
+        CompetitionSubmissionCounter.objects.filter(
+            phase__submissions__pk=submission_id,
+            participant__submissions__pk=submission_id
+        ).update(failed_count=F('failed_count') + 1)
+    if updated:
+        submission_status_changed.send(sender=CompetitionSubmission, submission_id=submission_id,
+                                       status=status_codename)
+    return updated > 0
+
+
+def submission_score_changed(sender, instance, **kwargs):
+    update_leaderboard_rows(instance.result_id)
+
+
+def leaderboard_entry_changed(sender, instance, **kwargs):
+    update_leaderboard_rows(instance.result_id, pk=instance.board_id)
+
+
+def score_def_changed(sender, instance, **kwargs):
+    bump_leaderboard_versions(phase__competition_id=instance.competition_id)
+
+
+def competition_phase_changed(sender, instance, **kwargs):
+    bump_leaderboard_versions(phase_id=instance.pk)
+
+
+def submission_status_changed_handler(sender, submission_id, status, **kwargs):
+    # Results list the finished submissions, so entering or leaving a final status changes them
+    if status in CompetitionSubmissionStatus.FINAL_STATES:
+        update_leaderboard_rows(submission_id)
+
+
+def submission_deleting(sender, instance, **kwargs):
+    counters = CompetitionSubmissionCounter.objects.filter(phase_id=instance.phase_id,
+                                                           participant_id=instance.participant_id)
+    # The status is read from the database, transitions do not change the loaded submissions
+    status = CompetitionSubmission.objects.filter(pk=instance.pk).values_list('status__codename', flat=True)
+    if CompetitionSubmissionStatus.FAILED in status:
+        counters.filter(failed_count__gt=0).update(failed_count=F('failed_count') - 1)
+    if instance.submitted_at is not None:
+        counters.filter(day=instance.submitted_at.date(), day_count__gt=0).update(day_count=F('day_count') - 1)
+
+
+def submission_deleted(sender, instance, **kwargs):
+    update_leaderboard_rows(instance.pk, phase_id=instance.phase_id)
+
+
+def competition_phase_deleting(sender, instance, **kwargs):
+    # Dropped first so deleting the submissions of the phase does not update them one at a time
+    PhaseLeaderBoardSnapshot.objects.filter(phase=instance).delete()
+
+
+pre_delete.connect(submission_deleting, sender=CompetitionSubmission)
+post_delete.connect(submission_deleted, sender=CompetitionSubmission)
+pre_delete.connect(competition_phase_deleting, sender=CompetitionPhase)
+submission_status_changed.connect(submission_status_changed_handler, sender=CompetitionSubmission)
+post_save.connect(submission_score_changed, sender=SubmissionScore)
+post_delete.connect(submission_score_changed, sender=SubmissionScore)
+post_save.connect(leaderboard_entry_changed, sender=PhaseLeaderBoardEntry)
+post_delete.connect(leaderboard_entry_changed, sender=PhaseLeaderBoardEntry)
+post_save.connect(score_def_changed, sender=SubmissionScoreDef)
+post_delete.connect(score_def_changed, sender=SubmissionScoreDef)
+post_save.connect(competition_phase_changed, sender=CompetitionPhase)
+
+
 def dataset_data_file(dataset, filename="data.zip"):
     return os.path.join("datasets", str(dataset.pk), str(uuid.uuid4()), filename)
 
@@ -1890,5 +2448,6 @@ def add_submission_to_leaderboard(submission):
     entries = PhaseLeaderBoardEntry.objects.filter(board=lb, result__participant=submission.participant)
     for entry in entries:
         entry.delete()
+    # The entries update the rows of the submissions in the leaderboard snapshot, see update_leaderboard_rows
     lbe, created = PhaseLeaderBoardEntry.objects.get_or_create(board=lb, result=submission)
     return lbe, created
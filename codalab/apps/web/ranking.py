@@ -0,0 +1,310 @@
+"""
+Columnar ranking engine for leaderboards.
+
+All the scores of a phase are loaded into a submissions x scoredefs matrix so every column
+is ranked in a single pass, and computed columns are evaluated as array operations over the
+ranks of the columns they depend on. When the rows of a single submission change,
+:class:`RankIndex` updates the ranks of a column incrementally instead.
+"""
+import bisect
+
+import numpy
+
+
+def _average(ranks, weights):
+    return numpy.mean(ranks, axis=1)
+
+
+def _weighted_average(ranks, weights):
+    return numpy.average(ranks, axis=1, weights=weights)
+
+
+def _maximum(ranks, weights):
+    return numpy.max(ranks, axis=1)
+
+
+def _minimum(ranks, weights):
+    return numpy.min(ranks, axis=1)
+
+
+def _median(ranks, weights):
+    return numpy.median(ranks, axis=1)
+
+
+# Maps the operation of a SubmissionComputedScore to a function of (ranks, weights) where ranks
+# is a submissions x dependencies matrix and weights holds one weight per dependency.
+COMPUTED_OPERATIONS = {
+    'Avg': _average,
+    'WAvg': _weighted_average,
+    'Max': _maximum,
+    'Min': _minimum,
+    'Median': _median,
+}
+
+
+def rank_matrix(values, sort_ascending, eps=1.0e-12):
+    """
+    Ranks every column of a matrix of values at once.
+
+    Ranks start at 1 and only increase when a value differs by more than eps from the value
+    which opened the current rank, which is the tie handling of `CompetitionPhase.rank_values`.
+    Missing values (NaN) all share the rank following the last rank of the column.
+
+    :param values: A float matrix of shape (submissions, columns).
+    :param sort_ascending: One boolean per column, True when smaller values rank first.
+    :param eps: Values closer than eps are considered tied.
+    :rtype: numpy.ndarray
+    :return: An integer matrix of ranks with the same shape as values.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    n, m = values.shape
+    ranks = numpy.ones((n, m), dtype=numpy.int64)
+    if n == 0 or m == 0:
+        return ranks
+
+    ascending = numpy.asarray(sort_ascending, dtype=bool)
+    keys = numpy.where(ascending, values, -values)
+    keys[numpy.isnan(keys)] = numpy.inf
+    order = numpy.argsort(keys, axis=0, kind='mergesort')
+    columns = numpy.arange(m)
+    sorted_keys = keys[order, columns]
+
+    with numpy.errstate(invalid='ignore'):
+        # inf - inf is NaN, so missing values never open a new rank after the first one
+        breaks = numpy.diff(sorted_keys, axis=0) > eps
+
+    # A run of consecutive near-ties can drift further than eps from the value that opened
+    # the rank; those runs are rare and re-walked one value at a time.
+    for j in range(m):
+        column_keys = sorted_keys[:, j]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], breaks[:, j])))
+        ends = numpy.concatenate((starts[1:], [n])) - 1
+        with numpy.errstate(invalid='ignore'):
+            drifting = numpy.flatnonzero(column_keys[ends] - column_keys[starts] > eps)
+        for g in drifting:
+            v = column_keys[starts[g]]
+            for i in range(starts[g] + 1, ends[g] + 1):
+                if column_keys[i] - v > eps:
+                    breaks[i - 1, j] = True
+                    v = column_keys[i]
+
+    sorted_ranks = numpy.ones((n, m), dtype=numpy.int64)
+    sorted_ranks[1:] += numpy.cumsum(breaks, axis=0)
+    ranks[order, columns] = sorted_ranks
+    return ranks
+
+
+class ScoreMatrix(object):
+    """
+    Holds the scores of a set of submissions for a set of (non computed) scoredefs as a dense
+    matrix where missing scores are NaN.
+    """
+    def __init__(self, submission_ids, scoredef_ids):
+        self.submission_ids = list(submission_ids)
+        self.scoredef_ids = list(scoredef_ids)
+        self._rows = {sid: i for i, sid in enumerate(self.submission_ids)}
+        self._columns = {sdef_id: j for j, sdef_id in enumerate(self.scoredef_ids)}
+        self.values = numpy.empty((len(self.submission_ids), len(self.scoredef_ids)), dtype=numpy.float64)
+        self.values.fill(numpy.nan)
+        self.ranks = None
+
+    def set(self, submission_id, scoredef_id, value):
+        """Stores the value of a score; scores of unknown submissions or scoredefs are ignored."""
+        i = self._rows.get(submission_id)
+        j = self._columns.get(scoredef_id)
+        if i is not None and j is not None:
+            self.values[i, j] = float(value)
+
+    def rank(self, sort_ascending, eps=1.0e-12):
+        """
+        Ranks every column of the matrix.
+
+        :param sort_ascending: One boolean per scoredef, in the order of scoredef_ids.
+        :rtype: dict
+        :return: Maps the id of every scoredef with at least one score to a dictionary of
+            (submission id, rank) pairs.
+        """
+        self.ranks = rank_matrix(self.values, sort_ascending, eps)
+        ranks = {}
+        has_values = ~numpy.all(numpy.isnan(self.values), axis=0)
+        for j in numpy.flatnonzero(has_values):
+            ranks[self.scoredef_ids[j]] = dict(zip(self.submission_ids, self.ranks[:, j].tolist()))
+        return ranks
+
+    def compute(self, operation, scoredef_ids, weights=None):
+        """
+        Evaluates a computed column over the ranks of the given scoredefs. :meth:`rank` must
+        have been called first.
+
+        :param operation: One of the keys of COMPUTED_OPERATIONS.
+        :param scoredef_ids: Ids of the scoredefs the computed column depends on.
+        :param weights: Optional weights of the dependencies, used by weighted operations.
+        :rtype: dict
+        :return: Dictionary of (submission id, computed value) pairs.
+        """
+        if operation not in COMPUTED_OPERATIONS:
+            raise ValueError("Unknown computed score operation: %s" % operation)
+        columns = [self._columns[sdef_id] for sdef_id in scoredef_ids]
+        dependencies = self.ranks[:, columns].astype(numpy.float64)
+        if weights is None:
+            weights = [1.0] * len(columns)
+        computed = COMPUTED_OPERATIONS[operation](dependencies, numpy.asarray(weights, dtype=numpy.float64))
+        return dict(zip(self.submission_ids, computed.tolist()))
+
+
+class RankIndex(object):
+    """
+    Ranks of a single column, maintained incrementally as submissions enter, change or leave.
+
+    The distinct values of the column are kept in a sorted array searched with bisect, so the
+    rank of a submission, as well as inserting or removing one, costs O(log n) comparisons (plus
+    moving the tail of the array when a new distinct value is inserted). Ranks follow
+    :func:`rank_matrix`: tied values share a rank, ranks are dense and submissions without a
+    value share the rank following the last one. :meth:`from_values` ties values exactly like
+    :func:`rank_matrix`; afterwards a value closer than eps to a value of the index joins it,
+    rather than the value which opened the run, which only matters for runs of near-ties
+    drifting further than eps.
+    """
+    def __init__(self, sort_ascending=True, eps=1.0e-12):
+        self.sort_ascending = sort_ascending
+        self.eps = eps
+        self._keys = []  # sorted distinct keys
+        self._members = {}  # key -> set of submission ids
+        self._missing = set()  # ids of the submissions without a value
+        self._entries = {}  # submission id -> key, None without a value
+
+    @classmethod
+    def from_values(cls, submission_ids, id_value_pairs, sort_ascending=True, eps=1.0e-12):
+        """
+        Builds the index of a column.
+
+        :param submission_ids: Ids of the submissions ranked.
+        :param id_value_pairs: Dictionary of (submission id, value) pairs, submissions without a
+            value rank last.
+        """
+        index = cls(sort_ascending, eps)
+        submission_ids = list(submission_ids)
+        keys = sorted((index._key(id_value_pairs[id]), id) for id in submission_ids if id in id_value_pairs)
+        for (key, id) in keys:
+            if index._keys and key - index._keys[-1] <= eps:
+                key = index._keys[-1]
+            else:
+                index._keys.append(key)
+                index._members[key] = set()
+            index._members[key].add(id)
+            index._entries[id] = key
+        for id in submission_ids:
+            if id not in index._entries:
+                index._missing.add(id)
+                index._entries[id] = None
+        return index
+
+    @classmethod
+    def from_dict(cls, data):
+        """Loads an index saved with :meth:`to_dict`."""
+        index = cls(data['sort_ascending'], data['eps'])
+        index._keys = data['keys']
+        index._members = dict((key, set()) for key in index._keys)
+        for (id, key) in data['entries']:
+            index._entries[id] = key
+            if key is None:
+                index._missing.add(id)
+            else:
+                index._members[key].add(id)
+        return index
+
+    def to_dict(self):
+        """Returns the index as a dictionary which can be serialized to JSON."""
+        return {
+            'sort_ascending': self.sort_ascending,
+            'eps': self.eps,
+            'keys': self._keys,
+            'entries': self._entries.items(),
+        }
+
+    def _key(self, value):
+        value = float(value)
+        return value if self.sort_ascending else -value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, submission_id):
+        return submission_id in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    @property
+    def has_values(self):
+        return len(self._keys) > 0
+
+    def rank(self, submission_id):
+        """Returns the rank of a submission of the index."""
+        key = self._entries[submission_id]
+        if key is None:
+            return len(self._keys) + 1
+        return bisect.bisect_left(self._keys, key) + 1
+
+    def set(self, submission_id, value):
+        """
+        Inserts a submission or replaces its value.
+
+        :param value: The value of the submission, None when it has none.
+        :rtype: set
+        :return: The ids of the other submissions whose rank may have changed.
+        """
+        shifted = set()
+        if submission_id in self._entries:
+            shifted.update(self._discard(submission_id))
+        shifted.update(self._add(submission_id, value))
+        shifted.discard(submission_id)
+        return shifted
+
+    def remove(self, submission_id):
+        """
+        Removes a submission from the index.
+
+        :rtype: set
+        :return: The ids of the other submissions whose rank may have changed.
+        """
+        return set(self._discard(submission_id))
+
+    def _following(self, position):
+        """Returns the ids of the submissions ranked after the first position distinct values."""
+        ids = []
+        for key in self._keys[position:]:
+            ids.extend(self._members[key])
+        ids.extend(self._missing)
+        return ids
+
+    def _add(self, submission_id, value):
+        if value is None:
+            self._missing.add(submission_id)
+            self._entries[submission_id] = None
+            return []
+        key = self._key(value)
+        position = bisect.bisect_left(self._keys, key - self.eps)
+        if position < len(self._keys) and self._keys[position] - key <= self.eps:
+            # Tied with a value already in the index
+            self._members[self._keys[position]].add(submission_id)
+            self._entries[submission_id] = self._keys[position]
+            return []
+        self._keys.insert(position, key)
+        self._members[key] = set([submission_id])
+        self._entries[submission_id] = key
+        return self._following(position + 1)
+
+    def _discard(self, submission_id):
+        key = self._entries.pop(submission_id)
+        if key is None:
+            self._missing.discard(submission_id)
+            return []
+        members = self._members[key]
+        members.discard(submission_id)
+        if members:
+            return []
+        position = bisect.bisect_left(self._keys, key)
+        del self._members[key]
+        del self._keys[position]
+        return self._following(position)
@@ -0,0 +1,137 @@
+"""
+Ingestion of the scores written by scoring programs.
+
+A scoring program writes its scores to the output bundle in one of the following files, looked
+up in this order:
+
+* ``scores.json``: a JSON object mapping score keys to numbers.
+* ``scores.yaml`` or ``scores.yml``: a YAML mapping of score keys to numbers.
+* ``scores.txt``: one ``key: value`` pair per line.
+
+Scores are read from the zip member in memory, resolved against the score definitions of the
+competition with a single query and written with one bulk insert. Compute workers parse the
+scores file themselves and send the scores with their ``finished`` update, the output bundle
+is only read when they did not.
+"""
+import json
+import logging
+
+import yaml
+
+from apps.web.models import SubmissionScore, SubmissionScoreDef, update_leaderboard_rows
+
+logger = logging.getLogger(__name__)
+
+SCORES_FILE_NAMES = ('scores.json', 'scores.yaml', 'scores.yml', 'scores.txt')
+
+# Compute workers send at most this many scores inline, see codalabtools.compute.worker
+MAX_INLINE_SCORES = 1000
+
+
+def parse_scores(content, name='scores.txt'):
+    """
+    Parses the content of a scores file.
+
+    :param content: Content of the file.
+    :param name: Name of the file, its extension selects the format.
+    :return: List of (key, value) pairs, values are floats.
+    :raises ValueError: When the content is not valid for the format.
+    """
+    if name.endswith('.json'):
+        data = json.loads(content)
+    elif name.endswith('.yaml') or name.endswith('.yml'):
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ValueError("Invalid YAML scores: %s" % e)
+    else:
+        data = []
+        for line in content.split("\n"):
+            if len(line.strip()) > 0:
+                if ':' not in line:
+                    raise ValueError("Invalid score line: %r" % line)
+                data.append(line.split(":", 1))
+    return score_pairs(data)
+
+
+def score_pairs(data):
+    """
+    Validates parsed scores.
+
+    :param data: Mapping of keys to values, or list of (key, value) pairs.
+    :return: List of (key, value) pairs, values are floats.
+    :raises ValueError: When data is not a mapping or a value is not a number.
+    """
+    if isinstance(data, dict):
+        data = data.items()
+    elif not isinstance(data, list):
+        raise ValueError("Scores must be a mapping of keys to values")
+    try:
+        return [(unicode(key).strip(), float(value)) for (key, value) in data]
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid score value: %s" % e)
+
+
+def inline_scores(data):
+    """
+    Validates the scores a compute worker sent with its ``finished`` update.
+
+    :return: List of (key, value) pairs, see :func:`score_pairs`.
+    :raises ValueError: When the scores are invalid or more than :data:`MAX_INLINE_SCORES`.
+    """
+    if not isinstance(data, (dict, list)):
+        raise ValueError("Scores must be a mapping of keys to values")
+    if len(data) > MAX_INLINE_SCORES:
+        raise ValueError("Too many inline scores: %s" % len(data))
+    return score_pairs(data)
+
+
+def read_scores(output_zip):
+    """
+    Reads the scores of an output bundle.
+
+    :param output_zip: ``ZipFile`` of the output bundle.
+    :return: List of (key, value) pairs, see :func:`parse_scores`.
+    :raises KeyError: When the bundle has no scores file.
+    """
+    names = set(output_zip.namelist())
+    for name in SCORES_FILE_NAMES:
+        if name in names:
+            return parse_scores(output_zip.read(name), name)
+    raise KeyError("No scores file in the output bundle, expected one of %s" % ", ".join(SCORES_FILE_NAMES))
+
+
+def save_scores(submission, scores):
+    """
+    Replaces the scores of a submission.
+
+    Keys without a score definition in the competition, and keys of computed scores, are logged
+    and skipped. Existing scores of the given keys are replaced, so a submission can be scored again.
+    The caller runs it in a transaction, see :func:`apps.web.tasks.update_submission_task`.
+
+    :param submission: The ``CompetitionSubmission`` scored.
+    :param scores: Iterable of (key, value) pairs.
+    :return: Number of scores saved.
+    """
+    scoredefs = dict((key, (pk, computed)) for (key, pk, computed) in SubmissionScoreDef.objects.filter(
+        competition_id=submission.phase.competition_id
+    ).values_list('key', 'pk', 'computed'))
+
+    values = {}
+    for (key, value) in scores:
+        if key not in scoredefs:
+            logger.warning("Score %s does not exist (submission_id=%s)", key, submission.id)
+        elif scoredefs[key][1]:
+            logger.warning("Score %s is computed, ignoring its value (submission_id=%s)", key, submission.id)
+        else:
+            values[scoredefs[key][0]] = value
+
+    if values:
+        SubmissionScore.objects.filter(result=submission, scoredef_id__in=values.keys()).delete()
+        SubmissionScore.objects.bulk_create([
+            SubmissionScore(result=submission, scoredef_id=scoredef_id, value=value)
+            for (scoredef_id, value) in values.items()
+        ])
+        # The bulk insert sends no signals, so update the leaderboards explicitly
+        update_leaderboard_rows(submission.id, phase_id=submission.phase_id)
+    return len(values)
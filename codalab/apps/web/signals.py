@@ -0,0 +1,14 @@
+"""
+Signals sent by the 'apps.web' app.
+"""
+from django.dispatch import Signal
+
+# Sent when apps.web.models.transition_submission_status moves a submission to a new status.
+# status is the codename of the new status.
+submission_status_changed = Signal(providing_args=["submission_id", "status"])
+
+# Sent when apps.web.models.update_leaderboard_rows updated a leaderboard snapshot of the phase
+# phase_id. changes maps the id of every scoredef whose ranks changed to a dictionary of
+# (submission id, (old rank, new rank)) pairs, ranks are None for a submission entering or
+# leaving the snapshot.
+leaderboard_ranks_changed = Signal(providing_args=["phase_id", "include_scores_not_on_leaderboard", "changes"])
@@ -1,30 +1,30 @@
 """
 Defines background tasks needed by the web site.
 """
-import csv
 import io
 import json
 import logging
-import StringIO
-import zipfile
+import tempfile
 
 from urllib import pathname2url
 from zipfile import ZipFile
 from django.conf import settings
 from django.contrib.sites.models import get_current_site
+from django.core.files import File
 from django.core.files.base import ContentFile
 from django.core.mail import get_connection, EmailMultiAlternatives, send_mail
 from django.db import transaction
-from django.db.models import Count
 from django.template import Context
 from django.template.loader import render_to_string
 from django.contrib.sites.models import Site
 from apps.jobs.models import (Job,
                               run_job_task,
                               JobTaskResult,
-                              getQueue)
+                              getQueue,
+                              update_job_status_task)
 from apps.web.models import (add_submission_to_leaderboard,
                              Competition,
+                             CompetitionPhase,
                              CompetitionSubmission,
                              CompetitionDefBundle,
                              CompetitionSubmissionStatus,
@@ -36,13 +36,14 @@ from apps.web.models import (add_submission_to_leaderboard,
                              submission_stderr_filename,
                              submission_history_file_name,
                              submission_scores_file_name,
-                             submission_coopetition_file_name,
                              predict_submission_stdout_filename,
                              predict_submission_stderr_filename,
-                             SubmissionScore,
-                             SubmissionScoreDef,
-                             CompetitionSubmissionMetadata)
-from apps.coopetitions.models import DownloadRecord
+                             CompetitionSubmissionMetadata,
+                             SNAPSHOT_SCORING_INPUTS,
+                             transition_submission_status)
+from apps.web import coopetition
+from apps.web import evaluations
+from apps.web import scores
 
 import time
 # import cProfile
@@ -115,36 +116,52 @@ def create_competition(comp_def_id):
 
 # Evaluate submissions in a competition
 
-# CompetitionSubmission states which are final.
-_FINAL_STATES = {
-    CompetitionSubmissionStatus.FINISHED,
-    CompetitionSubmissionStatus.FAILED,
-    CompetitionSubmissionStatus.CANCELLED
-}
-
 def _set_submission_status(submission_id, status_codename):
     """
     Update the status of a submission.
 
     submission_id: PK of CompetitionSubmission object.
     status_codename: New status codename.
+
+    Returns: True if the status changed, False if the submission is in a final state.
+    """
+    if transition_submission_status(submission_id, status_codename):
+        logger.info("Changed submission status to %s (id=%s).", status_codename, submission_id)
+        return True
+    logger.info("Skipping update of submission status: submission is in a final state (status=%s, id=%s).",
+                status_codename, submission_id)
+    return False
+
+def _save_submission_fields(submission, *names):
+    """
+    Writes the given fields of the submission with a single UPDATE.
+
+    A full save would also write the status loaded with the submission, overwriting the changes
+    made meanwhile by _set_submission_status, including final statuses.
+    """
+    CompetitionSubmission.objects.filter(pk=submission.pk).update(
+        **dict((name, getattr(submission, name)) for name in names)
+    )
+
+
+def _name_prediction_outputs(submission):
     """
-    status = CompetitionSubmissionStatus.objects.get(codename=status_codename)
-    with transaction.commit_on_success():
-        submission = CompetitionSubmission.objects.select_for_update().get(pk=submission_id)
-        old_status_codename = submission.status.codename
-        if old_status_codename not in _FINAL_STATES:
-            submission.status = status
-            submission.save()
-            logger.info("Changed submission status from %s to %s (id=%s).",
-                        old_status_codename, status_codename, submission_id)
-        else:
-            logger.info("Skipping update of submission status: invalid transition %s -> %s  (id=%s).",
-                        status_codename, old_status_codename, submission_id)
+    Points the prediction files of the submission to the outputs uploaded by the compute worker.
+
+    Returns: The names of the fields changed, which are not saved.
+    """
+    submission.prediction_output_file.name = pathname2url(submission_prediction_output_filename(submission))
+    submission.prediction_stderr_file.name = pathname2url(predict_submission_stdout_filename(submission))
+    submission.prediction_stdout_file.name = pathname2url(predict_submission_stderr_filename(submission))
+    return ['prediction_output_file', 'prediction_stderr_file', 'prediction_stdout_file']
+
 
 def predict(submission, job_id):
     """
     Dispatches the prediction taks for the given submission to an appropriate compute worker.
+    With COMPUTE_WORKER_FUSED_EXECUTION the worker also scores the predictions, unless the scoring
+    program reads inputs snapshotting the competition (history, scores or coopetition): those are
+    staged when the predictions are made, not when the prediction task is dispatched.
 
     submission: The CompetitionSubmission object.
     job_id: The job ID used to track the progress of the evaluation.
@@ -165,146 +182,104 @@ def predict(submission, job_id):
         lines.append("input: %s" % input_value)
     lines.append("stdout: %s" % submission_stdout_filename(submission))
     lines.append("stderr: %s" % submission_stderr_filename(submission))
-    submission.prediction_runfile.save('run.txt', ContentFile('\n'.join(lines)))
+    submission.prediction_runfile.save('run.txt', ContentFile('\n'.join(lines)), save=False)
     # Create stdout.txt & stderr.txt
     username = submission.participant.user.username
     lines = ["Standard output for submission #{0} by {1}.".format(submission.submission_number, username), ""]
-    submission.stdout_file.save('stdout.txt', ContentFile('\n'.join(lines)))
-    submission.prediction_stdout_file.save('prediction_stdout_file.txt', ContentFile('\n'.join(lines)))
+    submission.stdout_file.save('stdout.txt', ContentFile('\n'.join(lines)), save=False)
+    submission.prediction_stdout_file.save('prediction_stdout_file.txt', ContentFile('\n'.join(lines)), save=False)
     lines = ["Standard error for submission #{0} by {1}.".format(submission.submission_number, username), ""]
-    submission.stderr_file.save('stderr.txt', ContentFile('\n'.join(lines)))
-    submission.prediction_stderr_file.save('prediction_stderr_file.txt', ContentFile('\n'.join(lines)))
+    submission.stderr_file.save('stderr.txt', ContentFile('\n'.join(lines)), save=False)
+    submission.prediction_stderr_file.save('prediction_stderr_file.txt', ContentFile('\n'.join(lines)), save=False)
+    fields = ['prediction_runfile', 'stdout_file', 'prediction_stdout_file', 'stderr_file', 'prediction_stderr_file']
+
+    task_args = {
+        "bundle_id": submission.prediction_runfile.name,
+        "container_name": settings.BUNDLE_AZURE_CONTAINER,
+        "reply_to": settings.SBS_RESPONSE_QUEUE,
+        "execution_time_limit": submission.phase.execution_time_limit,
+        "predict": True,
+    }
+    state = {'predict': job_id}
+    fused = settings.COMPUTE_WORKER_FUSED_EXECUTION and not any(
+        name in SNAPSHOT_SCORING_INPUTS for name in submission.phase.scoring_program_inputs()
+    )
+    if fused:
+        # The worker scores the predictions as soon as they are made, so the scoring run is
+        # generated now, reading the predictions from where the worker uploads them
+        fields += _name_prediction_outputs(submission)
+        fields += _stage_scoring(submission, True)
+        task_args["score_bundle_id"] = submission.runfile.name
+        state['score'] = job_id
 
     # Store workflow state
-    submission.execution_key = json.dumps({'predict' : job_id})
-    submission.save()
+    submission.execution_key = json.dumps(state)
+    _save_submission_fields(submission, 'execution_key', *fields)
     # Submit the request to the computation service
     body = json.dumps({
         "id" : job_id,
         "task_type": "run",
-        "task_args": {
-            "bundle_id": submission.prediction_runfile.name,
-            "container_name": settings.BUNDLE_AZURE_CONTAINER,
-            "reply_to": settings.SBS_RESPONSE_QUEUE,
-            "execution_time_limit": submission.phase.execution_time_limit,
-            "predict": True,
-        }
+        "task_args": task_args,
     })
 
     getQueue(settings.SBS_COMPUTE_QUEUE).send_message(body)
     # Update the submission object
     _set_submission_status(submission.id, CompetitionSubmissionStatus.SUBMITTED)
 
-def score(submission, job_id):
+def _stage_scoring(submission, has_generated_predictions):
     """
-    Dispatches the scoring task for the given submission to an appropriate compute worker.
+    Generates the bundles of the scoring run of the given submission: its inputs, input.txt and run.txt.
 
     submission: The CompetitionSubmission object.
-    job_id: The job ID used to track the progress of the evaluation.
-    """
-    # profile = cProfile.Profile()
-    start = time.time()
-    # profile.enable()
-    # Loads the computation state.
-    state = {}
-    if len(submission.execution_key) > 0:
-        state = json.loads(submission.execution_key)
-    has_generated_predictions = 'predict' in state
-
-    #generate metadata-only bundle describing the history of submissions and phases
-    last_submissions = CompetitionSubmission.objects.filter(
-        participant=submission.participant,
-        status__codename=CompetitionSubmissionStatus.FINISHED
-    ).order_by('-submitted_at')
+    has_generated_predictions: True when the scoring program runs on the predictions of the
+        submission's program rather than on the submission itself.
 
+    Returns: The names of the file fields of the bundles, which are not saved.
+    """
+    fields = ['inputfile', 'runfile']
+    # Scoring programs may declare the inputs they read, the others are neither built nor staged
+    inputs = submission.phase.scoring_program_inputs()
+
+    if 'history' in inputs:
+        #generate metadata-only bundle describing the history of submissions and phases
+        lines = []
+        lines.append("description: history of all previous successful runs output files")
+
+        # History is opt-in per phase (see CompetitionPhase.scoring_program_inputs): every entry
+        # is a private output the compute worker has to stage
+        last_submissions = CompetitionSubmission.objects.filter(
+            participant=submission.participant,
+            status__codename=CompetitionSubmissionStatus.FINISHED
+        ).exclude(pk=submission.pk).select_related('phase__competition', 'participant__user').order_by('-submitted_at')
 
-    lines = []
-    lines.append("description: history of all previous successful runs output files")
-
-    if last_submissions:
         for past_submission in last_submissions:
-            if past_submission.pk != submission.pk:
-                #pad folder numbers for sorting os side, 001, 002, 003,... 010, etc...
-                past_submission_phasenumber = '%03d' % past_submission.phase.phasenumber
-                past_submission_number = '%03d' % past_submission.submission_number
-                lines.append('%s/%s/output/: %s' % (
-                        past_submission_phasenumber,
-                        past_submission_number,
-                        submission_private_output_filename(past_submission),
-                    )
+            #pad folder numbers for sorting os side, 001, 002, 003,... 010, etc...
+            past_submission_phasenumber = '%03d' % past_submission.phase.phasenumber
+            past_submission_number = '%03d' % past_submission.submission_number
+            lines.append('%s/%s/output/: %s' % (
+                    past_submission_phasenumber,
+                    past_submission_number,
+                    submission_private_output_filename(past_submission),
                 )
-    else:
-        pass
-
-    submission.history_file.save('history.txt', ContentFile('\n'.join(lines)))
-
-    score_csv = submission.phase.competition.get_results_csv(submission.phase.pk)
-    submission.scores_file.save('scores.txt', ContentFile(score_csv))
-
-    # Extra submission info
-    coopetition_zip_buffer = StringIO.StringIO()
-    coopetition_zip_file = zipfile.ZipFile(coopetition_zip_buffer, "w")
+            )
 
-    phases_list = submission.phase.competition.phases.all()
+        submission.history_file.save('history.txt', ContentFile('\n'.join(lines)), save=False)
+        fields.append('history_file')
 
-    for phase in phases_list:
-        coopetition_field_names = (
-            "participant__user__username",
-            "pk",
-            "when_made_public",
-            "when_unmade_public",
-            "started_at",
-            "completed_at",
-            "download_count",
-            "submission_number",
-        )
-        annotated_submissions = phase.submissions.filter(status__codename=CompetitionSubmissionStatus.FINISHED).values(
-            *coopetition_field_names
-        ).annotate(like_count=Count("likes"), dislike_count=Count("dislikes"))
-
-        # Add this after fetching annotated count from db
-        coopetition_field_names += ("like_count", "dislike_count")
-
-        coopetition_csv = StringIO.StringIO()
-        writer = csv.DictWriter(coopetition_csv, coopetition_field_names)
-        writer.writeheader()
-        for row in annotated_submissions:
-            writer.writerow(row)
-
-        coopetition_zip_file.writestr('coopetition_phase_%s.txt' % phase.phasenumber, coopetition_csv.getvalue().encode('utf-8'))
-
-    # Scores metadata
-    for phase in phases_list:
-        coopetition_zip_file.writestr(
-            'coopetition_scores_phase_%s.txt' % phase.phasenumber,
-            phase.competition.get_results_csv(phase.pk, include_scores_not_on_leaderboard=True).encode('utf-8')
-        )
+    if 'scores' in inputs:
+        # Spool the leaderboard to a temporary file rather than building it in memory
+        with tempfile.TemporaryFile() as score_csv:
+            score_csv.writelines(submission.phase.competition.iter_results_csv(submission.phase.pk))
+            score_csv.seek(0)
+            submission.scores_file.save('scores.txt', File(score_csv), save=False)
+        fields.append('scores_file')
 
-    # Download metadata
-    coopetition_downloads_csv = StringIO.StringIO()
-    writer = csv.writer(coopetition_downloads_csv)
-    writer.writerow((
-        "submission_pk",
-        "submission_owner",
-        "downloaded_by",
-        "time_of_download",
-    ))
-    for download in DownloadRecord.objects.filter(submission__phase__competition=submission.phase.competition):
-        writer.writerow((
-            download.submission.pk,
-            download.submission.participant.user.username,
-            download.user.username,
-            str(download.timestamp),
-        ))
-
-    coopetition_zip_file.writestr('coopetition_downloads.txt', coopetition_downloads_csv.getvalue().encode('utf-8'))
-
-    # Current user
-    coopetition_zip_file.writestr('current_user.txt', submission.participant.user.username.encode('utf-8'))
-    coopetition_zip_file.close()
-
-    # Save them all
-    submission.coopetition_file.save('coopetition.zip', ContentFile(coopetition_zip_buffer.getvalue()))
+    if 'coopetition' in inputs:
+        # Extra submission info, only current_user.txt is built for this submission, the rest is
+        # shared by the submissions of the competition until its data changes
+        submission.coopetition_file.save('coopetition.zip', ContentFile(coopetition.coopetition_zip(submission)),
+                                         save=False)
+        fields.append('coopetition_file')
 
     # Generate metadata-only bundle describing the inputs. Reference data is an optional
     # dataset provided by the competition organizer. Results are provided by the participant
@@ -312,7 +287,7 @@ def score(submission, job_id):
     # which is run to generate results) ordirectly (participant uploads results directly).
     lines = []
     ref_value = submission.phase.reference_data.name
-    if len(ref_value) > 0:
+    if len(ref_value) > 0 and 'ref' in inputs:
         lines.append("ref: %s" % ref_value)
     res_value = submission.prediction_output_file.name if has_generated_predictions else submission.file.name
     if len(res_value) > 0:
@@ -320,9 +295,12 @@ def score(submission, job_id):
     else:
         raise ValueError("Results are missing.")
 
-    lines.append("history: %s" % submission_history_file_name(submission))
-    lines.append("scores: %s" % submission_scores_file_name(submission))
-    lines.append("coopetition: %s" % submission_coopetition_file_name(submission))
+    if 'history' in inputs:
+        lines.append("history: %s" % submission_history_file_name(submission))
+    if 'scores' in inputs:
+        lines.append("scores: %s" % submission_scores_file_name(submission))
+    if 'coopetition' in inputs:
+        lines.append("coopetition: %s" % submission.coopetition_file.name)
     lines.append("submitted-by: %s" % submission.participant.user.username)
     lines.append("submitted-at: %s" % submission.submitted_at.replace(microsecond=0).isoformat())
     lines.append("competition-submission: %s" % submission.submission_number)
@@ -337,7 +315,7 @@ def score(submission, job_id):
         is_automatic_submission = submissions_this_phase == 1
 
     lines.append("automatic-submission: %s" % is_automatic_submission)
-    submission.inputfile.save('input.txt', ContentFile('\n'.join(lines)))
+    submission.inputfile.save('input.txt', ContentFile('\n'.join(lines)), save=False)
 
 
     # Generate metadata-only bundle describing the computation.
@@ -350,19 +328,41 @@ def score(submission, job_id):
     lines.append("input: %s" % submission.inputfile.name)
     lines.append("stdout: %s" % submission_stdout_filename(submission))
     lines.append("stderr: %s" % submission_stderr_filename(submission))
-    submission.runfile.save('run.txt', ContentFile('\n'.join(lines)))
+    submission.runfile.save('run.txt', ContentFile('\n'.join(lines)), save=False)
 
     # Create stdout.txt & stderr.txt
     if has_generated_predictions == False:
         username = submission.participant.user.username
         lines = ["Standard output for submission #{0} by {1}.".format(submission.submission_number, username), ""]
-        submission.stdout_file.save('stdout.txt', ContentFile('\n'.join(lines)))
+        submission.stdout_file.save('stdout.txt', ContentFile('\n'.join(lines)), save=False)
         lines = ["Standard error for submission #{0} by {1}.".format(submission.submission_number, username), ""]
-        submission.stderr_file.save('stderr.txt', ContentFile('\n'.join(lines)))
+        submission.stderr_file.save('stderr.txt', ContentFile('\n'.join(lines)), save=False)
+        fields += ['stdout_file', 'stderr_file']
+    return fields
+
+
+def score(submission, job_id):
+    """
+    Dispatches the scoring task for the given submission to an appropriate compute worker.
+
+    submission: The CompetitionSubmission object.
+    job_id: The job ID used to track the progress of the evaluation.
+    """
+    # profile = cProfile.Profile()
+    start = time.time()
+    # profile.enable()
+    # Loads the computation state.
+    state = {}
+    if len(submission.execution_key) > 0:
+        state = json.loads(submission.execution_key)
+    has_generated_predictions = 'predict' in state
+
+    fields = _stage_scoring(submission, has_generated_predictions)
+
     # Update workflow state
     state['score'] = job_id
     submission.execution_key = json.dumps(state)
-    submission.save()
+    _save_submission_fields(submission, 'execution_key', *fields)
     # Submit the request to the computation service
     body = json.dumps({
         "id" : job_id,
@@ -388,6 +388,42 @@ def score(submission, job_id):
     # profile.print_stats()
 
 
+def _submission_finished(submission):
+    """
+    Publishes the results of a submission which finished: refreshes the leaderboards and adds it
+    to them when the phase does so automatically, then notifies the participant.
+
+    submission: The CompetitionSubmission object, its scores are saved.
+    """
+    # Automatically submit to the leaderboard?
+    if submission.phase.is_blind:
+        logger.debug("Adding to leaderboard... (submission_id=%s)", submission.id)
+        add_submission_to_leaderboard(submission)
+        logger.debug("Leaderboard updated with latest submission (submission_id=%s)", submission.id)
+
+    if submission.phase.competition.force_submission_to_leaderboard:
+        add_submission_to_leaderboard(submission)
+        logger.debug("Force submission added submission to leaderboard (submission_id=%s)", submission.id)
+
+    # The new scores and entries updated the rows of the submission in the current snapshots,
+    # this runs in a site worker so the stale ones are rebuilt right away
+    submission.phase.update_leaderboard_snapshot(include_scores_not_on_leaderboard=True)
+    if submission.leaderboard_entry_result.exists():
+        submission.phase.update_leaderboard_snapshot()
+
+    if submission.participant.user.email_on_submission_finished_successfully:
+        email = submission.participant.user.email
+        site_url = "https://%s%s" % (Site.objects.get_current().domain, submission.phase.competition.get_absolute_url())
+        send_mail(
+            'Submission has finished successfully!',
+            'Your submission to the competition "%s" has finished successfully! View it here: %s' %
+            (submission.phase.competition.title, site_url),
+            settings.DEFAULT_FROM_EMAIL,
+            [email],
+            fail_silently=False
+        )
+
+
 class SubmissionUpdateException(Exception):
     """Defines an exception that occurs during the update of a CompetitionSubmission object."""
     def __init__(self, submission, inner_exception):
@@ -404,13 +440,17 @@ def update_submission_task(job_id, args):
         args['status']: The evaluation status, which is one of 'running', 'finished' or 'failed'.
     """
 
-    def update_submission(submission, status, job_id, traceback=None, metadata=None):
+    def update_submission(submission, status, job_id, traceback=None, metadata=None, inline_scores=None,
+                          stage=None):
         """
         Updates the status of a submission.
 
         submission: The CompetitionSubmission object to update.
         status: The new status string: 'running', 'finished' or 'failed'.
         job_id: The job ID used to track the progress of the evaluation.
+        inline_scores: The scores parsed by the compute worker, if any. The scores are read
+            from the output bundle when they are missing.
+        stage: The stage of the run reported by the compute worker, 'predict' or 'score', if any.
         """
         state = {}
         if len(submission.execution_key) > 0:
@@ -419,7 +459,7 @@ def update_submission_task(job_id, args):
             logger.debug("update_submission_task state = %s" % submission.execution_key)
 
         if metadata:
-            is_predict = 'score' not in state
+            is_predict = stage == 'predict' if stage else 'score' not in state
             sub_metadata, created = CompetitionSubmissionMetadata.objects.get_or_create(
                 is_predict=is_predict,
                 is_scoring=not is_predict,
@@ -440,61 +480,39 @@ def update_submission_task(job_id, args):
                 submission.output_file.name = pathname2url(submission_output_filename(submission))
                 submission.private_output_file.name = pathname2url(submission_private_output_filename(submission))
                 submission.detailed_results_file.name = pathname2url(submission_detailed_results_filename(submission))
-                submission.save()
-                logger.debug("Retrieving output.zip and 'scores.txt' file (submission_id=%s)", submission.id)
-                logger.debug("Output.zip location=%s" % submission.output_file.file.name)
-                ozip = ZipFile(io.BytesIO(submission.output_file.read()))
-                scores = None
+                _save_submission_fields(submission, 'output_file', 'private_output_file', 'detailed_results_file')
+                submission_scores = None
+                if inline_scores is not None:
+                    try:
+                        submission_scores = scores.inline_scores(inline_scores)
+                    except ValueError:
+                        logger.warning("Invalid inline scores, reading the output bundle (submission_id=%s)",
+                                       submission.id)
                 try:
-                    scores = open(ozip.extract('scores.txt'), 'r').read()
-                except Exception:
-                    logger.error("Scores.txt not found, unable to process submission: %s (submission_id=%s)", status, submission.id)
+                    if submission_scores is None:
+                        logger.debug("Retrieving output.zip and scores file (submission_id=%s)", submission.id)
+                        logger.debug("Output.zip location=%s" % submission.output_file.file.name)
+                        ozip = ZipFile(io.BytesIO(submission.output_file.read()))
+                        submission_scores = scores.read_scores(ozip)
+                except KeyError:
+                    logger.error("Scores file not found, unable to process submission: %s (submission_id=%s)", status, submission.id)
+                    _set_submission_status(submission.id, CompetitionSubmissionStatus.FAILED)
+                    return Job.FAILED
+                except ValueError:
+                    logger.exception("Invalid scores file, unable to process submission: %s (submission_id=%s)", status, submission.id)
                     _set_submission_status(submission.id, CompetitionSubmissionStatus.FAILED)
                     return Job.FAILED
 
                 logger.debug("Processing scores... (submission_id=%s)", submission.id)
-                for line in scores.split("\n"):
-                    if len(line) > 0:
-                        label, value = line.split(":")
-                        logger.debug("Attempting to submit score %s:%s" % (label, value))
-                        try:
-                            scoredef = SubmissionScoreDef.objects.get(competition=submission.phase.competition,
-                                                                      key=label.strip())
-                            SubmissionScore.objects.create(result=submission, scoredef=scoredef, value=float(value))
-                        except SubmissionScoreDef.DoesNotExist:
-                            logger.warning("Score %s does not exist (submission_id=%s)", label, submission.id)
+                with transaction.commit_on_success():
+                    scores.save_scores(submission, submission_scores)
                 logger.debug("Done processing scores... (submission_id=%s)", submission.id)
-                _set_submission_status(submission.id, CompetitionSubmissionStatus.FINISHED)
-                # Automatically submit to the leaderboard?
-                if submission.phase.is_blind:
-                    logger.debug("Adding to leaderboard... (submission_id=%s)", submission.id)
-                    add_submission_to_leaderboard(submission)
-                    logger.debug("Leaderboard updated with latest submission (submission_id=%s)", submission.id)
-
-                if submission.phase.competition.force_submission_to_leaderboard:
-                    add_submission_to_leaderboard(submission)
-                    logger.debug("Force submission added submission to leaderboard (submission_id=%s)", submission.id)
-
+                if _set_submission_status(submission.id, CompetitionSubmissionStatus.FINISHED):
+                    _submission_finished(submission)
                 result = Job.FINISHED
-
-                if submission.participant.user.email_on_submission_finished_successfully:
-                    email = submission.participant.user.email
-                    site_url = "https://%s%s" % (Site.objects.get_current().domain, submission.phase.competition.get_absolute_url())
-                    send_mail(
-                        'Submission has finished successfully!',
-                        'Your submission to the competition "%s" has finished successfully! View it here: %s' %
-                        (submission.phase.competition.title, site_url),
-                        settings.DEFAULT_FROM_EMAIL,
-                        [email],
-                        fail_silently=False
-                    )
             else:
                 logger.debug("update_submission_task entering scoring phase (pk=%s)", submission.pk)
-                url_name = pathname2url(submission_prediction_output_filename(submission))
-                submission.prediction_output_file.name = url_name
-                submission.prediction_stderr_file.name = pathname2url(predict_submission_stdout_filename(submission))
-                submission.prediction_stdout_file.name = pathname2url(predict_submission_stderr_filename(submission))
-                submission.save()
+                _save_submission_fields(submission, *_name_prediction_outputs(submission))
                 try:
                     score(submission, job_id)
                     result = Job.RUNNING
@@ -508,7 +526,7 @@ def update_submission_task(job_id, args):
 
         if traceback:
             submission.exception_details = traceback
-            submission.save()
+            _save_submission_fields(submission, 'exception_details')
 
         _set_submission_status(submission.id, CompetitionSubmissionStatus.FAILED)
 
@@ -543,6 +561,8 @@ def update_submission_task(job_id, args):
         try:
             traceback = None
             metadata = None
+            inline_scores = None
+            stage = None
             if 'extra' in args:
                 if 'traceback' in args['extra']:
                     traceback = args['extra']['traceback']
@@ -550,7 +570,13 @@ def update_submission_task(job_id, args):
                 if 'metadata' in args['extra']:
                     metadata = args['extra']['metadata']
 
-            result = update_submission(submission, status, job.id, traceback, metadata)
+                if 'scores' in args['extra']:
+                    inline_scores = args['extra']['scores']
+
+                if 'stage' in args['extra']:
+                    stage = args['extra']['stage']
+
+            result = update_submission(submission, status, job.id, traceback, metadata, inline_scores, stage)
         except Exception as e:
             logger.exception("Failed to update submission (job_id=%s, submission_id=%s, status=%s)",
                              job.id, submission_id, status)
@@ -570,8 +596,29 @@ def evaluate_submission_task(job_id, args):
         args['predict']: A boolean value set to True to cause the evaluation to
            generate predictions followed by a scoring round or set to False to
            limit the evaluation to a scoring round.
+        args['force']: Optional, set to True to run the evaluation even when the results of
+           an identical one can be reused.
     """
 
+    def reuse_it(submission, predict_and_score):
+        """Finishes the submission with the results of an identical evaluation, if there is one."""
+        key = evaluations.evaluation_key(submission, predict_and_score)
+        submission.evaluation_key = key or ''
+        CompetitionSubmission.objects.filter(pk=submission.pk).update(evaluation_key=submission.evaluation_key)
+        if key is None or args.get('force'):
+            return False
+        source = evaluations.find_evaluation(submission, key)
+        if source is None:
+            return False
+        logger.info("Reusing the evaluation of submission %s (submission_id=%s, job_id=%s)",
+                    source.pk, submission.pk, job_id)
+        with transaction.commit_on_success():
+            evaluations.copy_evaluation(source, submission)
+        _set_submission_status(submission.id, CompetitionSubmissionStatus.FINISHED)
+        _submission_finished(CompetitionSubmission.objects.get(pk=submission.pk))
+        update_job_status_task(job_id, {'status': 'finished'})
+        return True
+
     def submit_it():
         """Start the process to evaluate the given competition submission."""
         logger.debug("evaluate_submission_task begins (job_id=%s)", job_id)
@@ -581,6 +628,13 @@ def evaluate_submission_task(job_id, args):
         logger.debug("evaluate_submission_task predict_and_score=%s (job_id=%s)", predict_and_score, job_id)
         submission = CompetitionSubmission.objects.get(pk=submission_id)
 
+        try:
+            if reuse_it(submission, predict_and_score):
+                return
+        except Exception:
+            logger.exception("evaluate_submission_task could not reuse an evaluation (job_id=%s, submission_id=%s)",
+                             job_id, submission_id)
+
         task_name, task_func = ('prediction', predict) if predict_and_score else ('scoring', score)
         try:
             logger.debug("evaluate_submission_task dispatching %s task (submission_id=%s, job_id=%s)",
@@ -596,19 +650,55 @@ def evaluate_submission_task(job_id, args):
 
     submit_it()
 
-def evaluate_submission(submission_id, is_scoring_only):
+def evaluate_submission(submission_id, is_scoring_only, force=False):
     """
     Starts the process of evaluating a user's submission to a competition.
 
     submission_id: The ID of the CompetitionSubmission object.
     is_scoring_only: True to skip the prediction step.
+    force: True to run the evaluation even when the results of an identical one can be reused.
 
     Returns a Job object which can be used to track the progress of the operation.
     """
-    task_args = {'submission_id': submission_id, 'predict': (not is_scoring_only)}
+    task_args = {'submission_id': submission_id, 'predict': (not is_scoring_only), 'force': force}
     return Job.objects.create_and_dispatch_job('evaluate_submission', task_args)
 
 
+def refresh_leaderboard_snapshot_task(job_id, args):
+    """
+    A task to rebuild a leaderboard snapshot which could not be updated in place.
+
+    job_id: The ID of the job.
+    args: A dictionary with the arguments for the task. Expected items are:
+        args['phase_id']: The ID of the CompetitionPhase object.
+        args['include_scores_not_on_leaderboard']: True for the snapshot of all finished submissions.
+    """
+    def refresh_it(job):
+        """Rebuilds the snapshot unless an earlier job already did."""
+        phase = CompetitionPhase.objects.get(pk=args['phase_id'])
+        phase.update_leaderboard_snapshot(args['include_scores_not_on_leaderboard'])
+        return JobTaskResult(status=Job.FINISHED)
+
+    run_job_task(job_id, refresh_it)
+
+
+def refresh_leaderboard_snapshot(phase, include_scores_not_on_leaderboard=False):
+    """
+    Starts rebuilding the leaderboard snapshot of a phase in a site worker, unless the snapshot
+    is current. Web requests use it rather than ranking the whole leaderboard themselves.
+
+    phase: The CompetitionPhase object.
+    include_scores_not_on_leaderboard: True for the snapshot of all finished submissions.
+
+    Returns a Job object which can be used to track the progress of the operation, None when the
+    snapshot is current.
+    """
+    if phase.leaderboard_snapshot_is_current(include_scores_not_on_leaderboard):
+        return None
+    task_args = {'phase_id': phase.pk, 'include_scores_not_on_leaderboard': include_scores_not_on_leaderboard}
+    return Job.objects.create_and_dispatch_job('refresh_leaderboard_snapshot', task_args)
+
+
 def _send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None,
                         connection=None):
     connection = connection or get_connection(
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.benchmarks.runner import leaderboard_benchmarks, run_benchmarks
+from apps.web.models import Competition
+
+
+class LeaderboardBenchmarkTests(TestCase):
+
+    def test_build_competition_creates_the_requested_shape(self):
+        synthetic = build_competition(participants=4, submissions=3, groups=2, columns=2, column_groups=1, computed=1)
+        self.assertEquals(synthetic.submission_count, 12)
+        self.assertEquals(synthetic.score_count, 12 * 2 * 2)
+        self.assertEquals(synthetic.entry_count, 4)
+
+        groups = synthetic.phase.scores()
+        self.assertEquals(len(groups), 2)
+        self.assertEquals(len(groups[0]['scores']), 4)
+        # A single column group holds the two scored columns and the computed one
+        self.assertEquals(len(groups[0]['headers']), 1)
+        self.assertEquals(len(groups[0]['headers'][0]['subs']), 3)
+
+    def test_benchmarks_report_timings_and_queries(self):
+        synthetic = build_competition(participants=3, submissions=1)
+        results = run_benchmarks(leaderboard_benchmarks(synthetic), repeat=1)
+        self.assertIn('scores', results)
+        self.assertIn('view_my_competition_submissions', results)
+        for result in results.values():
+            self.assertGreaterEqual(result['best'], 0)
+            self.assertGreaterEqual(result['queries'], 0)
+        self.assertEquals(results['ranking']['queries'], 0)
+        self.assertGreater(results['scores']['queries'], 0)
+
+    def test_command_writes_json_report_and_cleans_up(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            call_command('benchmark_leaderboards', participants=2, repeat=1, only='scores,csv_export', output=path)
+            with open(path) as f:
+                report = json.load(f)
+        finally:
+            os.remove(path)
+        self.assertEquals(sorted(report['results'].keys()), ['csv_export', 'scores'])
+        self.assertEquals(report['parameters']['participants'], 2)
+        self.assertEquals(report['data']['leaderboard_entries'], 2)
+        self.assertFalse(Competition.objects.filter(title__startswith="Benchmark").exists())
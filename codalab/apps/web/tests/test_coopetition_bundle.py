@@ -0,0 +1,101 @@
+import datetime
+import shutil
+import StringIO
+import tempfile
+import zipfile
+
+import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+
+from apps.coopetitions.models import DownloadRecord, Like
+from apps.web import coopetition
+from apps.web.benchmarks.fixtures import build_competition
+
+
+class CoopetitionBundleTests(TestCase):
+
+    def setUp(self):
+        self.storage_root = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.storage_root)
+        patcher = mock.patch('apps.web.coopetition.BundleStorage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.synthetic = build_competition(participants=3, submissions=2)
+        self.competition = self.synthetic.competition
+        self.submissions = list(self.synthetic.phase.submissions.select_related('participant__user').order_by('pk'))
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_root)
+
+    def _files(self):
+        path = coopetition.shared_artifact(self.competition)
+        artifact = self.storage.open(path)
+        try:
+            with zipfile.ZipFile(StringIO.StringIO(artifact.read())) as z:
+                return (path, dict((name, z.read(name)) for name in z.namelist()))
+        finally:
+            artifact.close()
+
+    def _artifacts(self):
+        return self.storage.listdir(coopetition.artifact_dir(self.competition))[1]
+
+    def test_bundle_has_the_competition_files(self):
+        (path, files) = self._files()
+        self.assertEquals(sorted(files.keys()), [
+            'coopetition_downloads.txt',
+            'coopetition_phase_1.txt',
+            'coopetition_scores_phase_1.txt',
+        ])
+        self.assertEquals(files['coopetition_phase_1.txt'].count('\n'), 1 + len(self.submissions))
+        self.assertEquals(files['coopetition_scores_phase_1.txt'],
+                          self.competition.get_results_csv(self.synthetic.phase.pk,
+                                                           include_scores_not_on_leaderboard=True))
+
+    def test_bundle_is_built_once_per_change(self):
+        with mock.patch('apps.web.coopetition.competition_files', wraps=coopetition.competition_files) as build:
+            (first_path, first) = self._files()
+            (second_path, second) = self._files()
+            self.assertEquals(build.call_count, 1)
+            self.assertEquals(first_path, second_path)
+
+            # A like changes the bundle
+            Like.objects.create(submission=self.submissions[0], user=self.synthetic.organizer)
+            (path, files) = self._files()
+            self.assertEquals(build.call_count, 2)
+            self.assertNotEquals(path, first_path)
+            self.assertNotEquals(files['coopetition_phase_1.txt'], first['coopetition_phase_1.txt'])
+
+            DownloadRecord.objects.create(submission=self.submissions[0], user=self.synthetic.organizer)
+            (path, files) = self._files()
+            self.assertEquals(build.call_count, 3)
+            self.assertIn(self.synthetic.organizer.username, files['coopetition_downloads.txt'])
+
+    def test_submission_bundle_lists_the_shared_bundle(self):
+        content = coopetition.coopetition_zip(self.submissions[0])
+        with zipfile.ZipFile(StringIO.StringIO(content)) as z:
+            self.assertEquals(sorted(z.namelist()), ['current_user.txt', 'metadata'])
+            self.assertEquals(z.read('current_user.txt'), self.submissions[0].participant.user.username)
+            self.assertEquals(z.read('metadata'), "shared: %s\n" % coopetition.current_artifact_path(self.competition))
+
+    def test_superseded_bundles_are_kept_when_building(self):
+        (first_path, _) = self._files()
+        Like.objects.create(submission=self.submissions[0], user=self.synthetic.organizer)
+        (path, _) = self._files()
+        self.assertEquals(sorted(self._artifacts()), sorted(name.rsplit('/', 1)[1] for name in (first_path, path)))
+
+    def test_superseded_bundles_are_removed_after_the_grace_period(self):
+        (first_path, _) = self._files()
+        Like.objects.create(submission=self.submissions[0], user=self.synthetic.organizer)
+        (path, _) = self._files()
+
+        self.assertEquals(coopetition.remove_superseded_artifacts(self.competition, datetime.timedelta(hours=1)), [])
+        self.assertEquals(len(self._artifacts()), 2)
+
+        removed = coopetition.remove_superseded_artifacts(self.competition, datetime.timedelta(hours=-1))
+        self.assertEquals(removed, [first_path])
+        self.assertEquals(self._artifacts(), [path.rsplit('/', 1)[1]])
+
+    def test_removing_without_bundles(self):
+        self.assertEquals(coopetition.remove_superseded_artifacts(self.competition, datetime.timedelta(0)), [])
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+
+import mock
+
+from django.core.cache import get_cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from apps.jobs.models import Job
+from apps.web import evaluations
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import CompetitionPhase, CompetitionSubmission, CompetitionSubmissionStatus
+from apps.web.tasks import evaluate_submission_task
+from apps.web.tests.test_scoring_inputs import _program
+
+
+@override_settings(BUNDLE_AZURE_CONTAINER='bundles', SBS_RESPONSE_QUEUE='response', SBS_COMPUTE_QUEUE='compute')
+class EvaluationReuseTests(TestCase):
+
+    def setUp(self):
+        # Store the bundles of the test in a temporary directory
+        self.storage_root = tempfile.mkdtemp()
+        storage = FileSystemStorage(location=self.storage_root)
+        for model in (CompetitionPhase, CompetitionSubmission):
+            for field in model._meta.fields:
+                if isinstance(field, models.FileField):
+                    patcher = mock.patch.object(field, 'storage', storage)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='evaluation-reuse-tests')
+        cache.clear()
+        for name in ('apps.web.models.cache', 'apps.web.evaluations.cache'):
+            patcher = mock.patch(name, cache)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for codename in (CompetitionSubmissionStatus.SUBMITTED, CompetitionSubmissionStatus.FAILED):
+            CompetitionSubmissionStatus.objects.get_or_create(name=codename, codename=codename)
+
+        self.synthetic = build_competition(participants=1, submissions=1, columns=2, computed=1)
+        self.phase = CompetitionPhase.objects.get(pk=self.synthetic.phase.pk)
+        self.phase.scoring_program.save('program.zip', _program("inputs: [ref, res]\n"))
+        self.phase.reference_data.save('reference.zip', ContentFile('reference'))
+
+        self.source = CompetitionSubmission.objects.get(phase=self.phase)
+        self.source.file.save('submission.zip', ContentFile('results'))
+        self.source.output_file.save('output.zip', ContentFile('output'))
+        CompetitionSubmission.objects.filter(pk=self.source.pk).update(
+            evaluation_key=evaluations.evaluation_key(self.source, False)
+        )
+        self.source = CompetitionSubmission.objects.get(pk=self.source.pk)
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_root)
+
+    def _evaluate(self, content='results', **args):
+        submission = CompetitionSubmission(participant=self.source.participant, phase=self.phase)
+        submission.save(ignore_submission_limits=True)
+        submission.file.save('duplicate.zip', ContentFile(content))
+        job = Job.objects.create(task_type='evaluate_submission')
+        args.update({'submission_id': submission.pk, 'predict': False})
+        with mock.patch('apps.web.tasks.getQueue') as get_queue:
+            evaluate_submission_task(job.pk, args)
+        return (CompetitionSubmission.objects.get(pk=submission.pk), Job.objects.get(pk=job.pk), get_queue)
+
+    def _scores(self, submission):
+        return dict(submission.scores.filter(scoredef__computed=False).values_list('scoredef__key', 'value'))
+
+    def test_identical_evaluation_is_reused(self):
+        (submission, job, get_queue) = self._evaluate()
+        self.assertFalse(get_queue.called)
+        self.assertEquals(job.status, Job.FINISHED)
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.FINISHED)
+        self.assertEquals(submission.evaluation_key, self.source.evaluation_key)
+        self.assertEquals(submission.output_file.name, self.source.output_file.name)
+        self.assertEquals(self._scores(submission), self._scores(self.source))
+
+    def test_force_runs_the_evaluation(self):
+        (submission, job, get_queue) = self._evaluate(force=True)
+        self.assertTrue(get_queue.called)
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.SUBMITTED)
+        # The forced evaluation can be reused once it finishes
+        self.assertEquals(submission.evaluation_key, self.source.evaluation_key)
+
+    def test_different_content_runs_the_evaluation(self):
+        (submission, job, get_queue) = self._evaluate(content='other results')
+        self.assertTrue(get_queue.called)
+        self.assertNotEquals(submission.evaluation_key, self.source.evaluation_key)
+        self.assertEquals(submission.scores.count(), 0)
+
+    def test_programs_reading_other_submissions_are_always_run(self):
+        self.phase.scoring_program.save('program.zip', _program("command: python $program/evaluate.py\n"))
+        self.assertIsNone(evaluations.evaluation_key(CompetitionSubmission.objects.get(pk=self.source.pk), False))
+        (submission, job, get_queue) = self._evaluate()
+        self.assertTrue(get_queue.called)
+        self.assertEquals(submission.evaluation_key, '')
+
+    def test_blob_digests_come_from_the_blob_properties(self):
+        field_file = mock.Mock()
+        field_file.name = 'submission.zip'
+        field_file.storage.properties.return_value = {'content-md5': 'md5==', 'etag': '"0x1"'}
+        self.assertEquals(evaluations.bundle_digest(field_file), 'md5:md5==')
+        field_file.storage.properties.assert_called_once_with('submission.zip')
+        self.assertFalse(field_file.open.called)
+
+        field_file.name = 'other.zip'
+        field_file.storage.properties.return_value = {'etag': '"0x2"'}
+        self.assertEquals(evaluations.bundle_digest(field_file), 'etag:other.zip:0x2')
+        self.assertFalse(field_file.open.called)
@@ -0,0 +1,103 @@
+import json
+import shutil
+import tempfile
+
+import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from apps.jobs.models import Job
+from apps.web import tasks
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import (CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             submission_prediction_output_filename)
+from apps.web.tests.test_scoring_inputs import _program
+
+
+@override_settings(BUNDLE_AZURE_CONTAINER='bundles', SBS_RESPONSE_QUEUE='response', SBS_COMPUTE_QUEUE='compute')
+class FusedExecutionTests(TestCase):
+
+    def setUp(self):
+        # Store the bundles of the test in a temporary directory
+        self.storage_root = tempfile.mkdtemp()
+        storage = FileSystemStorage(location=self.storage_root)
+        for model in (CompetitionPhase, CompetitionSubmission):
+            for field in model._meta.fields:
+                if isinstance(field, models.FileField):
+                    patcher = mock.patch.object(field, 'storage', storage)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
+        for codename in (CompetitionSubmissionStatus.SUBMITTED, CompetitionSubmissionStatus.RUNNING):
+            CompetitionSubmissionStatus.objects.get_or_create(name=codename, codename=codename)
+
+        self.synthetic = build_competition(participants=1, submissions=1)
+        self.phase = CompetitionPhase.objects.get(pk=self.synthetic.phase.pk)
+        self.phase.scoring_program.save('program.zip', _program("inputs: [ref, res]\n"))
+        CompetitionSubmission.objects.filter(phase=self.phase).update(
+            status=CompetitionSubmissionStatus.objects.get(codename=CompetitionSubmissionStatus.SUBMITTED)
+        )
+        self.submission = CompetitionSubmission.objects.get(phase=self.phase)
+        self.submission.file.save('program.zip', _program("command: python $program/predict.py\n"))
+        self.job = Job.objects.create(task_type='evaluate_submission',
+                                      task_args_json=json.dumps({'submission_id': self.submission.pk}))
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_root)
+
+    def _predict(self):
+        with mock.patch('apps.web.tasks.getQueue') as get_queue:
+            with mock.patch('apps.web.tasks.coopetition.coopetition_zip', return_value=''):
+                tasks.predict(self.submission, self.job.pk)
+        message = json.loads(get_queue.return_value.send_message.call_args[0][0])
+        return (CompetitionSubmission.objects.get(pk=self.submission.pk), message['task_args'])
+
+    def _read(self, field_file):
+        field_file.open()
+        try:
+            return dict(line.split(': ', 1) for line in field_file.read().split('\n'))
+        finally:
+            field_file.close()
+
+    @override_settings(COMPUTE_WORKER_FUSED_EXECUTION=True)
+    def test_fused_task_scores_the_predictions(self):
+        (submission, task_args) = self._predict()
+        self.assertEquals(task_args['bundle_id'], submission.prediction_runfile.name)
+        self.assertEquals(task_args['score_bundle_id'], submission.runfile.name)
+        self.assertEquals(json.loads(submission.execution_key), {'predict': self.job.pk, 'score': self.job.pk})
+        self.assertEquals(self._read(submission.inputfile)['res'],
+                          submission_prediction_output_filename(submission))
+        self.assertEquals(submission.prediction_output_file.name, submission_prediction_output_filename(submission))
+
+    @override_settings(COMPUTE_WORKER_FUSED_EXECUTION=True)
+    def test_stage_metadata_is_stored_per_stage(self):
+        self._predict()
+        tasks.update_submission_task(self.job.pk, {'status': 'running', 'extra': {
+            'stage': 'predict', 'metadata': {'hostname': 'predictor'}
+        }})
+        tasks.update_submission_task(self.job.pk, {'status': 'running', 'extra': {
+            'stage': 'score', 'metadata': {'hostname': 'scorer'}
+        }})
+        submission = CompetitionSubmission.objects.get(pk=self.submission.pk)
+        self.assertEquals(submission.metadata_predict.hostname, 'predictor')
+        self.assertEquals(submission.metadata_scoring.hostname, 'scorer')
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.RUNNING)
+
+    def test_separate_tasks_by_default(self):
+        (submission, task_args) = self._predict()
+        self.assertNotIn('score_bundle_id', task_args)
+        self.assertEquals(json.loads(submission.execution_key), {'predict': self.job.pk})
+        self.assertFalse(submission.runfile)
+
+    @override_settings(COMPUTE_WORKER_FUSED_EXECUTION=True)
+    def test_snapshot_inputs_are_staged_after_predicting(self):
+        self.phase.scoring_program.save('program.zip', _program("inputs: [ref, res, scores]\n"))
+        self.submission = CompetitionSubmission.objects.get(pk=self.submission.pk)
+        (submission, task_args) = self._predict()
+        self.assertNotIn('score_bundle_id', task_args)
+        self.assertEquals(json.loads(submission.execution_key), {'predict': self.job.pk})
+        self.assertFalse(submission.runfile)
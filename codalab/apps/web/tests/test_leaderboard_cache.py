@@ -0,0 +1,125 @@
+import datetime
+import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             PhaseLeaderBoardEntry,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet,
+                             add_submission_to_leaderboard)
+
+User = get_user_model()
+
+
+class LeaderboardCacheTests(TestCase):
+    def setUp(self):
+        self.cache = LocMemCache('leaderboard-tests', {})
+        self.cache.clear()
+        self.cache_patcher = mock.patch('apps.web.models.cache', self.cache)
+        self.cache_patcher.start()
+
+        self.organizer = User.objects.create_user(username="organizer", password="pass")
+        self.participant_user = User.objects.create_user(username="participant", password="pass")
+        self.competition = Competition.objects.create(creator=self.organizer, modified_by=self.organizer, published=True)
+        self.participant_1 = CompetitionParticipant.objects.create(
+            user=self.participant_user,
+            competition=self.competition,
+            status=ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+        )
+        self.phase_1 = CompetitionPhase.objects.create(
+            competition=self.competition,
+            phasenumber=1,
+            start_date=datetime.datetime.now() - datetime.timedelta(days=30),
+        )
+
+        submission_finished = CompetitionSubmissionStatus.objects.create(name="finished", codename="finished")
+
+        self.submission_1 = CompetitionSubmission.objects.create(
+            participant=self.participant_1,
+            phase=self.phase_1,
+            status=submission_finished,
+            submitted_at=datetime.datetime.now() - datetime.timedelta(days=29)
+        )
+        self.submission_1.status = submission_finished
+        self.submission_1.save()
+        PhaseLeaderBoard.objects.create(phase=self.phase_1)
+
+        result_group = SubmissionResultGroup.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            ordering=1
+        )
+        SubmissionResultGroupPhase.objects.create(phase=self.phase_1, group=result_group)
+        self.score_def = SubmissionScoreDef.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+        )
+        SubmissionScoreDefGroup.objects.create(scoredef=self.score_def, group=result_group)
+        SubmissionScoreSet.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            scoredef=self.score_def,
+        )
+        self.score = SubmissionScore.objects.create(result=self.submission_1, scoredef=self.score_def, value=0.5)
+        add_submission_to_leaderboard(self.submission_1)
+
+    def tearDown(self):
+        self.cache_patcher.stop()
+
+    def _first_value(self, results):
+        return results[0]['scores'][0][1]['values'][0]['val']
+
+    def test_scores_are_served_from_cache(self):
+        self.phase_1.scores()
+        with self.assertNumQueries(1):
+            results = self.phase_1.scores()
+        self.assertEquals(self._first_value(results), "0.5")
+
+    def test_scores_are_cached_separately_with_and_without_all_submissions(self):
+        self.assertEquals(len(self.phase_1.scores()[0]['scores']), 1)
+        PhaseLeaderBoardEntry.objects.all().delete()
+        self.assertEquals(self.phase_1.scores()[0]['scores'], [])
+        self.assertEquals(len(self.phase_1.scores(include_scores_not_on_leaderboard=True)[0]['scores']), 1)
+
+    def test_saving_a_score_bumps_the_version(self):
+        version = self.phase_1.leaderboard_version()
+        self.phase_1.scores()
+        self.score.value = 0.75
+        self.score.save()
+        self.assertEquals(self.phase_1.leaderboard_version(), version + 1)
+        self.assertEquals(self._first_value(self.phase_1.scores()), "0.8")
+
+    def test_saving_a_score_def_bumps_the_version(self):
+        version = self.phase_1.leaderboard_version()
+        self.score_def.numeric_format = 2
+        self.score_def.save()
+        self.assertEquals(self.phase_1.leaderboard_version(), version + 1)
+        self.assertEquals(self._first_value(self.phase_1.scores()), "0.50")
+
+    def test_saving_the_phase_bumps_the_version(self):
+        version = self.phase_1.leaderboard_version()
+        self.phase_1.label = "Renamed"
+        self.phase_1.save()
+        self.assertEquals(self.phase_1.leaderboard_version(), version + 1)
+
+    def test_stale_snapshot_is_rebuilt(self):
+        self.assertEquals(self._first_value(self.phase_1.leaderboard_snapshot()), "0.5")
+        self.score.value = 0.25
+        self.score.save()
+        self.assertEquals(self._first_value(self.phase_1.leaderboard_snapshot()), "0.2")
@@ -0,0 +1,105 @@
+import datetime
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             PhaseLeaderBoardEntry,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet)
+
+User = get_user_model()
+
+
+class LeaderboardQueryCountTests(TestCase):
+    # Reading the leaderboard, the result groups, the score sets of the single group, the
+    # submissions and their scores.
+    LEADERBOARD_QUERIES = 5
+
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="organizer", password="pass")
+        self.participant_user = User.objects.create_user(username="participant", password="pass")
+        self.approved = ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+        self.finished = CompetitionSubmissionStatus.objects.create(name="finished", codename="finished")
+
+    def _create_phase(self, entry_count):
+        competition = Competition.objects.create(creator=self.organizer, modified_by=self.organizer, published=True)
+        participant = CompetitionParticipant.objects.create(
+            user=self.participant_user,
+            competition=competition,
+            status=self.approved
+        )
+        phase = CompetitionPhase.objects.create(
+            competition=competition,
+            phasenumber=1,
+            start_date=datetime.datetime.now() - datetime.timedelta(days=30),
+        )
+        board = PhaseLeaderBoard.objects.create(phase=phase)
+
+        result_group = SubmissionResultGroup.objects.create(
+            competition=competition,
+            key="Key",
+            label="Test",
+            ordering=1
+        )
+        SubmissionResultGroupPhase.objects.create(phase=phase, group=result_group)
+        score_def = SubmissionScoreDef.objects.create(
+            competition=competition,
+            key="Key",
+            label="Test",
+        )
+        SubmissionScoreDefGroup.objects.create(scoredef=score_def, group=result_group)
+        SubmissionScoreSet.objects.create(
+            competition=competition,
+            key="Key",
+            label="Test",
+            scoredef=score_def,
+        )
+
+        CompetitionSubmission.objects.bulk_create([
+            CompetitionSubmission(
+                participant=participant,
+                phase=phase,
+                status=self.finished,
+                submission_number=i + 1,
+                file="submissions/%s.zip" % (i + 1)
+            ) for i in range(entry_count)
+        ])
+        submission_ids = list(CompetitionSubmission.objects.filter(phase=phase).values_list('pk', flat=True))
+        PhaseLeaderBoardEntry.objects.bulk_create([
+            PhaseLeaderBoardEntry(board=board, result_id=pk) for pk in submission_ids
+        ])
+        SubmissionScore.objects.bulk_create([
+            SubmissionScore(result_id=pk, scoredef=score_def, value=i) for (i, pk) in enumerate(submission_ids)
+        ])
+        return phase
+
+    def test_leaderboard_query_count_does_not_depend_on_entry_count(self):
+        for entry_count in (10, 10000):
+            phase = self._create_phase(entry_count)
+            with self.assertNumQueries(self.LEADERBOARD_QUERIES):
+                results = phase.scores()
+            self.assertEquals(len(results[0]['scores']), entry_count)
+
+    def test_all_submissions_query_count_does_not_depend_on_submission_count(self):
+        for entry_count in (10, 10000):
+            phase = self._create_phase(entry_count)
+            with self.assertNumQueries(self.LEADERBOARD_QUERIES):
+                results = phase.scores(include_scores_not_on_leaderboard=True)
+            self.assertEquals(len(results[0]['scores']), entry_count)
+
+    def test_result_location_is_the_file_of_each_submission(self):
+        phase = self._create_phase(3)
+        for (rank, score) in phase.scores()[0]['scores']:
+            submission = CompetitionSubmission.objects.get(pk=score['id'])
+            self.assertEquals(score['resultLocation'], submission.file.name)
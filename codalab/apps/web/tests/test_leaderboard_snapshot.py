@@ -0,0 +1,235 @@
+import datetime
+import json
+import mock
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from apps.jobs.models import Job
+from apps.web import tasks
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             PhaseLeaderBoardEntry,
+                             PhaseLeaderBoardSnapshot,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet,
+                             add_submission_to_leaderboard,
+                             bump_leaderboard_versions,
+                             transition_submission_status)
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.scores import save_scores
+from apps.web.signals import leaderboard_ranks_changed
+
+User = get_user_model()
+
+
+class LeaderboardSnapshotTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="organizer", password="pass")
+        self.participant_user = User.objects.create_user(username="participant", password="pass")
+        self.competition = Competition.objects.create(creator=self.organizer, modified_by=self.organizer, published=True)
+        self.participant_1 = CompetitionParticipant.objects.create(
+            user=self.participant_user,
+            competition=self.competition,
+            status=ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+        )
+        self.phase_1 = CompetitionPhase.objects.create(
+            competition=self.competition,
+            phasenumber=1,
+            start_date=datetime.datetime.now() - datetime.timedelta(days=30),
+        )
+
+        submission_finished = CompetitionSubmissionStatus.objects.create(name="finished", codename="finished")
+
+        self.submission_1 = CompetitionSubmission.objects.create(
+            participant=self.participant_1,
+            phase=self.phase_1,
+            status=submission_finished,
+            submitted_at=datetime.datetime.now() - datetime.timedelta(days=29)
+        )
+        self.submission_1.status = submission_finished
+        self.submission_1.save()
+        PhaseLeaderBoard.objects.create(phase=self.phase_1)
+
+        result_group = SubmissionResultGroup.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            ordering=1
+        )
+        SubmissionResultGroupPhase.objects.create(phase=self.phase_1, group=result_group)
+        score_def = SubmissionScoreDef.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+        )
+        SubmissionScoreDefGroup.objects.create(scoredef=score_def, group=result_group)
+        SubmissionScoreSet.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            scoredef=score_def,
+        )
+        SubmissionScore.objects.create(result=self.submission_1, scoredef=score_def, value=0.5)
+
+    def test_reading_a_missing_snapshot_does_not_write_it(self):
+        groups = self.phase_1.leaderboard_snapshot()
+        self.assertEquals(len(groups), 1)
+        self.assertEquals(groups[0]['scores'], [])
+        self.assertFalse(PhaseLeaderBoardSnapshot.objects.filter(phase=self.phase_1).exists())
+
+    def test_reading_a_stale_snapshot_does_not_rebuild_it(self):
+        snapshot = self.phase_1.refresh_leaderboard_snapshot(include_scores_not_on_leaderboard=True)
+        SubmissionScore.objects.filter(result=self.submission_1).update(value=0.3)
+        bump_leaderboard_versions(phase=self.phase_1)
+        groups = self.phase_1.leaderboard_snapshot(include_scores_not_on_leaderboard=True)
+        self.assertEquals(groups[0]['scores'][0][1]['values'][0]['val'], "0.3")
+        self.assertEquals(PhaseLeaderBoardSnapshot.objects.get(pk=snapshot.pk).version, snapshot.version)
+
+    def test_leaderboard_snapshot_matches_scores(self):
+        add_submission_to_leaderboard(self.submission_1)
+        expected = self.phase_1.scores()
+        groups = self.phase_1.leaderboard_snapshot()
+        self.assertEquals(groups[0]['headers'], expected[0]['headers'])
+        self.assertEquals(groups[0]['scores'][0][1], expected[0]['scores'][0][1])
+
+    def test_leaderboard_snapshot_is_read_without_recomputing_scores(self):
+        self.phase_1.refresh_leaderboard_snapshot()
+        with mock.patch.object(CompetitionPhase, 'scores') as scores_mock:
+            self.phase_1.leaderboard_snapshot()
+        self.assertFalse(scores_mock.called)
+
+    def test_adding_and_removing_from_leaderboard_updates_snapshot(self):
+        self.phase_1.refresh_leaderboard_snapshot()
+        add_submission_to_leaderboard(self.submission_1)
+        groups = self.phase_1.leaderboard_snapshot()
+        self.assertEquals(groups[0]['scores'][0][1]['id'], self.submission_1.pk)
+        self.assertEquals(groups[0]['scores'][0][1]['values'][0]['val'], "0.5")
+
+        self.client.login(username="organizer", password="pass")
+        resp = self.client.post(reverse("competitions:submission_toggle_leaderboard",
+                                        kwargs={"submission_pk": self.submission_1.pk}))
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(self.phase_1.leaderboard_snapshot()[0]['scores'], [])
+
+    def test_requests_leave_the_rebuild_of_stale_snapshots_to_the_site_workers(self):
+        self.client.login(username="organizer", password="pass")
+        url = reverse("competitions:submission_toggle_leaderboard", kwargs={"submission_pk": self.submission_1.pk})
+        with mock.patch('apps.jobs.models.getQueue') as get_queue:
+            with mock.patch.object(CompetitionPhase, '_scores') as scores_mock:
+                resp = self.client.post(url)
+        self.assertEquals(resp.status_code, 200)
+        self.assertFalse(scores_mock.called)
+        self.assertFalse(PhaseLeaderBoardSnapshot.objects.filter(phase=self.phase_1).exists())
+        job = Job.objects.get(task_type='refresh_leaderboard_snapshot')
+        self.assertTrue(get_queue.return_value.send_message.called)
+
+        tasks.refresh_leaderboard_snapshot_task(job.pk, job.get_task_args())
+        self.assertEquals(Job.objects.get(pk=job.pk).status, Job.FINISHED)
+        self.assertTrue(self.phase_1.leaderboard_snapshot_is_current())
+        self.assertEquals(self.phase_1.leaderboard_snapshot()[0]['scores'][0][1]['id'], self.submission_1.pk)
+
+    def test_current_snapshots_are_not_refreshed(self):
+        self.phase_1.refresh_leaderboard_snapshot()
+        with mock.patch('apps.jobs.models.getQueue') as get_queue:
+            add_submission_to_leaderboard(self.submission_1)
+            self.assertIsNone(tasks.refresh_leaderboard_snapshot(self.phase_1))
+        self.assertFalse(get_queue.called)
+
+    def test_complete_snapshot_includes_submissions_not_on_leaderboard(self):
+        groups = self.phase_1.leaderboard_snapshot(include_scores_not_on_leaderboard=True)
+        self.assertEquals(groups[0]['scores'][0][1]['id'], self.submission_1.pk)
+        self.assertEquals(self.phase_1.leaderboard_snapshot()[0]['scores'], [])
+
+
+class IncrementalSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=6, submissions=2, groups=2, columns=2, computed=1)
+        self.phase = CompetitionPhase.objects.get(pk=self.synthetic.phase.pk)
+        self.submissions = list(self.phase.submissions.order_by('pk'))
+        # Tied and repeated values, so the updates merge and split ranks
+        keys = list(self.phase.competition.submissionscoredef_set.filter(computed=False).values_list('key', flat=True))
+        for (i, submission) in enumerate(self.submissions):
+            SubmissionScore.objects.filter(result=submission).update(value=i % 3)
+        bump_leaderboard_versions(phase=self.phase)
+        self.keys = keys
+        for include_scores_not_on_leaderboard in (False, True):
+            self.phase.refresh_leaderboard_snapshot(include_scores_not_on_leaderboard)
+
+    def _rows(self, groups):
+        return [sorted((rank, row['id'], row) for (rank, row) in group['scores']) for group in groups]
+
+    def _assert_snapshots_are_current(self):
+        version = self.phase.leaderboard_version()
+        lb = PhaseLeaderBoard.objects.get(phase=self.phase)
+        for include_scores_not_on_leaderboard in (False, True):
+            snapshot = PhaseLeaderBoardSnapshot.objects.get(
+                phase=self.phase,
+                include_scores_not_on_leaderboard=include_scores_not_on_leaderboard
+            )
+            self.assertEquals(snapshot.version, version)
+            expected = json.loads(json.dumps(self.phase._scores(lb, False, include_scores_not_on_leaderboard)[0]))
+            self.assertEquals(self._rows(snapshot.groups), self._rows(expected))
+
+    def test_new_scores_update_the_snapshots_in_place(self):
+        with mock.patch.object(CompetitionPhase, '_scores') as scores_mock:
+            save_scores(self.submissions[1], [(key, 7.5) for key in self.keys])
+            save_scores(self.submissions[3], [(self.keys[0], 0)])
+        self.assertFalse(scores_mock.called)
+        self._assert_snapshots_are_current()
+
+    def test_leaderboard_changes_update_the_snapshot_in_place(self):
+        with mock.patch.object(CompetitionPhase, '_scores') as scores_mock:
+            add_submission_to_leaderboard(self.submissions[0])
+            PhaseLeaderBoardEntry.objects.filter(result=self.submissions[3]).delete()
+        self.assertFalse(scores_mock.called)
+        self._assert_snapshots_are_current()
+
+    def test_failed_and_deleted_submissions_leave_the_snapshots(self):
+        CompetitionSubmissionStatus.objects.get_or_create(name='failed', codename=CompetitionSubmissionStatus.FAILED)
+        with mock.patch.object(CompetitionPhase, '_scores') as scores_mock:
+            transition_submission_status(self.submissions[2].pk, CompetitionSubmissionStatus.FAILED,
+                                         override_final=True)
+            CompetitionSubmission.objects.get(pk=self.submissions[5].pk).delete()
+        self.assertFalse(scores_mock.called)
+        self._assert_snapshots_are_current()
+
+    def test_rank_changes_are_signaled(self):
+        submission = self.submissions[1]
+        SubmissionScore.objects.filter(result=submission).delete()
+        received = []
+
+        def receiver(sender, phase_id, include_scores_not_on_leaderboard, changes, **kwargs):
+            received.append((phase_id, include_scores_not_on_leaderboard, changes))
+        leaderboard_ranks_changed.connect(receiver)
+        self.addCleanup(leaderboard_ranks_changed.disconnect, receiver)
+
+        before = self.phase.leaderboard_snapshot()
+        save_scores(submission, [(key, 7.5) for key in self.keys])
+        after = self.phase.leaderboard_snapshot()
+
+        self.assertEquals(sorted(include for (phase_id, include, changes) in received), [False, True])
+        changes = dict((include, changes) for (phase_id, include, changes) in received)[False]
+        scoredef = self.phase.competition.submissionscoredef_set.get(key=self.keys[0])
+        old_ranks = dict((row['id'], row['values'][0]['rnk']) for (rank, row) in before[0]['scores'])
+        new_ranks = dict((row['id'], row['values'][0]['rnk']) for (rank, row) in after[0]['scores'])
+        expected = dict((id, (old_ranks[id], new_ranks[id])) for id in new_ranks if old_ranks[id] != new_ranks[id])
+        self.assertTrue(expected)
+        self.assertEquals(changes[scoredef.pk], expected)
+
+    def test_stale_snapshots_are_not_updated(self):
+        bump_leaderboard_versions(phase=self.phase)
+        save_scores(self.submissions[1], [(key, 7.5) for key in self.keys])
+        snapshot = PhaseLeaderBoardSnapshot.objects.get(phase=self.phase, include_scores_not_on_leaderboard=False)
+        self.assertNotEquals(snapshot.version, self.phase.leaderboard_version())
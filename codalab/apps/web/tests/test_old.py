@@ -285,3 +285,29 @@ class CompetitionDefinitionTests(TestCase):
 
     def test_import_date_5(self):
         self.assertRaises(ValueError, CompetitionDefinitionTests.read_date, None)
+
+    @staticmethod
+    def read_computed(computed_str):
+        """
+        Simulates reading the 'computed' mapping of a leaderboard column from a YAML file.
+        """
+        data = yaml.load("computed: {0}".format(computed_str))
+        return CompetitionDefBundle.computed_fields('avg', data['computed'])
+
+    def test_computed_fields_default_weights(self):
+        self.assertEqual([('a', 1.0), ('b', 1.0)], CompetitionDefinitionTests.read_computed("{fields: 'a, b'}"))
+
+    def test_computed_fields_comma_weights(self):
+        self.assertEqual([('a', 2.0), ('b', 0.5)],
+                         CompetitionDefinitionTests.read_computed("{fields: 'a,b', weights: '2, 0.5'}"))
+
+    def test_computed_fields_list_weights(self):
+        self.assertEqual([('a', 2.0), ('b', 0.5)],
+                         CompetitionDefinitionTests.read_computed("{fields: [a, b], weights: [2, 0.5]}"))
+
+    def test_computed_fields_weight_count_mismatch(self):
+        self.assertRaises(ValueError, CompetitionDefinitionTests.read_computed, "{fields: 'a,b,c', weights: '1,2'}")
+        self.assertRaises(ValueError, CompetitionDefinitionTests.read_computed, "{fields: 'a', weights: [1, 2]}")
+
+    def test_computed_fields_non_numeric_weights(self):
+        self.assertRaises(ValueError, CompetitionDefinitionTests.read_computed, "{fields: 'a,b', weights: 'x,1'}")
@@ -0,0 +1,139 @@
+import json
+
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.test import TestCase
+from django.test.client import Client
+from django.contrib.auth import get_user_model
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import CompetitionSubmissionStatus, ParticipantStatus
+
+User = get_user_model()
+
+
+class OrganizerGridTestCase(TestCase):
+    url_name = None
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=6, submissions=2)
+        self.client = Client()
+        self.client.login(username=self.synthetic.organizer.username, password=self.synthetic.password)
+
+    def _get(self, **params):
+        url = reverse(self.url_name, kwargs={"competition_id": self.synthetic.competition.pk})
+        resp = self.client.get(url, params)
+        self.assertEquals(resp.status_code, 200)
+        return json.loads(resp.content)
+
+    def _count_queries(self, **params):
+        connection.use_debug_cursor = True
+        reset_queries()
+        try:
+            self._get(**params)
+            return len(connection.queries)
+        finally:
+            connection.use_debug_cursor = False
+
+
+class SubmissionGridTests(OrganizerGridTestCase):
+    url_name = "my_competition_submissions_data"
+
+    def _get(self, **params):
+        params.setdefault('phase', self.synthetic.phase.pk)
+        return super(SubmissionGridTests, self)._get(**params)
+
+    def test_pages_are_sliced_by_the_database(self):
+        data = self._get(per_page=5)
+        self.assertEquals(data['count'], 12)
+        self.assertEquals(data['num_pages'], 3)
+        self.assertEquals([row['position'] for row in data['results']], [1, 2, 3, 4, 5])
+
+        last = self._get(per_page=5, page=3)
+        self.assertEquals(len(last['results']), 2)
+        self.assertEquals(last['results'][0]['position'], 11)
+
+        # Out of range pages return the last page
+        self.assertEquals(self._get(per_page=5, page=99)['page'], 3)
+
+    def test_pages_do_not_overlap(self):
+        seen = []
+        for page in (1, 2, 3):
+            seen.extend(row['id'] for row in self._get(per_page=5, page=page, order='status_name')['results'])
+        self.assertEquals(len(seen), 12)
+        self.assertEquals(len(set(seen)), 12)
+
+    def test_ordering(self):
+        ids = [row['id'] for row in self._get(order='submission_pk', direction='desc')['results']]
+        self.assertEquals(ids, sorted(ids, reverse=True))
+
+        names = [row['submitted_by'] for row in self._get(order='submitted_by')['results']]
+        self.assertEquals(names, sorted(names))
+
+        rows = self._get(order='is_in_leaderboard', direction='desc')['results']
+        self.assertEquals([row['is_in_leaderboard'] for row in rows], [True] * 6 + [False] * 6)
+
+    def test_unknown_order_falls_back_to_the_default(self):
+        data = self._get(order='score_0')
+        self.assertEquals(data['order'], 'submitted_at')
+
+    def test_filters(self):
+        on_leaderboard = self._get(leaderboard='1')['results']
+        self.assertEquals(len(on_leaderboard), 6)
+        self.assertTrue(all(row['is_in_leaderboard'] for row in on_leaderboard))
+        self.assertEquals(self._get(leaderboard='false')['count'], 6)
+
+        username = on_leaderboard[0]['submitted_by']
+        self.assertEquals(set(row['submitted_by'] for row in self._get(user=username)['results']), set([username]))
+
+        failed = CompetitionSubmissionStatus.objects.get_or_create(name='failed',
+                                                                   codename=CompetitionSubmissionStatus.FAILED)[0]
+        self.synthetic.phase.submissions.filter(pk=on_leaderboard[0]['id']).update(status=failed)
+        self.assertEquals([row['id'] for row in self._get(status='failed')['results']], [on_leaderboard[0]['id']])
+
+    def test_text_search(self):
+        username = self._get()['results'][0]['submitted_by']
+        self.assertEquals(self._get(q=username.upper())['count'], 2)
+        self.assertEquals(self._get(q='submission_1.zip')['count'], 6)
+        self.assertEquals(self._get(q='no such submission')['count'], 0)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.synthetic.phase.leaderboard_snapshot()
+        self.assertEquals(self._count_queries(per_page=2), self._count_queries(per_page=12))
+
+    def test_non_admin_gets_404(self):
+        User.objects.create_user(username="other", password="pass")
+        client = Client()
+        client.login(username="other", password="pass")
+        url = reverse(self.url_name, kwargs={"competition_id": self.synthetic.competition.pk})
+        self.assertEquals(client.get(url).status_code, 404)
+
+
+class ParticipantGridTests(OrganizerGridTestCase):
+    url_name = "my_competition_participants_data"
+
+    def test_rows_count_entries(self):
+        data = self._get(per_page=4)
+        self.assertEquals(data['count'], 6)
+        self.assertEquals(data['num_pages'], 2)
+        self.assertEquals([row['number'] for row in data['results']], [1, 2, 3, 4])
+        self.assertTrue(all(row['entries'] == 2 for row in data['results']))
+        self.assertTrue(all(row['status'] == ParticipantStatus.APPROVED for row in data['results']))
+
+    def test_ordering_by_entries(self):
+        participant = self.synthetic.competition.participants.all()[0]
+        participant.submissions.all()[0].delete()
+        rows = self._get(order='entries')['results']
+        self.assertEquals(rows[0]['pk'], participant.pk)
+        self.assertEquals(rows[0]['entries'], 1)
+
+    def test_filters(self):
+        pending = ParticipantStatus.objects.get_or_create(name='pending', codename=ParticipantStatus.PENDING)[0]
+        participant = self.synthetic.competition.participants.all()[0]
+        participant.status = pending
+        participant.save()
+        self.assertEquals([row['pk'] for row in self._get(status='pending')['results']], [participant.pk])
+        self.assertEquals(self._get(q=participant.user.email)['count'], 1)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEquals(self._count_queries(per_page=2), self._count_queries(per_page=6))
@@ -0,0 +1,146 @@
+import json
+import operator
+import random
+
+import numpy
+
+from django.test import TestCase
+
+from apps.web.models import CompetitionPhase
+from apps.web.ranking import rank_matrix, RankIndex, ScoreMatrix
+
+
+def _reference_rank_values(ids, id_value_pairs, sort_ascending=True, eps=1.0e-12):
+    """The original, one-column-at-a-time ranking the engine must reproduce."""
+    ranks = {}
+    valid_pairs = {k: v for k, v in id_value_pairs.iteritems() if k in ids}
+    if len(valid_pairs) == 0:
+        return {id: 1 for id in ids}
+    sorted_pairs = sorted(valid_pairs.iteritems(), key=operator.itemgetter(1), reverse=not sort_ascending)
+    r = 1
+    k, v = sorted_pairs[0]
+    ranks[k] = r
+    for i in range(1, len(sorted_pairs)):
+        k, vnow = sorted_pairs[i]
+        if abs(vnow - v) > eps:
+            r = r + 1
+            v = vnow
+        ranks[k] = r
+    r = r + 1
+    for id in ids:
+        if id not in ranks:
+            ranks[id] = r
+    return ranks
+
+
+class RankMatrixTests(TestCase):
+
+    def test_rank_matrix_matches_reference_on_random_columns(self):
+        rng = random.Random(42)
+        ids = range(200)
+        for sort_ascending in (True, False):
+            for _ in range(20):
+                pairs = {}
+                for id in ids:
+                    if rng.random() < 0.9:
+                        pairs[id] = float(rng.randint(0, 30))
+                expected = _reference_rank_values(ids, pairs, sort_ascending=sort_ascending)
+                self.assertEqual(expected, CompetitionPhase.rank_values(ids, pairs, sort_ascending=sort_ascending))
+
+    def test_rank_matrix_handles_drifting_near_ties_like_reference(self):
+        eps = 1.0e-3
+        ids = range(8)
+        # Every step is below eps but the run drifts further than eps from its first value
+        pairs = {id: 1.0 + id * 0.6e-3 for id in ids}
+        for sort_ascending in (True, False):
+            expected = _reference_rank_values(ids, pairs, sort_ascending=sort_ascending, eps=eps)
+            actual = CompetitionPhase.rank_values(ids, pairs, sort_ascending=sort_ascending, eps=eps)
+            self.assertEqual(expected, actual)
+
+    def test_rank_matrix_ranks_each_column_with_its_own_direction(self):
+        values = numpy.array([[1.0, 1.0],
+                              [3.0, numpy.nan],
+                              [2.0, 3.0]])
+        ranks = rank_matrix(values, [True, False])
+        self.assertEqual(ranks[:, 0].tolist(), [1, 3, 2])
+        self.assertEqual(ranks[:, 1].tolist(), [2, 3, 1])
+
+
+class ScoreMatrixTests(TestCase):
+
+    def setUp(self):
+        self.matrix = ScoreMatrix([10, 11, 12], ['a', 'b', 'c'])
+        for sid, a, b in ((10, 1.0, 3.0), (11, 2.0, 2.0), (12, 3.0, 1.0)):
+            self.matrix.set(sid, 'a', a)
+            self.matrix.set(sid, 'b', b)
+        self.ranks = self.matrix.rank([True, True, True])
+
+    def test_rank_skips_columns_without_scores(self):
+        self.assertEqual(set(self.ranks.keys()), {'a', 'b'})
+        self.assertEqual(self.ranks['a'], {10: 1, 11: 2, 12: 3})
+        self.assertEqual(self.ranks['b'], {10: 3, 11: 2, 12: 1})
+
+    def test_compute_operations(self):
+        self.assertEqual(self.matrix.compute('Avg', ['a', 'b']), {10: 2.0, 11: 2.0, 12: 2.0})
+        self.assertEqual(self.matrix.compute('Max', ['a', 'b']), {10: 3.0, 11: 2.0, 12: 3.0})
+        self.assertEqual(self.matrix.compute('Min', ['a', 'b']), {10: 1.0, 11: 2.0, 12: 1.0})
+        self.assertEqual(self.matrix.compute('Median', ['a', 'b']), {10: 2.0, 11: 2.0, 12: 2.0})
+        self.assertEqual(self.matrix.compute('WAvg', ['a', 'b'], [3.0, 1.0]), {10: 1.5, 11: 2.0, 12: 2.5})
+
+    def test_compute_unknown_operation_raises(self):
+        with self.assertRaises(ValueError):
+            self.matrix.compute('Sum', ['a', 'b'])
+
+
+class RankIndexTests(TestCase):
+
+    def _ranks(self, index):
+        return dict((id, index.rank(id)) for id in index)
+
+    def test_from_values_matches_rank_values(self):
+        rng = random.Random(7)
+        ids = range(100)
+        for sort_ascending in (True, False):
+            pairs = dict((id, float(rng.randint(0, 20))) for id in ids if rng.random() < 0.9)
+            index = RankIndex.from_values(ids, pairs, sort_ascending=sort_ascending)
+            self.assertEqual(self._ranks(index), CompetitionPhase.rank_values(ids, pairs, sort_ascending=sort_ascending))
+
+    def test_updates_match_rank_values_and_report_the_shifted_submissions(self):
+        rng = random.Random(3)
+        for sort_ascending in (True, False):
+            pairs = {}
+            ids = set()
+            index = RankIndex(sort_ascending=sort_ascending)
+            for _ in range(300):
+                before = self._ranks(index)
+                id = rng.randint(0, 40)
+                if id in ids and rng.random() < 0.3:
+                    shifted = index.remove(id)
+                    ids.discard(id)
+                    pairs.pop(id, None)
+                else:
+                    value = float(rng.randint(0, 15)) if rng.random() < 0.9 else None
+                    shifted = index.set(id, value)
+                    ids.add(id)
+                    pairs.pop(id, None)
+                    if value is not None:
+                        pairs[id] = value
+                after = self._ranks(index)
+                self.assertEqual(after, CompetitionPhase.rank_values(ids, pairs, sort_ascending=sort_ascending))
+                changed = set(other for other in after if other != id and before.get(other) != after[other])
+                self.assertTrue(changed <= shifted)
+                self.assertNotIn(id, shifted)
+
+    def test_ties_do_not_shift_other_submissions(self):
+        index = RankIndex.from_values([1, 2, 3], {1: 1.0, 2: 2.0, 3: 3.0})
+        self.assertEqual(index.set(4, 2.0), set())
+        self.assertEqual(self._ranks(index), {1: 1, 2: 2, 3: 3, 4: 2})
+        self.assertEqual(index.set(5, 1.5), set([2, 3, 4]))
+        self.assertEqual(index.remove(5), set([2, 3, 4]))
+
+    def test_round_trips_through_json(self):
+        index = RankIndex.from_values([1, 2, 3, 4], {1: 0.5, 2: 0.25, 3: 0.5}, sort_ascending=False)
+        loaded = RankIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+        self.assertEqual(self._ranks(loaded), {1: 1, 2: 2, 3: 1, 4: 3})
+        self.assertEqual(loaded.set(4, 0.75), set([1, 2, 3]))
+        self.assertEqual(self._ranks(loaded), {1: 2, 2: 3, 3: 2, 4: 1})
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import datetime
+import mock
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from apps.web import exports
+from apps.web.models import (Competition,
+                             CompetitionParticipant,
+                             CompetitionPhase,
+                             CompetitionSubmission,
+                             CompetitionSubmissionStatus,
+                             ParticipantStatus,
+                             PhaseLeaderBoard,
+                             SubmissionResultGroup,
+                             SubmissionResultGroupPhase,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             SubmissionScoreDefGroup,
+                             SubmissionScoreSet,
+                             add_submission_to_leaderboard)
+
+User = get_user_model()
+
+
+class CsvLinesTests(TestCase):
+    def test_leaderboard_rows_are_formatted_as_csv(self):
+        groups = [{
+            'label': 'Results',
+            'headers': [{'key': 'acc', 'label': 'Accuracy', 'subs': []}],
+            'scores': [(1, {'id': 12, 'username': u'j\xfcrgen', 'values': [{'val': '0.5', 'rnk': 1, 'name': 'acc'}]})],
+        }]
+        lines = list(exports.csv_lines(exports.leaderboard_rows(groups)))
+        self.assertEquals(lines[0], "submission_pk,User,Accuracy\r\n")
+        self.assertEquals(lines[1], "12,j\xc3\xbcrgen,0.5 (1),\r\n")
+
+    def test_empty_group_has_no_data_row(self):
+        groups = [{'label': 'Results', 'headers': [], 'scores': []}]
+        lines = list(exports.csv_lines(exports.leaderboard_rows(groups)))
+        self.assertEquals(lines[1], "No data available\r\n")
+
+
+class ResultsDownloadTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="organizer", password="pass")
+        self.participant_user = User.objects.create_user(username="participant", password="pass")
+        self.competition = Competition.objects.create(creator=self.organizer, modified_by=self.organizer, published=True)
+        self.participant_1 = CompetitionParticipant.objects.create(
+            user=self.participant_user,
+            competition=self.competition,
+            status=ParticipantStatus.objects.get_or_create(name='approved', codename=ParticipantStatus.APPROVED)[0]
+        )
+        self.phase_1 = CompetitionPhase.objects.create(
+            competition=self.competition,
+            phasenumber=1,
+            start_date=datetime.datetime.now() - datetime.timedelta(days=30),
+        )
+        PhaseLeaderBoard.objects.create(phase=self.phase_1)
+
+        submission_finished = CompetitionSubmissionStatus.objects.create(name="finished", codename="finished")
+        self.submissions = []
+        for description in ("first", "second"):
+            submission = CompetitionSubmission.objects.create(
+                participant=self.participant_1,
+                phase=self.phase_1,
+                status=submission_finished,
+                description=description,
+                readable_filename="%s.zip" % description,
+            )
+            submission.status = submission_finished
+            submission.save()
+            self.submissions.append(submission)
+
+        result_group = SubmissionResultGroup.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            ordering=1
+        )
+        SubmissionResultGroupPhase.objects.create(phase=self.phase_1, group=result_group)
+        score_def = SubmissionScoreDef.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+        )
+        SubmissionScoreDefGroup.objects.create(scoredef=score_def, group=result_group)
+        SubmissionScoreSet.objects.create(
+            competition=self.competition,
+            key="Key",
+            label="Test",
+            scoredef=score_def,
+        )
+        SubmissionScore.objects.create(result=self.submissions[0], scoredef=score_def, value=0.5)
+        SubmissionScore.objects.create(result=self.submissions[1], scoredef=score_def, value=0.25)
+        add_submission_to_leaderboard(self.submissions[0])
+
+    def test_results_download_is_streamed(self):
+        resp = self.client.get(reverse("competitions:competition_results_download",
+                                       kwargs={"id": self.competition.pk, "phase": self.phase_1.pk}))
+        self.assertEquals(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        content = ''.join(resp.streaming_content)
+        self.assertEquals(content, self.competition.get_results_csv(self.phase_1.pk))
+        self.assertIn("%s,participant,0.5 (1)" % self.submissions[0].pk, content)
+
+    def test_complete_results_download_lists_every_finished_submission(self):
+        resp = self.client.get(reverse("competitions:competition_results_complete_download",
+                                       kwargs={"id": self.competition.pk, "phase": self.phase_1.pk}))
+        self.assertEquals(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = ''.join(resp.streaming_content).splitlines()
+        self.assertEquals(lines[2], "User,Test,Description,Date,Filename,Is on leaderboard?")
+        rows = dict((line.split(',')[2], line) for line in lines[4:6])
+        self.assertTrue(rows['first'].startswith("participant,0.5 (2),first,"))
+        self.assertTrue(rows['first'].endswith(",first.zip,True"))
+        self.assertTrue(rows['second'].startswith("participant,0.2 (1),second,"))
+        self.assertTrue(rows['second'].endswith(",second.zip,False"))
+
+    def test_complete_results_download_does_not_save_submissions(self):
+        CompetitionSubmission.objects.filter(pk=self.submissions[1].pk).update(
+            readable_filename=None, file="competition/1/1/submissions/1/2/second.zip")
+        with mock.patch.object(CompetitionSubmission, 'save') as save:
+            resp = self.client.get(reverse("competitions:competition_results_complete_download",
+                                           kwargs={"id": self.competition.pk, "phase": self.phase_1.pk}))
+            content = ''.join(resp.streaming_content)
+        self.assertFalse(save.called)
+        self.assertIn(",second.zip,False", content)
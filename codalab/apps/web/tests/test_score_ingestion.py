@@ -0,0 +1,145 @@
+import json
+import mock
+import StringIO
+import zipfile
+
+from django.db import connection, reset_queries
+from django.test import TestCase
+
+from apps.jobs.models import Job
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import (CompetitionSubmissionStatus,
+                             PhaseLeaderBoard,
+                             SubmissionScore,
+                             SubmissionScoreDef,
+                             submission_output_filename,
+                             transition_submission_status)
+from apps.web.scores import MAX_INLINE_SCORES, inline_scores, parse_scores, read_scores, save_scores
+from apps.web.tasks import update_submission_task
+
+
+def _zip(files):
+    buf = StringIO.StringIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for (name, content) in files.items():
+            z.writestr(name, content)
+    return zipfile.ZipFile(StringIO.StringIO(buf.getvalue()))
+
+
+class ParseScoresTests(TestCase):
+
+    def test_text_format(self):
+        self.assertEquals(parse_scores("a: 1\n b :0.5\n\n", 'scores.txt'), [(u'a', 1.0), (u'b', 0.5)])
+
+    def test_json_format(self):
+        self.assertEquals(sorted(parse_scores(json.dumps({"a": 1, "b": 0.25}), 'scores.json')),
+                          [(u'a', 1.0), (u'b', 0.25)])
+
+    def test_yaml_format(self):
+        self.assertEquals(sorted(parse_scores("a: 1\nb: 0.25\n", 'scores.yaml')), [(u'a', 1.0), (u'b', 0.25)])
+
+    def test_invalid_content_raises_value_error(self):
+        self.assertRaises(ValueError, parse_scores, "no separator", 'scores.txt')
+        self.assertRaises(ValueError, parse_scores, "a: not a number", 'scores.txt')
+        self.assertRaises(ValueError, parse_scores, "[1, 2", 'scores.json')
+        self.assertRaises(ValueError, parse_scores, "just a string", 'scores.yaml')
+
+    def test_inline_scores_are_validated(self):
+        self.assertEquals(inline_scores({"a": 1}), [(u'a', 1.0)])
+        self.assertRaises(ValueError, inline_scores, {"a": None})
+        self.assertRaises(ValueError, inline_scores, "a: 1")
+        self.assertRaises(ValueError, inline_scores, 1)
+        self.assertRaises(ValueError, inline_scores, None)
+        self.assertRaises(ValueError, inline_scores, dict(('s%s' % i, i) for i in range(MAX_INLINE_SCORES + 1)))
+
+    def test_read_scores_prefers_structured_formats(self):
+        output = _zip({'scores.txt': "a: 1\n", 'scores.json': '{"a": 2}'})
+        self.assertEquals(read_scores(output), [(u'a', 2.0)])
+        self.assertEquals(read_scores(_zip({'scores.txt': "a: 1\n"})), [(u'a', 1.0)])
+
+    def test_read_scores_without_scores_file_raises_key_error(self):
+        self.assertRaises(KeyError, read_scores, _zip({'other.txt': "a: 1\n"}))
+
+
+class SaveScoresTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=1, submissions=1, columns=2, computed=1)
+        self.submission = self.synthetic.phase.submissions.get()
+        self.submission.scores.all().delete()
+        self.scoredefs = dict(SubmissionScoreDef.objects.filter(
+            competition=self.synthetic.competition
+        ).values_list('key', 'pk'))
+
+    def _values(self):
+        return dict((key, float(value)) for (key, value) in self.submission.scores.values_list('scoredef__key', 'value'))
+
+    def test_scores_are_saved_and_replaced(self):
+        self.assertEquals(save_scores(self.submission, [('score_1_1', 0.5), ('score_1_2', 0.25)]), 2)
+        self.assertEquals(self._values(), {'score_1_1': 0.5, 'score_1_2': 0.25})
+
+        # Scoring again replaces the values instead of violating the unique constraint
+        self.assertEquals(save_scores(self.submission, [('score_1_1', 0.75)]), 1)
+        self.assertEquals(self._values(), {'score_1_1': 0.75, 'score_1_2': 0.25})
+        self.assertEquals(SubmissionScore.objects.filter(result=self.submission).count(), 2)
+
+    def test_unknown_and_computed_keys_are_skipped(self):
+        self.assertEquals(save_scores(self.submission, [('missing', 1), ('score_1_3', 1), ('score_1_1', 1)]), 1)
+        self.assertEquals(self._values(), {'score_1_1': 1.0})
+
+    def test_leaderboard_version_is_bumped(self):
+        version = PhaseLeaderBoard.objects.get(phase=self.synthetic.phase).version
+        save_scores(self.submission, [('score_1_1', 0.5)])
+        self.assertGreater(PhaseLeaderBoard.objects.get(phase=self.synthetic.phase).version, version)
+
+    def test_query_count_does_not_depend_on_the_number_of_scores(self):
+        def count(scores):
+            SubmissionScore.objects.filter(result=self.submission).delete()
+            connection.use_debug_cursor = True
+            reset_queries()
+            try:
+                save_scores(self.submission, scores)
+                return len(connection.queries)
+            finally:
+                connection.use_debug_cursor = False
+        self.assertEquals(count([('score_1_1', 0.5)]), count([('score_1_1', 0.5), ('score_1_2', 0.25)]))
+
+
+class InlineScoresTaskTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=1, submissions=1, columns=2, computed=0)
+        self.submission = self.synthetic.phase.submissions.get()
+        self.submission.scores.all().delete()
+        self.job = Job.objects.create(task_type='evaluate_submission',
+                                      task_args_json=json.dumps({'submission_id': self.submission.pk}))
+        self.submission.execution_key = json.dumps({'score': self.job.pk})
+        self.submission.status = CompetitionSubmissionStatus.objects.get_or_create(
+            name='running', codename=CompetitionSubmissionStatus.RUNNING)[0]
+        self.submission.save()
+        CompetitionSubmissionStatus.objects.get_or_create(name='failed', codename=CompetitionSubmissionStatus.FAILED)
+
+    def _finish(self, extra):
+        update_submission_task(self.job.pk, {'status': 'finished', 'extra': extra})
+        return self.synthetic.phase.submissions.get()
+
+    def test_inline_scores_are_saved_without_reading_the_output_bundle(self):
+        # The output bundle does not exist, reading it would fail the submission
+        submission = self._finish({'scores': {'score_1_1': 0.5, 'score_1_2': 0.25}})
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.FINISHED)
+        self.assertEquals(sorted(float(v) for v in submission.scores.values_list('value', flat=True)), [0.25, 0.5])
+
+    def test_finished_update_keeps_a_concurrent_final_status(self):
+        def fail_meanwhile(submission):
+            # The submission is marked as failed after the update loaded it
+            transition_submission_status(submission.pk, CompetitionSubmissionStatus.FAILED)
+            return submission_output_filename(submission)
+        with mock.patch('apps.web.tasks.submission_output_filename', side_effect=fail_meanwhile):
+            submission = self._finish({'scores': {'score_1_1': 0.5}})
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.FAILED)
+        self.assertEquals(submission.output_file.name, submission_output_filename(submission))
+
+    def test_missing_inline_scores_fall_back_to_the_output_bundle(self):
+        submission = self._finish({'metadata': {}})
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.FAILED)
+        self.assertEquals(submission.scores.count(), 0)
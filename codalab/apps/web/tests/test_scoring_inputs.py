@@ -0,0 +1,136 @@
+import shutil
+import StringIO
+import tempfile
+import zipfile
+
+import mock
+
+from django.core.cache import get_cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from apps.web import tasks
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import SCORING_INPUTS, CompetitionPhase, CompetitionSubmission, CompetitionSubmissionStatus
+
+
+def _program(metadata):
+    buf = StringIO.StringIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr('metadata', metadata)
+        z.writestr('evaluate.py', "print 'scoring'\n")
+    return ContentFile(buf.getvalue())
+
+
+class ScoringInputsTests(TestCase):
+
+    def setUp(self):
+        # Store the bundles of the test in a temporary directory
+        self.storage_root = tempfile.mkdtemp()
+        storage = FileSystemStorage(location=self.storage_root)
+        for model in (CompetitionPhase, CompetitionSubmission):
+            for field in model._meta.fields:
+                if isinstance(field, models.FileField):
+                    patcher = mock.patch.object(field, 'storage', storage)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='scoring-inputs-tests')
+        cache.clear()
+        patcher = mock.patch('apps.web.models.cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.synthetic = build_competition(participants=1, submissions=1)
+        self.phase = CompetitionPhase.objects.get(pk=self.synthetic.phase.pk)
+        self.phase.reference_data.save('reference.zip', ContentFile('reference'))
+        CompetitionSubmissionStatus.objects.get_or_create(name='submitted',
+                                                          codename=CompetitionSubmissionStatus.SUBMITTED)
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_root)
+
+    def _set_program(self, metadata):
+        self.phase.scoring_program.save('program.zip', _program(metadata))
+        return CompetitionPhase.objects.get(pk=self.phase.pk)
+
+    def test_declared_inputs(self):
+        phase = self._set_program("command: python $program/evaluate.py $input $output\ninputs: [ref, scores]\n")
+        self.assertEquals(phase.scoring_program_inputs(), set(['ref', 'res', 'scores']))
+
+    def test_undeclared_inputs_default_to_all(self):
+        phase = self._set_program("command: python $program/evaluate.py $input $output\n")
+        self.assertEquals(phase.scoring_program_inputs(), set(SCORING_INPUTS))
+
+        phase.scoring_program = None
+        self.assertEquals(phase.scoring_program_inputs(), set(SCORING_INPUTS))
+
+    def test_invalid_program_defaults_to_all(self):
+        self.phase.scoring_program.save('program.zip', ContentFile('not a zip'))
+        phase = CompetitionPhase.objects.get(pk=self.phase.pk)
+        self.assertEquals(phase.scoring_program_inputs(), set(SCORING_INPUTS))
+
+    def test_declaration_is_read_once_per_program(self):
+        phase = self._set_program("inputs: [res]\n")
+        self.assertEquals(phase.scoring_program_inputs(), set(['res']))
+        with mock.patch('apps.web.models.zipfile.ZipFile') as zip_file:
+            self.assertEquals(phase.scoring_program_inputs(), set(['res']))
+            self.assertFalse(zip_file.called)
+
+        # A new program is read again
+        phase = self._set_program("inputs: [res, scores]\n")
+        self.assertEquals(phase.scoring_program_inputs(), set(['res', 'scores']))
+
+    def test_history_is_given_to_programs_declaring_it(self):
+        self.phase.include_history = False
+        phase = self._set_program("inputs: [res, history]\n")
+        self.assertEquals(phase.scoring_program_inputs(), set(['res', 'history']))
+
+    def test_history_of_undeclared_programs_follows_the_phase(self):
+        phase = self._set_program("command: python $program/evaluate.py\n")
+        self.assertIn('history', phase.scoring_program_inputs())
+        phase.include_history = False
+        self.assertNotIn('history', phase.scoring_program_inputs())
+
+    def _score(self):
+        submission = CompetitionSubmission.objects.get(phase=self.phase)
+        submission.file.save('submission.zip', ContentFile('results'))
+        submission.execution_key = ''
+        with mock.patch('apps.web.tasks.getQueue'), override_settings(BUNDLE_AZURE_CONTAINER='bundles',
+                                                                      SBS_RESPONSE_QUEUE='response',
+                                                                      SBS_COMPUTE_QUEUE='compute'):
+            with mock.patch('apps.web.tasks.coopetition.coopetition_zip', return_value='') as coopetition_zip:
+                tasks.score(submission, 1)
+        submission = CompetitionSubmission.objects.get(pk=submission.pk)
+        submission.inputfile.open()
+        try:
+            lines = submission.inputfile.read().split('\n')
+        finally:
+            submission.inputfile.close()
+        return (submission, dict(line.split(': ', 1) for line in lines), coopetition_zip)
+
+    def test_score_skips_undeclared_inputs(self):
+        self._set_program("inputs: [res, scores]\n")
+        (submission, inputs, coopetition_zip) = self._score()
+        self.assertEquals(sorted(key for key in SCORING_INPUTS if key in inputs), ['res', 'scores'])
+        self.assertFalse(coopetition_zip.called)
+        self.assertFalse(submission.history_file)
+        self.assertFalse(submission.coopetition_file)
+        self.assertTrue(submission.scores_file)
+
+    def test_score_gives_every_input_by_default(self):
+        self._set_program("command: python $program/evaluate.py $input $output\n")
+        (submission, inputs, coopetition_zip) = self._score()
+        self.assertEquals(sorted(key for key in SCORING_INPUTS if key in inputs), sorted(SCORING_INPUTS))
+        self.assertTrue(coopetition_zip.called)
+        self.assertTrue(submission.history_file)
+        self.assertEquals(inputs['coopetition'], submission.coopetition_file.name)
+
+    def test_score_skips_the_history_unless_included(self):
+        self.phase.include_history = False
+        self._set_program("command: python $program/evaluate.py\n")
+        (submission, inputs, coopetition_zip) = self._score()
+        self.assertNotIn('history', inputs)
+        self.assertFalse(submission.history_file)
@@ -10,6 +10,7 @@ from apps.web.models import (Competition,
                              CompetitionParticipant,
                              CompetitionPhase,
                              CompetitionSubmission,
+                             CompetitionSubmissionCounter,
                              CompetitionSubmissionStatus,
                              ParticipantStatus,
                              PhaseLeaderBoard,
@@ -64,3 +65,10 @@ class SubmissionMarkAsFailedTests(TestCase):
         self.assertEquals(resp.status_code, 200)
         submission = CompetitionSubmission.objects.get(pk=self.submission_1.pk)
         self.assertEquals(submission.status.codename, "failed")
+
+    def test_mark_as_failed_counts_the_failure_once(self):
+        counter = CompetitionSubmissionCounter.objects.get(phase=self.phase_1, participant=self.participant_1)
+        self.client.login(username="organizer", password="pass")
+        self.client.post(self.url)
+        self.client.post(self.url)
+        self.assertEquals(CompetitionSubmissionCounter.objects.get(pk=counter.pk).failed_count, 1)
@@ -0,0 +1,97 @@
+import datetime
+import mock
+
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.test import TestCase
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import (CompetitionSubmission,
+                             CompetitionSubmissionCounter,
+                             CompetitionSubmissionStatus,
+                             transition_submission_status)
+
+
+class SubmissionQuotaTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=1, submissions=2)
+        self.phase = self.synthetic.phase
+        self.phase.max_submissions = 100
+        self.phase.max_submissions_per_day = 999
+        self.phase.save()
+        self.participant = self.synthetic.competition.participants.get()
+        CompetitionSubmissionStatus.objects.get_or_create(name='failed', codename=CompetitionSubmissionStatus.FAILED)
+
+    def _submit(self, **kwargs):
+        submission = CompetitionSubmission(participant=self.participant, phase=self.phase)
+        submission.save(**kwargs)
+        return submission
+
+    def _counter(self):
+        return CompetitionSubmissionCounter.objects.get(phase=self.phase, participant=self.participant)
+
+    def test_numbering_continues_after_existing_submissions(self):
+        self.assertEquals(self._submit().submission_number, 3)
+        self.assertEquals(self._submit().submission_number, 4)
+        self.assertEquals(self._counter().next_number, 5)
+
+    def test_numbers_are_not_reused(self):
+        submission = self._submit()
+        submission.delete()
+        self.assertEquals(self._submit().submission_number, submission.submission_number + 1)
+
+    def test_max_submissions(self):
+        self.phase.max_submissions = 3
+        self.phase.save()
+        self._submit()
+        self.assertRaises(PermissionDenied, self._submit)
+        # The refused submission does not consume a number
+        self.assertEquals(self._counter().next_number, 4)
+        self.assertEquals(self._submit(ignore_submission_limits=True).submission_number, 4)
+
+    def test_forced_submissions_keep_their_number(self):
+        submission = CompetitionSubmission(participant=self.participant, phase=self.phase, submission_number=10)
+        submission.save(ignore_submission_limits=True)
+        self.assertEquals(submission.submission_number, 10)
+        # Numbers in use are skipped and the next submissions are numbered after it
+        submission = CompetitionSubmission(participant=self.participant, phase=self.phase, submission_number=2)
+        submission.save(ignore_submission_limits=True)
+        self.assertEquals(submission.submission_number, 3)
+        self.assertEquals(self._submit().submission_number, 11)
+
+    def test_submitting_in_a_transaction_keeps_it_open(self):
+        with mock.patch('apps.web.models.transaction.commit') as commit:
+            with transaction.commit_on_success():
+                self._submit()
+                self.assertFalse(commit.called)
+
+    def test_failed_submissions_are_not_counted(self):
+        self.phase.max_submissions = 3
+        self.phase.save()
+        submission = self._submit()
+        transition_submission_status(submission.pk, CompetitionSubmissionStatus.FAILED)
+        self.assertEquals(self._counter().failed_count, 1)
+        self.assertEquals(self._submit().submission_number, 4)
+
+    def test_deleted_submissions_are_not_counted(self):
+        failed = self._submit()
+        transition_submission_status(failed.pk, CompetitionSubmissionStatus.FAILED)
+        self._submit()
+        self.assertEquals((self._counter().failed_count, self._counter().day_count), (1, 4))
+        failed.delete()
+        self.assertEquals((self._counter().failed_count, self._counter().day_count), (0, 3))
+
+    def test_max_submissions_per_day(self):
+        self.phase.max_submissions_per_day = 3
+        self.phase.save()
+        # The fixture submissions were made today
+        self._submit()
+        self.assertRaises(PermissionDenied, self._submit)
+
+        # The daily count starts over the next day
+        CompetitionSubmissionCounter.objects.filter(pk=self._counter().pk).update(
+            day=datetime.date.today() - datetime.timedelta(days=1)
+        )
+        self._submit()
+        self.assertEquals(self._counter().day_count, 1)
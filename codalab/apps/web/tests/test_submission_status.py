@@ -0,0 +1,82 @@
+import mock
+
+from django.db import connection, reset_queries
+from django.test import TestCase
+
+from apps.web.benchmarks.fixtures import build_competition
+from apps.web.models import (CompetitionSubmission, CompetitionSubmissionStatus, PhaseLeaderBoard,
+                             transition_submission_status)
+from apps.web.signals import submission_status_changed
+
+
+class SubmissionStatusTransitionTests(TestCase):
+
+    def setUp(self):
+        self.synthetic = build_competition(participants=1, submissions=1)
+        for codename in (CompetitionSubmissionStatus.SUBMITTED, CompetitionSubmissionStatus.RUNNING,
+                         CompetitionSubmissionStatus.FAILED, CompetitionSubmissionStatus.FINISHED):
+            CompetitionSubmissionStatus.objects.get_or_create(name=codename, codename=codename)
+        self.submission = self.synthetic.phase.submissions.get()
+        CompetitionSubmission.objects.filter(pk=self.submission.pk).update(
+            status=CompetitionSubmissionStatus.objects.get(codename=CompetitionSubmissionStatus.SUBMITTED),
+            started_at=None,
+            completed_at=None,
+        )
+        self.received = []
+        submission_status_changed.connect(self._receive)
+        self.addCleanup(submission_status_changed.disconnect, self._receive)
+
+    def _receive(self, sender, **kwargs):
+        self.received.append((kwargs['submission_id'], kwargs['status']))
+
+    def _submission(self):
+        return CompetitionSubmission.objects.get(pk=self.submission.pk)
+
+    def test_transitions_set_timestamps(self):
+        self.assertTrue(transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.RUNNING))
+        submission = self._submission()
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.RUNNING)
+        self.assertIsNotNone(submission.started_at)
+        self.assertIsNone(submission.completed_at)
+
+        self.assertTrue(transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.FINISHED))
+        submission = self._submission()
+        self.assertEquals(submission.status.codename, CompetitionSubmissionStatus.FINISHED)
+        self.assertIsNotNone(submission.completed_at)
+        self.assertEquals(self.received, [(self.submission.pk, CompetitionSubmissionStatus.RUNNING),
+                                          (self.submission.pk, CompetitionSubmissionStatus.FINISHED)])
+
+    def test_final_states_are_not_left(self):
+        self.assertTrue(transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.FAILED))
+        self.assertFalse(transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.RUNNING))
+        self.assertFalse(transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.FINISHED))
+        self.assertEquals(self._submission().status.codename, CompetitionSubmissionStatus.FAILED)
+        self.assertEquals(self.received, [(self.submission.pk, CompetitionSubmissionStatus.FAILED)])
+
+    def test_unknown_status_raises(self):
+        self.assertRaises(CompetitionSubmissionStatus.DoesNotExist,
+                          transition_submission_status, self.submission.pk, 'no-such-status')
+
+    def test_save_side_effects_are_skipped(self):
+        connection.use_debug_cursor = True
+        reset_queries()
+        try:
+            with mock.patch.object(CompetitionSubmission, 'save') as save:
+                transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.RUNNING)
+                self.assertFalse(save.called)
+            self.assertEquals(len(connection.queries), 2)
+        finally:
+            connection.use_debug_cursor = False
+
+    def test_final_transitions_invalidate_the_leaderboards(self):
+        def version():
+            return PhaseLeaderBoard.objects.get(phase=self.synthetic.phase).version
+        before = version()
+        transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.RUNNING)
+        self.assertEquals(version(), before)
+        transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.FINISHED)
+        self.assertGreater(version(), before)
+
+        before = version()
+        transition_submission_status(self.submission.pk, CompetitionSubmissionStatus.FAILED, override_final=True)
+        self.assertGreater(version(), before)
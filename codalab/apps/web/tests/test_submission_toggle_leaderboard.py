@@ -72,6 +72,11 @@ class SubmissionToggleLeaderboardTests(TestCase):
 
         add_submission_to_leaderboard(self.submission_2)
 
+        # Stale leaderboard snapshots are rebuilt by the site workers
+        patcher = mock.patch('apps.jobs.models.getQueue')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         self.client = Client()
         self.url = reverse("competitions:submission_toggle_leaderboard", kwargs={"submission_pk": self.submission_1.pk})
 
@@ -1,7 +1,9 @@
 import datetime
+import json
 import mock
 
 from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
 from django.test import TestCase
 from django.test.client import Client
 from django.contrib.auth import get_user_model
@@ -14,6 +16,7 @@ from apps.web.models import (Competition,
                              ParticipantStatus,
                              PhaseLeaderBoard,
                              PhaseLeaderBoardEntry)
+from apps.web.benchmarks.fixtures import build_competition
 
 User = get_user_model()
 
@@ -40,6 +43,7 @@ class CompetitionSubmissionAdminPageTests(TestCase):
         self.client.login(username="organizer", password="pass")
         resp = self.client.get(self.url)
         self.assertEquals(resp.status_code, 200)
+        self.assertContains(resp, reverse("competitions:submission_delete", kwargs={"pk": 0}))
 
     def test_submissions_view_as_owner_returns_200(self):
         self.client.login(username="other_admin", password="pass")
@@ -56,6 +60,46 @@ class CompetitionSubmissionAdminPageTests(TestCase):
         self.assertEquals(resp.status_code, 302)
 
 
+class CompetitionSubmissionAdminPageScoresTests(TestCase):
+    def _get(self, synthetic):
+        client = Client()
+        client.login(username=synthetic.organizer.username, password=synthetic.password)
+        url = reverse("my_competition_submissions_data", kwargs={"competition_id": synthetic.competition.pk})
+        return client.get("%s?phase=%s&per_page=500" % (url, synthetic.phase.pk))
+
+    def _count_queries(self, synthetic):
+        synthetic.phase.leaderboard_snapshot()
+        connection.use_debug_cursor = True
+        reset_queries()
+        try:
+            resp = self._get(synthetic)
+            return resp, len(connection.queries)
+        finally:
+            connection.use_debug_cursor = False
+
+    def test_main_score_is_shown_for_submissions_on_the_leaderboard(self):
+        synthetic = build_competition(participants=3, submissions=2)
+        resp = self._get(synthetic)
+        self.assertEquals(resp.status_code, 200)
+
+        rows = synthetic.phase.index_leaderboard_rows(synthetic.phase.leaderboard_snapshot())
+        submission_info_list = json.loads(resp.content)['results']
+        self.assertEquals(len(submission_info_list), 6)
+        for info in submission_info_list:
+            if info['is_in_leaderboard']:
+                self.assertEquals(info['score_0'], rows[info['id']][0]['main_score'])
+            else:
+                self.assertNotIn('score_0', info)
+        self.assertEquals(len([info for info in submission_info_list if info['is_in_leaderboard']]), 3)
+
+    def test_query_count_does_not_depend_on_submission_count(self):
+        resp, small_count = self._count_queries(build_competition(participants=3, submissions=2))
+        self.assertEquals(resp.status_code, 200)
+        resp, large_count = self._count_queries(build_competition(participants=30, submissions=2))
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(small_count, large_count)
+
+
 class CompetitionSubmissionDeleteTests(TestCase):
     def setUp(self):
         self.organizer = User.objects.create_user(username="organizer", password="pass")
@@ -19,6 +19,12 @@ partials_patterns = patterns(
 urlpatterns = patterns(
     '',
     url(r'^$', views.my_index, name='competitions'),
+    url(r'^competition/(?P<competition_id>\d+)/participants/data$',
+        views.MyCompetitionParticipantsData.as_view(),
+        name='my_competition_participants_data'),
+    url(r'^competition/(?P<competition_id>\d+)/submissions/data$',
+        views.MyCompetitionSubmissionsData.as_view(),
+        name='my_competition_submissions_data'),
     url(r'^competition/(?P<competition_id>\d+)/participants/',
         views.MyCompetitionParticipantView.as_view(),
         name='my_competition_participants'),
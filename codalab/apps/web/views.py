@@ -1,4 +1,3 @@
-import csv
 import datetime
 import json
 import os
@@ -32,12 +31,15 @@ from django.views.generic import View, TemplateView, DetailView, ListView, Updat
 
 from mimetypes import MimeTypes
 
+from apps.web import exports
 from apps.web import forms
+from apps.web import grids
 from apps.web import models
 from apps.web import tasks
 from apps.coopetitions.models import Like, Dislike
 from apps.forums.models import Forum
 from apps.common.competition_utils import get_most_popular_competitions, get_featured_competitions
+from apps.common.params import parse_bool
 from tasks import evaluate_submission
 
 
@@ -156,14 +158,36 @@ def my_index(request):
     return HttpResponse(template.render(RequestContext(request, context_dict)))
 
 
-def sort_data_table(request, context, list):
-    context['order'] = order = request.GET.get('order') if 'order' in request.GET else 'id'
-    context['direction'] = direction = request.GET.get('direction') if 'direction' in request.GET else 'asc'
-    reverse = direction == 'desc'
+def get_managed_competition(user, competition_id):
+    """
+    Returns the competition if the user is its creator or one of its administrators.
+
+    :raises Http404: When the competition does not exist or the user does not manage it.
+    """
+    try:
+        competition = models.Competition.objects.get(pk=competition_id)
+    except models.Competition.DoesNotExist:
+        raise Http404()
+    if user.id != competition.creator_id and not competition.admins.filter(pk=user.id).exists():
+        raise Http404()
+    return competition
 
-    def sortkey(x):
-        return x[order] if order in x and x[order] is not None else ''
-    list.sort(key=sortkey, reverse=reverse)
+
+def get_selected_phase(competition, phase_id=None):
+    """Returns the phase with the given id, or the active phase (the first one when none is active)."""
+    if phase_id:
+        try:
+            return competition.phases.get(pk=phase_id)
+        except (models.CompetitionPhase.DoesNotExist, ValueError):
+            raise Http404()
+    phases = list(competition.phases.all())
+    if not phases:
+        raise Http404()
+    selected_phase = phases[0]
+    for phase in phases:
+        if phase.is_active:
+            selected_phase = phase
+    return selected_phase
 
 
 #
@@ -571,7 +595,7 @@ class CompetitionResultsPage(TemplateView):
             context['competition_admins'] = competition.admins.all()
             context['is_owner'] = is_owner
             context['phase'] = phase
-            context['groups'] = phase.scores()
+            context['groups'] = phase.leaderboard_snapshot()
             user = self.request.user
 
             # Will allow creator and admin to see Leaderboard in advanced
@@ -659,7 +683,7 @@ class CompetitionResultsDownload(View):
         phase = competition.phases.get(pk=self.kwargs['phase'])
         if phase.is_blind:
             return HttpResponse(status=403)
-        response = HttpResponse(competition.get_results_csv(phase.pk), status=200, content_type="text/csv")
+        response = StreamingHttpResponse(competition.iter_results_csv(phase.pk), status=200, content_type="text/csv")
         response["Content-Disposition"] = "attachment; filename=%s results.csv" % phase.competition.title
         return response
 
@@ -672,61 +696,16 @@ class CompetitionCompleteResultsDownload(View):
         phase = competition.phases.get(pk=self.kwargs['phase'])
         if phase.is_blind:
             return HttpResponse(status=403)
-        groups = phase.scores(include_scores_not_on_leaderboard=True)
-        leader_board = models.PhaseLeaderBoard.objects.get(phase=phase)
-
-        csvfile = StringIO.StringIO()
-        csvwriter = csv.writer(csvfile)
-
-        for group in groups:
-            csvwriter.writerow([group['label'].encode("utf-8")])
-            csvwriter.writerow([])
-
-            headers = ["User"]
-            sub_headers = [""]
-            for header in group['headers']:
-                subs = header['subs']
-                if subs:
-                    for sub in subs:
-                        headers.append(header['label'].encode("utf-8"))
-                        sub_headers.append(sub['label'].encode("utf-8"))
-                else:
-                    headers.append(header['label'].encode("utf-8"))
-            headers.append('Description')
-            headers.append('Date')
-            headers.append('Filename')
-            headers.append('Is on leaderboard?')
-            csvwriter.writerow(headers)
-            csvwriter.writerow(sub_headers)
-
-            if len(group['scores']) <= 0:
-                csvwriter.writerow(["No data available"])
-            else:
-                leader_board_entries = models.PhaseLeaderBoardEntry.objects.filter(board=leader_board).values_list('result__id', flat=True)
-
-                for pk, scores in group['scores']:
-                    submission = models.CompetitionSubmission.objects.get(pk=scores['id'])
-                    row = [scores['username']]
-                    for v in scores['values']:
-                        if 'rnk' in v:
-                            row.append("%s (%s)" % (v['val'], v['rnk']))
-                        else:
-                            row.append("%s (%s)" % (v['val'], v['hidden_rnk']))
-
-                    row.append(submission.description)
-                    row.append(submission.submitted_at)
-                    row.append(submission.get_filename())
+        groups = phase.leaderboard_snapshot(include_scores_not_on_leaderboard=True)
 
-                    is_on_leaderboard = submission.pk in leader_board_entries
-                    row.append(is_on_leaderboard)
+        # Submission details are read in bulk instead of once per row
+        submissions = dict((s.pk, s) for s in phase.submissions.filter(
+            status__codename=models.CompetitionSubmissionStatus.FINISHED
+        ))
+        leaderboard_ids = set(models.PhaseLeaderBoardEntry.objects.filter(board__phase=phase).values_list('result_id', flat=True))
 
-                    row = [unicode(r).encode("utf-8") for r in row]
-                    csvwriter.writerow(row)
-
-            csvwriter.writerow([])
-            csvwriter.writerow([])
-
-        response = HttpResponse(csvfile.getvalue(), status=200, content_type="text/csv")
+        rows = exports.complete_results_rows(groups, submissions, leaderboard_ids)
+        response = StreamingHttpResponse(exports.csv_lines(rows), status=200, content_type="text/csv")
         response["Content-Disposition"] = "attachment; filename=competition_results.csv"
         return response
 
@@ -738,65 +717,24 @@ class MyIndex(LoginRequiredMixin):
 
 
 class MyCompetitionParticipantView(LoginRequiredMixin, ListView):
-    """View that returns all participants from a competition."""
+    """
+    View of the participants of a competition.
+
+    Only the pending participation requests are rendered, the table of participants is loaded
+    page by page from :class:`MyCompetitionParticipantsData`.
+    """
     queryset = models.CompetitionParticipant.objects.all()
     template_name = 'web/my/participants.html'
 
     def get_context_data(self, **kwargs):
         context = super(MyCompetitionParticipantView, self).get_context_data(**kwargs)
-        # create column definition
-        columns = [
-            {
-                'label': '#',
-                'name': 'number'
-            },
-            {
-                'label': 'NAME',
-                'name': 'name'
-            },
-            {
-                'label': 'EMAIL',
-                'name': 'email'
-            },
-            {
-                'label': 'STATUS',
-                'name': 'status'
-            },
-            {
-                'label': 'ENTRIES',
-                'name': 'entries'
-            }
-        ]
-        try:
-            competition = models.Competition.objects.get(pk=self.kwargs.get('competition_id'))
-        except models.Competition.DoesNotExist:
-            raise Http404()
-
-        if competition.creator != self.request.user and self.request.user not in competition.admins.all():
-            raise Http404()
-
-        context['columns'] = columns
-        # retrieve participant submissions information
-        participant_list = []
-        competition_participants = self.queryset.filter(competition=competition)
-        competition_participants_ids = list(participant.id for participant in competition_participants)
-        context['pending_participants'] = filter(lambda participant_submission: participant_submission.status.codename == models.ParticipantStatus.PENDING, competition_participants)
-        participant_submissions = models.CompetitionSubmission.objects.filter(participant__in=competition_participants_ids)
-        for number, participant in enumerate(competition_participants):
-            participant_entry = {
-                'pk': participant.pk,
-                'name': participant.user.username,
-                'email': participant.user.email,
-                'user_pk': participant.user.pk,
-                'status': participant.status.codename,
-                'number': number + 1,
-                # equivalent to assigning participant.submissions.count() but without several multiple db queires
-                'entries': len(filter(lambda participant_submission: participant_submission.participant.id == participant.id, participant_submissions))
-            }
-            participant_list.append(participant_entry)
-        # order results
-        sort_data_table(self.request, context, participant_list)
-        context['participant_list'] = participant_list
+        competition = get_managed_competition(self.request.user, self.kwargs.get('competition_id'))
+        context['columns'] = [c.as_dict() for c in grids.ParticipantGrid(competition, self.request.GET).get_columns()]
+        context['participant_count'] = self.object_list.count()
+        context['pending_participants'] = self.object_list.filter(
+            status__codename=models.ParticipantStatus.PENDING
+        ).select_related('user', 'status')
+        context['participant_statuses'] = models.ParticipantStatus.objects.all()
         context['competition_id'] = self.kwargs.get('competition_id')
         return context
 
@@ -804,6 +742,20 @@ class MyCompetitionParticipantView(LoginRequiredMixin, ListView):
         return self.queryset.filter(competition=self.kwargs.get('competition_id'))
 
 
+class MyCompetitionParticipantsData(LoginRequiredMixin, View):
+    """
+    Returns a page of the participants table as JSON, see :class:`apps.web.grids.ParticipantGrid`
+    for the query string parameters.
+
+    .. note::
+
+        Requires an authenticated user who is an administrator of the competition."""
+    def get(self, request, *args, **kwargs):
+        competition = get_managed_competition(request.user, kwargs['competition_id'])
+        grid = grids.ParticipantGrid(competition, request.GET)
+        return HttpResponse(json.dumps(grid.data()), content_type="application/json")
+
+
 # Partials
 
 class CompetitionIndexPartial(TemplateView):
@@ -954,6 +906,8 @@ class MyCompetitionSubmissionDetailedResults(TemplateView):
 class MyCompetitionSubmissionsPage(LoginRequiredMixin, TemplateView):
     """Serves the table of submissions in the submissions competition administration.
 
+    The rows are loaded page by page from :class:`MyCompetitionSubmissionsData`.
+
     .. note::
 
         Requires an authenticated user who is an administrator of the competition."""
@@ -962,108 +916,45 @@ class MyCompetitionSubmissionsPage(LoginRequiredMixin, TemplateView):
     template_name = 'web/my/submissions.html'
 
     def get_context_data(self, **kwargs):
-        phase_id = self.request.GET.get('phase')
         context = super(MyCompetitionSubmissionsPage, self).get_context_data(**kwargs)
-        competition = models.Competition.objects.get(pk=self.kwargs['competition_id'])
+        competition = get_managed_competition(self.request.user, self.kwargs['competition_id'])
         context['competition'] = competition
 
-        if self.request.user.id != competition.creator_id and self.request.user not in competition.admins.all():
-            raise Http404()
-
-        # find the active phase
-        if (phase_id != None):
-            context['selected_phase_id'] = int(phase_id)
-            active_phase = competition.phases.filter(id=phase_id)[0]
-        else:
-            phases = list(competition.phases.all())
-            active_phase = phases[0]
-            for phase in phases:
-                if phase.is_active:
-                    context['selected_phase_id'] = phase.id
-                    active_phase = phase
-
+        active_phase = get_selected_phase(competition, self.request.GET.get('phase'))
+        context['selected_phase_id'] = active_phase.id
         context['selected_phase'] = active_phase
+        context['phase'] = active_phase
 
-        submissions = models.CompetitionSubmission.objects.filter(phase=active_phase).select_related('participant', 'participant__user', 'status')
-        # find which submissions are in the leaderboard, if any and only if phase allows seeing results.
-        leaderboard_entries = list(models.PhaseLeaderBoardEntry.objects.filter(board__phase__competition=competition))
-        id_of_submissions_in_leaderboard = [e.result.id for e in leaderboard_entries if e.result in submissions]
-        # create column definition
-        columns = [
-            {
-                'label': 'SUBMITTED',
-                'name': 'submitted_at'
-            },
-            {
-                'label': 'SUBMITTED BY',
-                'name': 'submitted_by'
-            },
-            {
-                'label': 'SUBMISSION ID',
-                'name': 'submission_pk'
-            },
-            {
-                'label': 'FILENAME',
-                'name': 'filename'
-            },
-            {
-                'label': 'STATUS',
-                'name': 'status_name'
-            },
-            {
-                'label': 'LEADERBOARD',
-                'name': 'is_in_leaderboard'
-            },
-        ]
-        scores = active_phase.scores()
-        for score_group_index, score_group in enumerate(scores):
-            column = {
-                'label': score_group['label'],
-                'name': 'score_' + str(score_group_index),
-            }
-            columns.append(column)
-        # map submissions to view data
-        submission_info_list = []
-        for submission in submissions:
-            submission_info = {
-                'id': submission.id,
-                'submitted_by': submission.participant.user.username,
-                'user_pk': submission.participant.user.pk,
-                'number': submission.submission_number,
-                'filename': submission.get_filename(),
-                'submitted_at': submission.submitted_at,
-                'status_name': submission.status.name,
-                'is_in_leaderboard': submission.id in id_of_submissions_in_leaderboard,
-                'exception_details': submission.exception_details,
-                'description': submission.description,
-                'is_public': submission.is_public,
-                'submission_pk': submission.id,
-                'is_migrated': submission.is_migrated
-            }
-            # add score groups into data columns
-            if (submission_info['is_in_leaderboard'] == True):
-                for score_group_index, score_group in enumerate(scores):
-                    user_score = filter(lambda user_score: user_score[1]['username'] == submission.participant.user.username, score_group['scores'])[0]
-                    main_score = filter(lambda main_score: main_score['name'] == score_group['selection_key'], user_score[1]['values'])[0]
-                    submission_info['score_' + str(score_group_index)] = main_score['val']
-            submission_info_list.append(submission_info)
-        # order results
-        sort_data_table(self.request, context, submission_info_list)
-        # complete context
-        context['columns'] = columns
-        context['submission_info_list'] = submission_info_list
+        grid = grids.SubmissionGrid(active_phase, self.request.GET)
+        context['columns'] = [c.as_dict() for c in grid.get_columns()]
+        context['submission_count'] = active_phase.submissions.count()
+        context['submission_statuses'] = models.CompetitionSubmissionStatus.objects.all()
 
         # We need a way to check if next phase.auto_migration = True
         try:
-            next_phase = competition.phases.get(phasenumber=submission.phase.phasenumber+1)
+            next_phase = competition.phases.get(phasenumber=active_phase.phasenumber + 1)
             context['next_phase'] = next_phase.auto_migration
-        except Exception:
-            sys.exc_clear()
-        context['phase'] = active_phase
+        except models.CompetitionPhase.DoesNotExist:
+            pass
 
         return context
 
 
+class MyCompetitionSubmissionsData(LoginRequiredMixin, View):
+    """
+    Returns a page of the submissions table of a phase as JSON, see
+    :class:`apps.web.grids.SubmissionGrid` for the query string parameters.
+
+    .. note::
+
+        Requires an authenticated user who is an administrator of the competition."""
+    def get(self, request, *args, **kwargs):
+        competition = get_managed_competition(request.user, kwargs['competition_id'])
+        phase = get_selected_phase(competition, request.GET.get('phase'))
+        grid = grids.SubmissionGrid(phase, request.GET)
+        return HttpResponse(json.dumps(grid.data()), content_type="application/json")
+
+
 class VersionView(TemplateView):
     template_name = 'web/project_version.html'
 
@@ -1474,8 +1365,9 @@ def submission_mark_as_failed(request, submission_pk):
             competition = submission.phase.competition
             if request.user.id != competition.creator_id and request.user not in competition.admins.all():
                 raise Http404()
-            submission.status = models.CompetitionSubmissionStatus.objects.get(codename="failed")
-            submission.save()
+            # Counts the failure in the submission quota of the participant
+            models.transition_submission_status(submission.pk, models.CompetitionSubmissionStatus.FAILED,
+                                                override_final=True)
             return HttpResponse()
         except models.CompetitionSubmission.DoesNotExist:
             raise Http404()
@@ -1511,6 +1403,7 @@ def submission_toggle_leaderboard(request, submission_pk):
                 )
                 for entry in entries:
                     entry.delete()
+            tasks.refresh_leaderboard_snapshot(submission.phase)
 
             return HttpResponse()
         except models.CompetitionSubmission.DoesNotExist:
@@ -1521,7 +1414,8 @@ def submission_toggle_leaderboard(request, submission_pk):
 @login_required
 def submission_re_run(request, submission_pk):
     """
-    Allows to re-submit a submission.
+    Allows to re-submit a submission. The results of an identical evaluation are reused unless
+    the ``force`` parameter is set.
 
     :param submission_pk: Submission's primary key.
     """
@@ -1539,7 +1433,8 @@ def submission_re_run(request, submission_pk):
             )
             new_submission.save(ignore_submission_limits=True)
 
-            evaluate_submission(new_submission.pk, submission.phase.is_scoring_only)
+            evaluate_submission(new_submission.pk, submission.phase.is_scoring_only,
+                                force=parse_bool(request.POST.get('force'), False))
 
             return HttpResponse()
         except models.CompetitionSubmission.DoesNotExist:
@@ -1550,7 +1445,8 @@ def submission_re_run(request, submission_pk):
 @login_required
 def submission_migrate(request, pk):
     '''
-    Allow to migrate to submissions manually to next phase.
+    Allow to migrate to submissions manually to next phase. The results of an identical
+    evaluation are reused unless the ``force`` parameter is set.
 
     :param submission_pk: Submission's primary key.
     '''
@@ -1571,7 +1467,8 @@ def submission_migrate(request, pk):
 
             new_submission.save(ignore_submission_limits=True)
 
-            evaluate_submission(new_submission.pk, submission.phase.is_scoring_only)
+            evaluate_submission(new_submission.pk, submission.phase.is_scoring_only,
+                                force=parse_bool(request.POST.get('force'), False))
             submission.is_migrated = True
             submission.save()
 
@@ -3,6 +3,7 @@ Common utilities to interact with Azure Storage.
 """
 
 import datetime
+import email.utils
 import os.path
 import re
 import itertools
@@ -88,6 +89,27 @@ class AzureStorage(Storage):
     def size(self, name):
         return self.properties(name)["content-length"]
 
+    def modified_time(self, name):
+        modified = email.utils.parsedate_tz(self.properties(name)["last-modified"])
+        return datetime.datetime.fromtimestamp(email.utils.mktime_tz(modified))
+
+    def listdir(self, path):
+        prefix = clean_name(path).rstrip("/") + "/" if path else ""
+        directories, files = set(), []
+        marker = None
+        while True:
+            blobs = self.connection.list_blobs(self.azure_container, prefix=prefix, marker=marker)
+            for blob in blobs:
+                rest = blob.name[len(prefix):]
+                if "/" in rest:
+                    directories.add(rest.split("/", 1)[0])
+                else:
+                    files.append(rest)
+            marker = blobs.next_marker
+            if not marker:
+                break
+        return list(directories), files
+
     def get_available_name(self, name):
         dir_path, file_name = os.path.split(name)
         name = clean_name(name)
@@ -300,6 +300,18 @@ class Base(Settings):
             'LOCATION': '127.0.0.1:11211',
         }
     }
+    # Leaderboard results are cached per version of the leaderboard, see apps.web.models.PhaseLeaderBoard
+    LEADERBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+    # Inputs declared by scoring programs are cached per program file, see apps.web.models.CompetitionPhase
+    SCORING_PROGRAM_CACHE_TIMEOUT = 60 * 60 * 24
+    # Digests of the bundles are cached by bundle name, see apps.web.evaluations
+    BUNDLE_DIGEST_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+    # Superseded coopetition bundles are kept for this many seconds, see apps.web.coopetition
+    COOPETITION_ARTIFACT_GRACE_PERIOD = 60 * 60 * 24
+    # Compute workers run the prediction and scoring runs of code submissions as one task, all
+    # the compute workers must support the score_bundle_id task argument. Phases whose scoring
+    # programs read the history, scores or coopetition inputs are still run as two tasks
+    COMPUTE_WORKER_FUSED_EXECUTION = False
 
     # A sample logging configuration. The only tangible logging
     # performed by this configuration is to send an email to
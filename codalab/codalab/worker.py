@@ -25,6 +25,7 @@ from apps.web.tasks import (echo_task,
                             create_competition_task,
                             evaluate_submission_task,
                             update_submission_task,
+                            refresh_leaderboard_snapshot_task,
                             send_mass_email_task)
 
 logger = logging.getLogger('codalab')
@@ -40,6 +41,7 @@ def start_worker():
         'create_competition': create_competition_task,
         'evaluate_submission': evaluate_submission_task,
         'run_update': update_submission_task,
+        'refresh_leaderboard_snapshot': refresh_leaderboard_snapshot_task,
         'send_mass_email': send_mass_email_task
     }
     worker = BaseWorker(queue, vtable, logger)
@@ -107,21 +107,30 @@ class BaseWorker(object):
     the task then goes back to listening mode.
     """
 
-    def __init__(self, queue, vtable, logger):
+    def __init__(self, queue, vtable, logger, admit=None, admit_interval=10):
         """
         queue: The Queue object to listen to.
         vtable: A map from a task type to a function which contructs a runnable task. Given a
             message with an identifier I, a task type T and task arguments A, the function
             constructed to run the task is: F = vtable[T](I, A). And F() runs the task.
         logger: The logging.Logger object to use.
+        admit: An optional function returning whether the worker can take a new task now. The
+            worker waits admit_interval seconds before asking again, without receiving messages.
         """
         self.queue = queue
         self.logger = logger
         self.vtable = vtable
+        self.admit = admit
+        self.admit_interval = admit_interval
 
     def _message_receive_listen(self, queue):
         while True:
             try:
+                if self.admit is not None and not self.admit():
+                    self.logger.debug("Waiting for resources.")
+                    queue.put('waiting for resources')
+                    time.sleep(self.admit_interval)
+                    continue
                 self.logger.debug("Waiting for message.")
                 queue.put('waiting for message')
                 msg = self.queue.receive_message()
@@ -1,10 +1,22 @@
 """
 Defines unit tests for this package.
 """
+import azure
+import hashlib
+import json
+import mock
 import os
+import shutil
+import StringIO
+import tempfile
+import threading
 from unittest import TestCase
+from zipfile import ZipFile
 
-from codalabtools.compute.worker import WorkerConfig
+from codalabtools.compute import worker
+from codalabtools.compute.worker import (BundleCache, WorkerConfig, get_run_func, getBundle, _has_free_resources,
+                                         _read_scores, _slot_cpus, _upload, MAX_INLINE_SCORES,
+                                         PREDICT_CACHED_BUNDLES, SCORE_CACHED_BUNDLES)
 
 class ComputeConfigTests(TestCase):
     """Tests for WorkerConfig."""
@@ -29,6 +41,11 @@ class ComputeConfigTests(TestCase):
         self.assertEqual("your account key", cfg.getAzureStorageAccountKey())
         self.assertEqual("your account name", cfg.getAzureStorageAccountName())
         self.assertEqual("D:\\Temp", cfg.getLocalRoot())
+        self.assertEqual("D:\\Cache", cfg.getLocalCacheRoot())
+        self.assertEqual(20 * 1024 ** 3, cfg.getLocalCacheSizeLimit())
+        self.assertEqual(1, cfg.getSlotCount())
+        self.assertFalse(cfg.getSlotCpuPinning())
+        self.assertEqual("D:\\Temp", cfg.getSlotLocalRoot(0))
         log_cfg_expected = {
             'version': 1,
             'formatters': {
@@ -57,3 +74,475 @@ class ComputeConfigTests(TestCase):
             }
         }
         self.assertDictEqual(log_cfg_expected, cfg.getLoggerDictConfig())
+
+
+class SlotTests(TestCase):
+    """Tests for the execution slots of a worker."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.temp_dir, 'worker.config')
+        with open(self.config_path, 'w') as f:
+            f.write(json.dumps({'compute-worker': {
+                'local-root': self.temp_dir,
+                'slots': {'count': 4, 'pin-cpus': True, 'min-free-cores': 1.5, 'min-free-memory': 2},
+            }}))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def slot_config_test(self):
+        """Each slot stages its runs in its own directory under the local root."""
+        cfg = WorkerConfig(self.config_path)
+        self.assertEqual(4, cfg.getSlotCount())
+        self.assertTrue(cfg.getSlotCpuPinning())
+        self.assertEqual(1.5, cfg.getSlotMinFreeCores())
+        self.assertEqual(2 * 1024 ** 3, cfg.getSlotMinFreeMemory())
+        self.assertEqual(os.path.join(self.temp_dir, 'slot-2'), cfg.getSlotLocalRoot(2))
+        get_run_func(cfg, 2)
+        self.assertEqual(['slot-2'], [name for name in os.listdir(self.temp_dir) if name.startswith('slot-')])
+
+    def slot_cpus_test(self):
+        """The cores are shared evenly between the slots."""
+        self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]],
+                         [_slot_cpus(slot, 4, 16) for slot in range(4)])
+        self.assertEqual([[0], [1], [0]], [_slot_cpus(slot, 3, 2) for slot in range(3)])
+
+    def admission_test(self):
+        """A slot takes a new run only when enough cores are idle and memory is available."""
+        with mock.patch('codalabtools.compute.worker.psutil') as psutil:
+            psutil.cpu_count.return_value = 16
+            psutil.cpu_percent.return_value = 75.0
+            psutil.virtual_memory.return_value.available = 4 * 1024 ** 3
+            self.assertTrue(_has_free_resources(4, 4 * 1024 ** 3))
+            self.assertFalse(_has_free_resources(5, 0))
+            self.assertFalse(_has_free_resources(0, 5 * 1024 ** 3))
+
+
+class ReadScoresTests(TestCase):
+    """Tests for the scores sent inline with the 'finished' update."""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.output_dir, name), 'w') as f:
+            f.write(content)
+
+    def missing_scores_test(self):
+        """No scores file, the site falls back to output.zip."""
+        self.assertIsNone(_read_scores(self.output_dir))
+
+    def text_scores_test(self):
+        """Parses scores.txt."""
+        self._write('scores.txt', "a: 1\nb : 0.5\n")
+        self.assertDictEqual({'a': 1.0, 'b': 0.5}, _read_scores(self.output_dir))
+
+    def json_scores_test(self):
+        """Prefers scores.json to scores.txt."""
+        self._write('scores.txt', "a: 1\n")
+        self._write('scores.json', json.dumps({'a': 2}))
+        self.assertDictEqual({'a': 2.0}, _read_scores(self.output_dir))
+
+    def invalid_scores_test(self):
+        """Invalid values are not sent inline."""
+        self._write('scores.txt', "a: not a number\n")
+        self.assertIsNone(_read_scores(self.output_dir))
+        self._write('scores.txt', "a: nan\n")
+        self.assertIsNone(_read_scores(self.output_dir))
+
+    def too_many_scores_test(self):
+        """Scores over the limit are not sent inline."""
+        self._write('scores.json', json.dumps(dict(('s%s' % i, i) for i in range(MAX_INLINE_SCORES + 1))))
+        self.assertIsNone(_read_scores(self.output_dir))
+
+
+class FakeBlobService(object):
+    """Serves blobs from a dictionary and records the blobs requested."""
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.requested = []
+        self.ranges = []
+
+    def get_blob(self, container, blob_name, x_ms_range=None):
+        self.requested.append(blob_name)
+        self.ranges.append(x_ms_range)
+        if blob_name not in self.blobs:
+            raise azure.WindowsAzureMissingResourceError("missing")
+        blob = self.blobs[blob_name]
+        if x_ms_range is not None:
+            (start, end) = x_ms_range[len('bytes='):].split('-')
+            blob = blob[int(start):int(end) + 1]
+        return blob
+
+    def get_blob_properties(self, container, blob_name):
+        if blob_name not in self.blobs:
+            raise azure.WindowsAzureMissingResourceError("missing")
+        return {'etag': hashlib.md5(self.blobs[blob_name]).hexdigest(), 'content-length': str(len(self.blobs[blob_name]))}
+
+
+def _zip(files):
+    """Returns the content of a zip file holding the given files."""
+    output = StringIO.StringIO()
+    with ZipFile(output, 'w') as z:
+        for (name, content) in files.items():
+            z.writestr(name, content)
+    return output.getvalue()
+
+
+def _cache_key(blob_service, blob_name):
+    """Returns the name of the cache entry of a blob served by a FakeBlobService."""
+    etag = blob_service.get_blob_properties('container', blob_name)['etag']
+    return hashlib.sha1("%s\n%s" % (blob_name, etag)).hexdigest()
+
+
+def _cache_entries(cache_root):
+    """Returns the names of the entries of a bundle cache."""
+    return [name for name in os.listdir(cache_root) if os.path.isdir(os.path.join(cache_root, name))]
+
+
+class HistoryCacheTests(TestCase):
+    """Tests for the cache of the outputs listed in history bundles."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_root = os.path.join(self.temp_dir, 'cache')
+        self.blob_service = FakeBlobService({
+            'run.txt': 'input: input.txt\n',
+            'input.txt': 'history: history.txt\n',
+            'history.txt': 'description: history\n001/001/output/: past/private_output.zip\n001/002/output/: missing.zip\n',
+            'past/private_output.zip': _zip({'scores.txt': 'a: 1\n'}),
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _stage(self):
+        root_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        bundles = getBundle(root_dir, self.blob_service, 'container', 'run.txt', 'run',
+                            cache=BundleCache(self.cache_root))
+        return root_dir, bundles
+
+    def history_outputs_are_cached_test(self):
+        """The outputs of previous runs are downloaded once."""
+        for _ in range(2):
+            root_dir, bundles = self._stage()
+            scores_path = os.path.join(root_dir, 'run', 'input', 'history', '001', '001', 'output', 'scores.txt')
+            with open(scores_path) as f:
+                self.assertEqual('a: 1\n', f.read())
+            self.assertIsNone(bundles[os.path.join('run', 'input', 'history', '001/002/output/')])
+            shutil.rmtree(root_dir)
+        self.assertEqual(1, self.blob_service.requested.count('past/private_output.zip'))
+        self.assertEqual(2, self.blob_service.requested.count('history.txt'))
+        # Removing the staged run does not remove the cache
+        self.assertEqual(1, len(_cache_entries(self.cache_root)))
+
+    def no_cache_test(self):
+        """Without a cache root every run downloads the outputs."""
+        for _ in range(2):
+            getBundle(tempfile.mkdtemp(dir=self.temp_dir), self.blob_service, 'container', 'run.txt', 'run')
+        self.assertEqual(2, self.blob_service.requested.count('past/private_output.zip'))
+
+
+class EvictingBundleCache(BundleCache):
+    """A cache whose entries are evicted by other runs as soon as they are added."""
+
+    def _add(self, key, archive_path):
+        super(EvictingBundleCache, self)._add(key, archive_path)
+        shutil.rmtree(self._entry_path(key))
+
+
+class BundleCacheTests(TestCase):
+    """Tests for the cache of the bundles shared by the runs of a phase."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_root = os.path.join(self.temp_dir, 'cache')
+        self.blob_service = FakeBlobService({
+            'run.txt': 'program: program.zip\ninput: input.txt\n',
+            'input.txt': 'ref: ref.zip\nres: res.zip\n',
+            'program.zip': _zip({'metadata': 'command: python $program/score.py\n', 'score.py': 'pass\n'}),
+            'ref.zip': _zip({'truth.txt': '1' * 1024}),
+            'res.zip': _zip({'answer.txt': '1\n'}),
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _stage(self, cache):
+        root_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        bundles = getBundle(root_dir, self.blob_service, 'container', 'run.txt', 'run', cache=cache,
+                            cached_bundles=SCORE_CACHED_BUNDLES)
+        return root_dir, bundles
+
+    def _read(self, root_dir, *path):
+        with open(os.path.join(root_dir, 'run', *path)) as f:
+            return f.read()
+
+    def phase_bundles_are_cached_test(self):
+        """The program and reference data are downloaded once, the submission every run."""
+        cache = BundleCache(self.cache_root)
+        for _ in range(2):
+            root_dir, bundles = self._stage(cache)
+            self.assertEqual({'command': 'python $program/score.py'}, bundles[os.path.join('run', 'program')])
+            self.assertEqual('1\n', self._read(root_dir, 'input', 'res', 'answer.txt'))
+            # The staged files are links to the cache which can be removed with the run
+            self.assertEqual(2, os.stat(os.path.join(root_dir, 'run', 'input', 'ref', 'truth.txt')).st_nlink)
+            shutil.rmtree(root_dir)
+        self.assertEqual(1, self.blob_service.requested.count('program.zip'))
+        self.assertEqual(1, self.blob_service.requested.count('ref.zip'))
+        self.assertEqual(2, self.blob_service.requested.count('res.zip'))
+        self.assertEqual(2, len(_cache_entries(self.cache_root)))
+
+    def participant_programs_are_not_cached_test(self):
+        """The program of a prediction run is the submission, only the input data is cached."""
+        self.blob_service.blobs.update({
+            'predict/run.txt': 'program: submission.zip\ninput: input_data.zip\n',
+            'submission.zip': _zip({'metadata': 'command: python $program/predict.py\n'}),
+            'input_data.zip': _zip({'data.txt': '1\n'}),
+        })
+        cache = BundleCache(self.cache_root)
+        for _ in range(2):
+            getBundle(tempfile.mkdtemp(dir=self.temp_dir), self.blob_service, 'container', 'predict/run.txt', 'run',
+                      cache=cache, cached_bundles=PREDICT_CACHED_BUNDLES)
+        self.assertEqual(2, self.blob_service.requested.count('submission.zip'))
+        self.assertEqual(1, self.blob_service.requested.count('input_data.zip'))
+        self.assertEqual(1, len(_cache_entries(self.cache_root)))
+
+    def staging_is_attempted_a_bounded_number_of_times_test(self):
+        """A bundle evicted every time it is added fails to stage instead of being downloaded forever."""
+        cache = EvictingBundleCache(self.cache_root)
+        with self.assertRaises(Exception):
+            self._stage(cache)
+        self.assertEqual(worker.CACHE_STAGE_ATTEMPTS, self.blob_service.requested.count('program.zip'))
+
+    def changed_bundle_is_downloaded_again_test(self):
+        """A bundle replaced under the same name is not staged from a stale entry."""
+        cache = BundleCache(self.cache_root)
+        self._stage(cache)
+        self.blob_service.blobs['ref.zip'] = _zip({'truth.txt': '2'})
+        root_dir, bundles = self._stage(cache)
+        self.assertEqual('2', self._read(root_dir, 'input', 'ref', 'truth.txt'))
+        self.assertEqual(2, self.blob_service.requested.count('ref.zip'))
+
+    def least_recently_used_entries_are_evicted_test(self):
+        """Entries over the size limit are evicted without affecting the staged runs."""
+        cache = BundleCache(self.cache_root, size_limit=2500)
+        self.blob_service.blobs['program.zip'] = _zip({'metadata': 'command: python $program/score.py\n',
+                                                       'score.py': '2' * 1024})
+        root_dir, bundles = self._stage(cache)
+        # The first program was used before the reference data, the bundles of the next run
+        # may be staged in any order
+        program_entry = _cache_key(self.blob_service, 'program.zip')
+        ref_entry = _cache_key(self.blob_service, 'ref.zip')
+        os.utime(os.path.join(self.cache_root, program_entry), (0, 0))
+        os.utime(os.path.join(self.cache_root, ref_entry), (100, 100))
+        self.blob_service.blobs['program.zip'] = _zip({'metadata': 'command: python $program/score.py\n',
+                                                       'score.py': '3' * 1024})
+        other_dir, bundles = self._stage(cache)
+        # The least recently used entry, the first program, is evicted
+        self.assertEqual(set([ref_entry, _cache_key(self.blob_service, 'program.zip')]),
+                         set(_cache_entries(self.cache_root)))
+        self.assertEqual('2' * 1024, self._read(root_dir, 'program', 'score.py'))
+        self.assertEqual('3' * 1024, self._read(other_dir, 'program', 'score.py'))
+        self.assertEqual('1' * 1024, self._read(other_dir, 'input', 'ref', 'truth.txt'))
+
+
+class RendezvousBlobService(FakeBlobService):
+    """Serves the blobs of the listed bundles only once all of them are requested at the same time."""
+
+    def __init__(self, blobs, together):
+        super(RendezvousBlobService, self).__init__(blobs)
+        self.together = set(together)
+        self.waiting = set()
+        self.condition = threading.Condition()
+
+    def get_blob(self, container, blob_name, x_ms_range=None):
+        if blob_name in self.together:
+            with self.condition:
+                self.waiting.add(blob_name)
+                self.condition.notify_all()
+                while self.waiting != self.together:
+                    self.condition.wait(5)
+                    if self.waiting != self.together:
+                        raise Exception("%s was requested alone" % blob_name)
+        return super(RendezvousBlobService, self).get_blob(container, blob_name, x_ms_range)
+
+
+class ParallelStagingTests(TestCase):
+    """Tests for the concurrent download of the bundles of a run."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.blobs = {
+            'run.txt': 'program: program.zip\ninput: input.txt\n',
+            'input.txt': 'ref: ref.zip\nres: res.zip\n',
+            'program.zip': _zip({'metadata': 'command: python $program/score.py\n'}),
+            'ref.zip': _zip({'truth.txt': '1\n'}),
+            'res.zip': _zip({'answer.txt': '1\n'}),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def bundles_are_downloaded_concurrently_test(self):
+        """The referenced bundles are downloaded at the same time, at every depth."""
+        blob_service = RendezvousBlobService(self.blobs, ['ref.zip', 'res.zip'])
+        bundles = getBundle(self.temp_dir, blob_service, 'container', 'run.txt', 'run', threads=2)
+        self.assertEqual(set(['run', os.path.join('run', 'program'), os.path.join('run', 'input'),
+                              os.path.join('run', 'input', 'ref'), os.path.join('run', 'input', 'res')]),
+                         set(bundles))
+        self.assertEqual({'ref': 'ref.zip', 'res': 'res.zip'}, bundles[os.path.join('run', 'input')])
+        with open(os.path.join(self.temp_dir, 'run', 'input', 'ref', 'truth.txt')) as f:
+            self.assertEqual('1\n', f.read())
+
+    def shared_bundles_are_extracted_with_the_bundle_sharing_them_test(self):
+        """The files of a shared bundle are staged in the directory of the bundle listing it."""
+        self.blobs['input.txt'] += 'coopetition: coopetition.zip\n'
+        self.blobs['coopetition.zip'] = _zip({'current_user.txt': 'user', 'metadata': 'shared: shared.zip\n'})
+        self.blobs['shared.zip'] = _zip({'coopetition_phase_1.txt': 'pk\n'})
+        bundles = getBundle(self.temp_dir, FakeBlobService(self.blobs), 'container', 'run.txt', 'run')
+        coopetition_dir = os.path.join(self.temp_dir, 'run', 'input', 'coopetition')
+        self.assertEqual(['coopetition_phase_1.txt', 'current_user.txt', 'metadata'], sorted(os.listdir(coopetition_dir)))
+        self.assertEqual({'shared': 'shared.zip'}, bundles[os.path.join('run', 'input', 'coopetition')])
+
+    def max_depth_is_kept_test(self):
+        """The bundles beyond the maximum depth are not staged."""
+        bundles = getBundle(self.temp_dir, FakeBlobService(self.blobs), 'container', 'run.txt', 'run', max_depth=1)
+        self.assertNotIn(os.path.join('run', 'input', 'ref'), bundles)
+        self.assertIn(os.path.join('run', 'input'), bundles)
+
+    def bundles_are_downloaded_in_chunks_test(self):
+        """The bundles are downloaded in ranges no larger than the chunk size."""
+        self.blobs['ref.zip'] = _zip({'truth.txt': '0123456789' * 100})
+        blob_service = FakeBlobService(self.blobs)
+        getBundle(self.temp_dir, blob_service, 'container', 'run.txt', 'run', chunk_size=64)
+        with open(os.path.join(self.temp_dir, 'run', 'input', 'ref', 'truth.txt')) as f:
+            self.assertEqual('0123456789' * 100, f.read())
+        with open(os.path.join(self.temp_dir, 'run', 'input', 'metadata')) as f:
+            self.assertEqual(self.blobs['input.txt'], f.read())
+        ranges = [r[len('bytes='):].split('-') for (name, r) in zip(blob_service.requested, blob_service.ranges)
+                  if name == 'ref.zip']
+        sizes = [int(end) - int(start) + 1 for (start, end) in ranges]
+        self.assertTrue(len(sizes) > 1)
+        self.assertTrue(max(sizes) <= 64)
+        self.assertEqual(len(self.blobs['ref.zip']), sum(sizes))
+        # Only the staged bundles remain, not the downloaded archives
+        self.assertEqual(['run'], os.listdir(self.temp_dir))
+
+    def errors_are_raised_test(self):
+        """An error staging a bundle is raised by getBundle."""
+        self.blobs['ref.zip'] = 'not a zip'
+        with self.assertRaises(Exception):
+            getBundle(self.temp_dir, FakeBlobService(self.blobs), 'container', 'run.txt', 'run')
+
+
+class BlockBlobService(object):
+    """Records the blobs uploaded, failing the first attempts to upload some blocks."""
+
+    def __init__(self, failures=None):
+        """failures: A dictionary mapping block IDs to the number of attempts which fail."""
+        self.blobs = {}
+        self.blocks = {}
+        self.attempts = []
+        self.failures = dict(failures or {})
+        self.content_types = {}
+
+    def put_blob(self, container, blob_name, blob, x_ms_blob_type=None, x_ms_blob_content_type=None):
+        self.blobs[blob_name] = blob
+        self.content_types[blob_name] = x_ms_blob_content_type
+
+    def put_block(self, container, blob_name, block, blockid):
+        self.attempts.append(blockid)
+        if self.failures.get(blockid, 0) > 0:
+            self.failures[blockid] -= 1
+            raise azure.WindowsAzureError("failed")
+        self.blocks[(blob_name, blockid)] = block
+
+    def put_block_list(self, container, blob_name, block_list, x_ms_blob_content_type=None):
+        self.blobs[blob_name] = ''.join(self.blocks[(blob_name, blockid)] for blockid in block_list)
+        self.content_types[blob_name] = x_ms_blob_content_type
+
+
+class UploadTests(TestCase):
+    """Tests for the upload of the outputs of a run."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'output.zip')
+        self.content = ''.join(chr(i % 256) for i in range(1000))
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.retry_delay = worker.UPLOAD_RETRY_DELAY
+        worker.UPLOAD_RETRY_DELAY = 0
+
+    def tearDown(self):
+        worker.UPLOAD_RETRY_DELAY = self.retry_delay
+        shutil.rmtree(self.temp_dir)
+
+    def small_file_test(self):
+        """A file which fits in a block is uploaded at once."""
+        blob_service = BlockBlobService()
+        _upload(blob_service, 'container', 'run/output.zip', self.path, 'html', block_size=1000)
+        self.assertEqual(self.content, blob_service.blobs['run/output.zip'])
+        self.assertEqual('html', blob_service.content_types['run/output.zip'])
+        self.assertEqual([], blob_service.attempts)
+
+    def large_file_test(self):
+        """A larger file is uploaded in blocks committed in order."""
+        blob_service = BlockBlobService()
+        _upload(blob_service, 'container', 'run/output.zip', self.path, 'html', block_size=64, threads=4)
+        self.assertEqual(self.content, blob_service.blobs['run/output.zip'])
+        self.assertEqual('html', blob_service.content_types['run/output.zip'])
+        self.assertEqual(16, len(blob_service.attempts))
+
+    def failed_blocks_are_retried_test(self):
+        """Only the blocks which failed are sent again."""
+        blob_service = BlockBlobService(failures={'00000003': 1})
+        _upload(blob_service, 'container', 'run/output.zip', self.path, block_size=64)
+        self.assertEqual(self.content, blob_service.blobs['run/output.zip'])
+        self.assertEqual(2, blob_service.attempts.count('00000003'))
+        self.assertEqual(17, len(blob_service.attempts))
+
+    def upload_fails_after_the_last_attempt_test(self):
+        """A block failing every attempt fails the upload without committing the blob."""
+        blob_service = BlockBlobService(failures={'00000001': worker.UPLOAD_BLOCK_ATTEMPTS})
+        with self.assertRaises(azure.WindowsAzureError):
+            _upload(blob_service, 'container', 'run/output.zip', self.path, block_size=64)
+        self.assertEqual(worker.UPLOAD_BLOCK_ATTEMPTS, blob_service.attempts.count('00000001'))
+        self.assertNotIn('run/output.zip', blob_service.blobs)
+
+
+class LocalBundlesTests(TestCase):
+    """Tests for the bundles produced by an earlier stage of a fused task."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.predictions_dir = os.path.join(self.temp_dir, 'predictions')
+        os.mkdir(self.predictions_dir)
+        with open(os.path.join(self.predictions_dir, 'answer.txt'), 'w') as f:
+            f.write('42\n')
+        self.blob_service = FakeBlobService({
+            'score/run.txt': 'input: score/input.txt\n',
+            'score/input.txt': 'res: pred/run/output.zip\n',
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def predictions_are_copied_test(self):
+        """The predictions are staged from the local directory instead of being downloaded."""
+        root_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        bundles = getBundle(root_dir, self.blob_service, 'container', 'score/run.txt', 'run',
+                            local_bundles={'pred/run/output.zip': self.predictions_dir})
+        with open(os.path.join(root_dir, 'run', 'input', 'res', 'answer.txt')) as f:
+            self.assertEqual('42\n', f.read())
+        self.assertIn(os.path.join('run', 'input', 'res'), bundles)
+        self.assertNotIn('pred/run/output.zip', self.blob_service.requested)
+        # The staged copy can be modified without changing the predictions
+        os.remove(os.path.join(root_dir, 'run', 'input', 'res', 'answer.txt'))
+        self.assertTrue(os.path.exists(os.path.join(self.predictions_dir, 'answer.txt')))
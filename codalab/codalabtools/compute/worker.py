@@ -3,16 +3,20 @@
 Defines the worker process which handles computations.
 """
 import azure
+import fcntl
+import hashlib
 import json
 import logging
 import logging.config
 import os
 import platform
+import Queue
 import psutil
 import pwd
 import grp
 import signal
 import math
+import multiprocessing
 import shutil
 import socket
 import stat
@@ -21,10 +25,12 @@ import sys
 import tempfile
 import time
 import traceback
+import urllib
 import yaml
 
 from os.path import dirname, abspath, join
 from subprocess import Popen, call
+from multiprocessing.pool import ThreadPool
 from zipfile import ZipFile
 
 # Add codalabtools to the module search path
@@ -36,6 +42,31 @@ from codalabtools.azure_extensions import AzureServiceBusQueue
 
 logger = logging.getLogger('codalabtools')
 
+# Default number of bundles downloaded concurrently while staging a run
+BUNDLE_DOWNLOAD_THREADS = 4
+
+# Default size in bytes of the ranges in which the bundles are downloaded
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Default size in bytes of the blocks in which the outputs are uploaded
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Default number of blocks uploaded concurrently
+UPLOAD_THREADS = 4
+
+# Number of times a block is sent before an upload fails, and delay in seconds before the first retry
+UPLOAD_BLOCK_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 1
+
+# Relative paths of the bundles of a phase, shared by all its runs, which are cached along with
+# the outputs listed in history bundles, see BundleCache. The program of a prediction run is the
+# submission of a participant, which is used once and not cached.
+PREDICT_CACHED_BUNDLES = (join('run', 'input'),)
+SCORE_CACHED_BUNDLES = (join('run', 'program'), join('run', 'input', 'ref'))
+
+# Number of times a bundle evicted while it is being staged is downloaded again
+CACHE_STAGE_ATTEMPTS = 3
+
 
 def on_rm_error( func, path, exc_info):
     # path contains the path of the file that couldn't be removed
@@ -95,7 +126,79 @@ class WorkerConfig(BaseConfig):
         """Gets the path for the local directory where files are staged or None if the path is not provided."""
         return self._winfo['local-root'] if 'local-root' in self._winfo else None
 
-def getBundle(root_path, blob_service, container, bundle_id, bundle_rel_path, max_depth=3):
+    def getLocalCacheRoot(self):
+        """
+        Gets the path for the local directory where the outputs of previous runs are cached or None
+        if the path is not provided, which disables the cache.
+        """
+        return self._winfo['local-cache-root'] if 'local-cache-root' in self._winfo else None
+
+    def getLocalCacheSizeLimit(self):
+        """
+        Gets the maximum size in bytes of the local cache, given in gigabytes by 'local-cache-size-limit',
+        or None if the size is not limited.
+        """
+        if 'local-cache-size-limit' in self._winfo:
+            return int(float(self._winfo['local-cache-size-limit']) * 1024 ** 3)
+        return None
+
+    def getDownloadChunkSize(self):
+        """
+        Gets the size in bytes of the ranges in which the bundles are downloaded, given in megabytes
+        by 'download-chunk-size'.
+        """
+        if 'download-chunk-size' in self._winfo:
+            return int(float(self._winfo['download-chunk-size']) * 1024 ** 2)
+        return DOWNLOAD_CHUNK_SIZE
+
+    def getUploadBlockSize(self):
+        """
+        Gets the size in bytes of the blocks in which the outputs are uploaded, given in megabytes
+        by 'upload-block-size'.
+        """
+        if 'upload-block-size' in self._winfo:
+            return int(float(self._winfo['upload-block-size']) * 1024 ** 2)
+        return UPLOAD_BLOCK_SIZE
+
+    def getUploadThreads(self):
+        """Gets the number of blocks uploaded concurrently."""
+        return int(self._winfo.get('upload-threads', UPLOAD_THREADS))
+
+    def getSlotCount(self):
+        """Gets the number of runs the worker performs concurrently, each in its own execution slot."""
+        return int(self._winfo.get('slots', {}).get('count', 1))
+
+    def getSlotCpuPinning(self):
+        """Gets whether the processes of each slot are pinned to their own share of the CPU cores."""
+        return bool(self._winfo.get('slots', {}).get('pin-cpus', False))
+
+    def getSlotMinFreeCores(self):
+        """Gets the number of idle CPU cores required before a slot takes a new run."""
+        return float(self._winfo.get('slots', {}).get('min-free-cores', 0))
+
+    def getSlotMinFreeMemory(self):
+        """
+        Gets the available memory in bytes required before a slot takes a new run, given in gigabytes
+        by 'min-free-memory'.
+        """
+        return int(float(self._winfo.get('slots', {}).get('min-free-memory', 0)) * 1024 ** 3)
+
+    def getSlotLocalRoot(self, slot):
+        """
+        Gets the path of the local directory where the runs of a slot are staged: a directory
+        under the local root when the worker has several slots, the local root otherwise.
+        """
+        local_root = self.getLocalRoot()
+        if local_root is None or self.getSlotCount() <= 1:
+            return local_root
+        return join(local_root, 'slot-%s' % slot)
+
+    def getBundleDownloadThreads(self):
+        """Gets the number of bundles downloaded concurrently while staging a run."""
+        return int(self._winfo.get('bundle-download-threads', BUNDLE_DOWNLOAD_THREADS))
+
+def getBundle(root_path, blob_service, container, bundle_id, bundle_rel_path, max_depth=3, cache=None,
+              cached_bundles=(), local_bundles=None, threads=BUNDLE_DOWNLOAD_THREADS, chunk_size=DOWNLOAD_CHUNK_SIZE):
     """
     be controlled with the max_depth parameter.
 
@@ -111,6 +214,16 @@ def getBundle(root_path, blob_service, container, bundle_id, bundle_rel_path, ma
         program bundle will be located at 'C:\\tmp123\\run\\program'.
     max_depth: An optional argument to limit the depth of recursion when resolving bundle
         dependencies.
+    cache: An optional BundleCache where the outputs listed in history bundles are cached across runs.
+    cached_bundles: The relative paths of the other zip bundles which are cached, such as the
+        bundles of the phase listed in SCORE_CACHED_BUNDLES.
+    local_bundles: An optional dictionary mapping the IDs of bundles produced by an earlier stage
+        of the task to the local directories holding their content, which are copied instead
+        of being downloaded.
+    threads: The number of bundles downloaded concurrently. The bundles referenced by a bundle
+        are downloaded once it is staged, so the staging time follows the largest bundles rather
+        than the sum of all of them.
+    chunk_size: The size in bytes of the ranges in which the bundles are downloaded, see _download_blob.
 
     Return value: A dictionary where each key denotes the relative path of a bundle which
         was staged. The value associated with a key is a dictionary representing the bundle's
@@ -118,52 +231,281 @@ def getBundle(root_path, blob_service, container, bundle_id, bundle_rel_path, ma
         the set of keys should contain at the minimum: 'run', 'run\\program' and 'run\\input'.
     """
 
-    def getThem(bundle_id, bundle_rel_path, bundles, depth):
-        """Recursively gets the bundles."""
-        # download the bundle and save it to a temporary location
-        try:
-            logger.debug("Getting bundle_id=%s from container=%s" % (container, bundle_id))
-            blob = blob_service.get_blob(container, bundle_id)
-        except azure.WindowsAzureMissingResourceError:
-            #file not found lets None this bundle
-            bundles[bundle_rel_path] = None
-            return bundles
+    def getThem(bundle_id, bundle_rel_path, depth, is_history=False, is_history_output=False, is_shared=False):
+        """
+        Gets a bundle. A shared bundle is a zip bundle listed under the 'shared' key of another
+        bundle, its files are extracted into the directory of that bundle.
 
+        Returns: A tuple (bundle_info, references) where references lists the arguments of the
+            calls getting the bundles referenced by this bundle.
+        """
         bundle_ext = os.path.splitext(bundle_id)[1]
-        bundle_file = tempfile.NamedTemporaryFile(prefix='tmp', suffix=bundle_ext, dir=root_path, delete=False)
-
-        logger.debug("Reading from bundle_file.name=%s" % bundle_file.name)
-
-        #take our temp file and write whatever is it form the blob
-        with open(bundle_file.name, 'wb') as f:
-            f.write(blob)
-        # stage the bundle directory
-        bundle_path = join(root_path, bundle_rel_path)
+        bundle_path = join(root_path, dirname(bundle_rel_path) if is_shared else bundle_rel_path)
         metadata_path = join(bundle_path, 'metadata')
 
-        if bundle_ext == '.zip':
-            with ZipFile(bundle_file.file, 'r') as z:
-                z.extractall(bundle_path)
+        if is_shared and bundle_ext != '.zip':
+            logger.warning("Ignoring shared bundle_id=%s which is not a zip bundle" % bundle_id)
+            return (None, [])
+        if urllib.unquote(bundle_id) in local_bundles:
+            logger.debug("Copying local bundle_id=%s" % bundle_id)
+            shutil.copytree(local_bundles[urllib.unquote(bundle_id)], bundle_path)
+        elif (is_history_output or bundle_rel_path in cached_bundles) and \
+                cache is not None and bundle_ext == '.zip':
+            if not cache.stage(blob_service, container, bundle_id, bundle_path,
+                               immutable=is_history_output, chunk_size=chunk_size):
+                return (None, [])
         else:
-            os.mkdir(bundle_path)
-            shutil.copyfile(bundle_file.name, metadata_path)
+            # download the bundle to a temporary location
+            (fd, bundle_file_path) = tempfile.mkstemp(prefix='tmp', suffix=bundle_ext, dir=root_path)
+            os.close(fd)
+            try:
+                logger.debug("Getting bundle_id=%s from container=%s" % (bundle_id, container))
+                _download_blob(blob_service, container, bundle_id, bundle_file_path, chunk_size)
+                # stage the bundle directory
+                if bundle_ext == '.zip':
+                    with ZipFile(bundle_file_path, 'r') as z:
+                        z.extractall(bundle_path)
+                else:
+                    os.mkdir(bundle_path)
+                    shutil.move(bundle_file_path, metadata_path)
+            except azure.WindowsAzureMissingResourceError:
+                #file not found lets None this bundle
+                return (None, [])
+            finally:
+                # the archive is not kept next to its extracted content
+                if os.path.exists(bundle_file_path):
+                    os.remove(bundle_file_path)
+        if is_shared:
+            # the metadata of the directory is the one of the bundle sharing the files
+            return (None, [])
         # read the metadata if it exists
         bundle_info = None
         if os.path.exists(metadata_path):
             with open(metadata_path) as mf:
                 bundle_info = yaml.load(mf)
-        bundles[bundle_rel_path] = bundle_info
         # get referenced bundles
-
+        references = []
         if (bundle_info is not None) and isinstance(bundle_info, dict) and (depth < max_depth):
             for (k, v) in bundle_info.items():
                 if k not in ("description", "command", "exitCode", "elapsedTime", "stdout", "stderr", "submitted-by", "submitted-at"):
                     if isinstance(v, str):
-                        getThem(v, join(bundle_rel_path, k), bundles, depth + 1)
+                        # The outputs listed in a history bundle are those of finished runs, they never change
+                        references.append((v, join(bundle_rel_path, k), depth + 1, k == 'history', is_history,
+                                           k == 'shared'))
+
+        return (bundle_info, references)
+
+    def getIt(args):
+        """Gets a bundle in a thread of the pool, returning the error raised if any."""
+        try:
+            return (args, getThem(*args), None)
+        except Exception:
+            return (args, None, sys.exc_info())
+
+    local_bundles = dict((urllib.unquote(k), v) for (k, v) in (local_bundles or {}).items())
+    bundles = {}
+    staged = Queue.Queue()
+    pool = ThreadPool(max(1, threads))
+    try:
+        pool.apply_async(getIt, ((bundle_id, bundle_rel_path, 0),), callback=staged.put)
+        pending = 1
+        while pending > 0:
+            (args, result, exc_info) = staged.get()
+            pending -= 1
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            (bundle_info, references) = result
+            bundles[args[1]] = bundle_info
+            for reference in references:
+                pool.apply_async(getIt, (reference,), callback=staged.put)
+                pending += 1
+    finally:
+        # Wait for the bundles being staged, the directory is removed once a failed run ends
+        pool.close()
+        pool.join()
+    return bundles
+
+
+class BundleCache(object):
+    """
+    Worker-local cache of extracted zip bundles, shared by the runs of the worker.
+
+    Entries are keyed by the bundle ID and, for bundles which may be replaced under the same
+    name, the version reported by the blob properties (ETag or Content-MD5), so a changed
+    bundle is downloaded again. Bundles are extracted once and their files are hard-linked
+    into the run directories, or copied when the run directory is on another file system.
+    The cached files are read-only since the links share their content.
+
+    The total size of the entries is kept under a limit by evicting the least recently used
+    ones. Runs link their files while holding a shared lock on the cache and evictions take
+    an exclusive lock, so a run never stages a partially evicted bundle; an entry evicted
+    afterwards is unaffected since the run holds its own links or copies.
+    """
+
+    def __init__(self, root, size_limit=None):
+        """
+        root: Path of the local cache directory. It must not be under the local root, which is
+            emptied before every run.
+        size_limit: An optional maximum size of the cache in bytes.
+        """
+        self.root = root
+        self.size_limit = size_limit
+        if not os.path.exists(root):
+            os.makedirs(root)
+        self._lock_path = join(root, '.lock')
+
+    def _lock(self, operation):
+        """Returns the file of the cache lock, locked with the specified flock operation."""
+        lock_file = open(self._lock_path, 'a')
+        fcntl.flock(lock_file, operation)
+        return lock_file
+
+    def _entry_path(self, key):
+        return join(self.root, key)
+
+    def stage(self, blob_service, container, bundle_id, bundle_path, immutable=False,
+              chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Stages a zip bundle from the cache, downloading and extracting it into the cache first
+        when missing.
+
+        bundle_path: Path of the bundle directory to stage.
+        immutable: True if the bundle never changes, such as the output of a finished run, in
+            which case its version is not looked up.
+        chunk_size: The size in bytes of the ranges in which the bundle is downloaded.
+
+        Return value: True if the bundle was staged, False if it does not exist.
+        """
+        size = None
+        try:
+            if immutable:
+                version = ''
+            else:
+                properties = blob_service.get_blob_properties(container, bundle_id)
+                version = properties.get('etag') or properties.get('content-md5') or ''
+                size = int(properties['content-length'])
+        except azure.WindowsAzureMissingResourceError:
+            return False
+        key = hashlib.sha1("%s\n%s" % (bundle_id, version)).hexdigest()
+        cached_path = self._entry_path(key)
+        for _ in range(CACHE_STAGE_ATTEMPTS):
+            if not os.path.isdir(cached_path):
+                (fd, archive_path) = tempfile.mkstemp(prefix='tmp', suffix='.zip', dir=self.root)
+                os.close(fd)
+                try:
+                    logger.debug("Caching bundle_id=%s from container=%s" % (bundle_id, container))
+                    _download_blob(blob_service, container, bundle_id, archive_path, chunk_size, size=size)
+                    self._add(key, archive_path)
+                except azure.WindowsAzureMissingResourceError:
+                    return False
+                finally:
+                    os.remove(archive_path)
+            else:
+                logger.debug("Using cached bundle_id=%s" % bundle_id)
+
+            lock_file = self._lock(fcntl.LOCK_SH)
+            try:
+                # The entry is missing if other runs evicted it meanwhile
+                if os.path.isdir(cached_path):
+                    # The modification time of the entry orders the evictions
+                    os.utime(cached_path, None)
+                    _link_tree(cached_path, bundle_path)
+                    return True
+            finally:
+                lock_file.close()
+        raise Exception("Bundle %s was evicted from the cache before it could be staged." % bundle_id)
+
+    def _add(self, key, archive_path):
+        """Extracts a zip bundle into a new entry, then evicts entries over the size limit."""
+        staging_path = tempfile.mkdtemp(prefix='tmp', dir=self.root)
+        with ZipFile(archive_path, 'r') as z:
+            z.extractall(staging_path)
+        size = 0
+        for (dir_path, dir_names, file_names) in os.walk(staging_path):
+            os.chmod(dir_path, 0755)
+            for name in file_names:
+                file_path = join(dir_path, name)
+                os.chmod(file_path, 0444)
+                size += os.path.getsize(file_path)
+        with open(self._entry_path(key) + '.size', 'w') as f:
+            f.write(str(size))
+        try:
+            os.rename(staging_path, self._entry_path(key))
+        except OSError:
+            # Another run cached the bundle meanwhile
+            shutil.rmtree(staging_path, onerror=on_rm_error)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache is under its size limit.
+
+        keep: An optional key of an entry which is not removed, such as the one just added.
+        """
+        if self.size_limit is None:
+            return
+        lock_file = self._lock(fcntl.LOCK_EX)
+        try:
+            entries = []
+            for name in os.listdir(self.root):
+                entry_path = self._entry_path(name)
+                if name.startswith(('.', 'tmp')) or not os.path.isdir(entry_path):
+                    continue
+                try:
+                    with open(entry_path + '.size') as f:
+                        size = int(f.read())
+                except (IOError, ValueError):
+                    size = 0
+                entries.append((os.path.getmtime(entry_path), name, size))
+            total = sum(size for (_, _, size) in entries)
+            for (_, name, size) in sorted(entries):
+                if total <= self.size_limit:
+                    break
+                if name == keep:
+                    continue
+                logger.debug("Evicting cached bundle %s" % name)
+                entry_path = self._entry_path(name)
+                shutil.rmtree(entry_path, onerror=on_rm_error)
+                if os.path.exists(entry_path + '.size'):
+                    os.remove(entry_path + '.size')
+                total -= size
+        finally:
+            lock_file.close()
+
+
+def _download_blob(blob_service, container, blob_name, path, chunk_size=DOWNLOAD_CHUNK_SIZE, size=None):
+    """
+    Downloads a blob to a file in ranges of chunk_size bytes, which bounds the memory used
+    whatever the size of the blob.
+
+    size: The size of the blob in bytes if already known, otherwise it is read from the blob
+        properties.
+
+    Raises azure.WindowsAzureMissingResourceError if the blob does not exist.
+    """
+    if size is None:
+        size = int(blob_service.get_blob_properties(container, blob_name)['content-length'])
+    with open(path, 'wb') as f:
+        for start in range(0, size, chunk_size):
+            end = min(start + chunk_size, size) - 1
+            f.write(blob_service.get_blob(container, blob_name, x_ms_range='bytes=%s-%s' % (start, end)))
 
-        return bundles
 
-    return getThem(bundle_id, bundle_rel_path, {}, 0)
+def _link_tree(source_path, target_path):
+    """
+    Recreates a directory tree with hard links to its files, copying the files which can not
+    be linked.
+    """
+    for (dir_path, dir_names, file_names) in os.walk(source_path):
+        target_dir = join(target_path, os.path.relpath(dir_path, source_path))
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+        for name in file_names:
+            try:
+                os.link(join(dir_path, name), join(target_dir, name))
+            except OSError:
+                shutil.copy2(join(dir_path, name), join(target_dir, name))
+
 
 def _send_update(queue, task_id, status, extra=None):
     """
@@ -183,18 +525,100 @@ def _send_update(queue, task_id, status, extra=None):
     })
     queue.send_message(body)
 
-def _upload(blob_service, container, blob_id, blob_file, content_type = None):
+# Scores files of the scoring programs, in the order they are looked up. The scores are sent
+# with the 'finished' update unless the file is too large, the site then reads it from output.zip.
+SCORES_FILE_NAMES = ('scores.json', 'scores.yaml', 'scores.yml', 'scores.txt')
+MAX_INLINE_SCORES = 1000
+MAX_INLINE_SCORES_FILE_SIZE = 64 * 1024
+
+
+def _read_scores(output_dir):
+    """
+    Parses the scores written by the scoring program.
+
+    output_dir: Path of the output directory of the run.
+
+    Return value: A dictionary mapping score keys to values, or None when there is no scores
+        file, when it is invalid, or when it is too large to be sent inline.
+    """
+    for name in SCORES_FILE_NAMES:
+        path = join(output_dir, name)
+        if os.path.isfile(path):
+            break
+    else:
+        return None
+    if os.path.getsize(path) > MAX_INLINE_SCORES_FILE_SIZE:
+        logger.debug("Scores file %s is too large to be sent inline", name)
+        return None
+    try:
+        with open(path) as f:
+            content = f.read()
+        if name.endswith('.json'):
+            data = json.loads(content)
+        elif name.endswith('.txt'):
+            data = dict(line.split(":", 1) for line in content.split("\n") if len(line.strip()) > 0)
+        else:
+            data = yaml.safe_load(content)
+        if not isinstance(data, dict) or len(data) > MAX_INLINE_SCORES:
+            return None
+        scores = {}
+        for (key, value) in data.items():
+            value = float(value)
+            if math.isnan(value) or math.isinf(value):
+                return None
+            scores[str(key).strip()] = value
+        return scores
+    except Exception:
+        logger.exception("Unable to parse the scores file %s", name)
+        return None
+
+
+def _upload(blob_service, container, blob_id, blob_file, content_type = None, block_size=UPLOAD_BLOCK_SIZE,
+            threads=UPLOAD_THREADS):
     """
     Uploads a Blob.
 
+    Files larger than a block are read and uploaded in blocks, several at a time, which are then
+    committed with put_block_list. A block which fails is retried on its own.
+
     blob_service: A BlobService object.
     container: Name of the container to uplaod the Blob to.
     blob_id: Name of the Blob relative to the container.
     blob_file: Path of the local file to upload as a BlockBlob.
+    block_size: The size in bytes of the blocks.
+    threads: The number of blocks uploaded concurrently.
     """
-    with open(blob_file, 'rb') as f:
-        blob = f.read()
-        blob_service.put_blob(container, blob_id, blob, x_ms_blob_type='BlockBlob', x_ms_blob_content_type=content_type)
+    size = os.path.getsize(blob_file)
+    if size <= block_size:
+        with open(blob_file, 'rb') as f:
+            blob = f.read()
+            blob_service.put_blob(container, blob_id, blob, x_ms_blob_type='BlockBlob', x_ms_blob_content_type=content_type)
+        return
+
+    # Block IDs must have the same length within a blob
+    block_ids = ['%08d' % i for i in range(int(math.ceil(float(size) / block_size)))]
+
+    def put_block(index):
+        with open(blob_file, 'rb') as f:
+            f.seek(index * block_size)
+            block = f.read(block_size)
+        for attempt in range(UPLOAD_BLOCK_ATTEMPTS):
+            try:
+                blob_service.put_block(container, blob_id, block, block_ids[index])
+                return
+            except Exception:
+                if attempt + 1 == UPLOAD_BLOCK_ATTEMPTS:
+                    raise
+                logger.exception("Failed to upload block %s of blob_id=%s, retrying" % (index, blob_id))
+                time.sleep(UPLOAD_RETRY_DELAY * 2 ** attempt)
+
+    pool = ThreadPool(max(1, min(threads, len(block_ids))))
+    try:
+        pool.map(put_block, range(len(block_ids)))
+    finally:
+        pool.close()
+        pool.join()
+    blob_service.put_block_list(container, blob_id, block_ids, x_ms_blob_content_type=content_type)
 
 
 class ExecutionTimeLimitExceeded(Exception):
@@ -212,14 +636,216 @@ def demote(user='workeruser'):
     return result
 
 
-def get_run_func(config):
+def get_run_func(config, slot=0):
     """
     Returns the function to invoke in order to do a run given the specified configuration.
 
     config: A pre-configured instance of WorkerConfig.
+    slot: The execution slot performing the runs. The runs of a slot are staged, cleaned-up
+        and killed within the local directory of the slot only, see WorkerConfig.getSlotLocalRoot.
 
     Returns: The function to invoke given a Run task: f(task_id, task_args)
     """
+    cache = None
+    if config.getLocalCacheRoot() is not None:
+        cache = BundleCache(config.getLocalCacheRoot(), config.getLocalCacheSizeLimit())
+    upload_options = {'block_size': config.getUploadBlockSize(), 'threads': config.getUploadThreads()}
+    local_root = config.getSlotLocalRoot(slot)
+    if local_root is not None and not os.path.exists(local_root):
+        os.makedirs(local_root)
+        # The demoted user needs the same access to the slot directory as to the local root
+        os.chmod(local_root, stat.S_IMODE(os.stat(config.getLocalRoot()).st_mode))
+
+    def run_stage(task_dir, blob_service, container, run_id, execution_time_limit, is_predict_step, local_bundles):
+        """
+        Stages a run bundle, invokes its program and uploads its outputs.
+
+        task_dir: Path of the temporary directory of the task, the run is staged in a new
+            directory under it.
+        run_id: The ID of the run bundle.
+        local_bundles: Dictionary of the bundles produced by the previous stages of the task,
+            see getBundle.
+
+        Returns: A tuple (timed_out, exit_code, stderr_file, output_dir, output_id).
+        """
+        root_dir = tempfile.mkdtemp(dir=task_dir)
+        bundles = getBundle(root_dir, blob_service, container, run_id, 'run',
+                            cache=cache,
+                            cached_bundles=PREDICT_CACHED_BUNDLES if is_predict_step else SCORE_CACHED_BUNDLES,
+                            local_bundles=local_bundles,
+                            threads=config.getBundleDownloadThreads(),
+                            chunk_size=config.getDownloadChunkSize())
+        # Verify we have an input folder: create one if it's not in the bundle.
+        input_rel_path = join('run', 'input')
+        if input_rel_path not in bundles:
+            input_dir = join(root_dir, 'run', 'input')
+            if os.path.exists(input_dir) == False:
+                os.mkdir(input_dir)
+        # Verify we have a program
+        prog_rel_path = join('run', 'program')
+        if prog_rel_path not in bundles:
+            raise Exception("Program bundle is not available.")
+
+        prog_info = bundles[prog_rel_path]
+        if prog_info is None:
+            raise Exception("Program metadata is not available.")
+
+        prog_cmd_list = []
+        if 'command' in prog_info:
+            if isinstance(prog_info['command'], type([])):
+                prog_cmd_list = [_.strip() for _ in prog_info['command']]
+            else:
+                prog_cmd_list = [prog_info['command'].strip()]
+        if len(prog_cmd_list) <= 0:
+            raise Exception("Program command is not specified.")
+
+        # Create output folder
+        output_dir = join(root_dir, 'run', 'output')
+        if os.path.exists(output_dir) == False:
+            os.mkdir(output_dir)
+        # Create temp folder
+        temp_dir = join(root_dir, 'run', 'temp')
+        if os.path.exists(temp_dir) == False:
+            os.mkdir(temp_dir)
+        # Report the list of folders and files staged
+        #
+        # Invoke custom evaluation program
+        run_dir = join(root_dir, 'run')
+        os.chdir(run_dir)
+        os.environ["PATH"] += os.pathsep + run_dir + "/program"
+        logger.debug("Execution directory: %s", run_dir)
+
+        if is_predict_step:
+            stdout_file_name = 'prediction_stdout_file.txt'
+            stderr_file_name = 'prediction_stderr_file.txt'
+        else:
+            stdout_file_name = 'stdout.txt'
+            stderr_file_name = 'stderr.txt'
+
+        stdout_file = join(run_dir, stdout_file_name)
+        stderr_file = join(run_dir, stderr_file_name)
+        stdout = open(stdout_file, "a+")
+        stderr = open(stderr_file, "a+")
+        prog_status = []
+
+        for prog_cmd_counter, prog_cmd in enumerate(prog_cmd_list):
+            # Update command-line with the real paths
+            logger.debug("CMD: %s", prog_cmd)
+            prog_cmd = prog_cmd.replace("$program", join(run_dir, 'program')) \
+                                .replace("$input", join(run_dir, 'input')) \
+                                .replace("$output", join(run_dir, 'output')) \
+                                .replace("$tmp", join(run_dir, 'temp')) \
+                                .replace("/", os.path.sep) \
+                                .replace("\\", os.path.sep)
+            logger.debug("Invoking program: %s", prog_cmd)
+
+            startTime = time.time()
+            exit_code = None
+            timed_out = False
+
+            if 'Darwin' not in platform.platform():
+                prog_cmd = prog_cmd.replace("python", join(run_dir, "/home/azureuser/anaconda/bin/python"))
+                # Run as separate user
+                evaluator_process = Popen(
+                    prog_cmd.split(' '),
+                    preexec_fn=demote(),  # this pre-execution function drops into a lower user
+                    stdout=stdout,
+                    stderr=stderr,
+                    env=os.environ
+                )
+            else:
+                evaluator_process = Popen(
+                    prog_cmd.split(' '),
+                    stdout=stdout,
+                    stderr=stderr,
+                    env=os.environ
+                )
+
+            logger.debug("Started process, pid=%s" % evaluator_process.pid)
+
+            time_difference = time.time() - startTime
+            signal.signal(signal.SIGALRM, alarm_handler)
+            signal.alarm(int(math.fabs(math.ceil(execution_time_limit - time_difference))))
+
+            exit_code = None
+
+            logger.debug("Checking process, exit_code = %s" % exit_code)
+
+            try:
+                while exit_code == None:
+                    time.sleep(1)
+                    exit_code = evaluator_process.poll()
+            except (ValueError, OSError):
+                pass # tried to communicate with dead process
+            except ExecutionTimeLimitExceeded:
+                exit_code = -1
+                logger.info("Killed process for running too long!")
+                stderr.write("Execution time limit exceeded!")
+                evaluator_process.kill()
+                timed_out = True
+
+            signal.alarm(0)
+
+            logger.debug("Exit Code: %d", exit_code)
+
+            endTime = time.time()
+            elapsedTime = endTime - startTime
+
+            if len(prog_cmd_list) == 1:
+                # Overwrite prog_status array with dict
+                prog_status = {
+                    'exitCode': exit_code,
+                    'elapsedTime': elapsedTime
+                }
+            else:
+                # otherwise we're doing multi-track and processing multiple commands so append to the array
+                prog_status.append({
+                    'exitCode': exit_code,
+                    'elapsedTime': elapsedTime
+                })
+            with open(join(output_dir, 'metadata'), 'w') as f:
+                f.write(yaml.dump(prog_status, default_flow_style=False))
+
+        stdout.close()
+        stderr.close()
+
+        logger.debug("Saving output files")
+        stdout_id = "%s/%s" % (os.path.splitext(run_id)[0], stdout_file_name)
+        _upload(blob_service, container, stdout_id, stdout_file, **upload_options)
+        stderr_id = "%s/%s" % (os.path.splitext(run_id)[0], stderr_file_name)
+        _upload(blob_service, container, stderr_id, stderr_file, **upload_options)
+
+        private_dir = join(output_dir, 'private')
+        if os.path.exists(private_dir):
+            logger.debug("Packing private results...")
+            private_output_file = join(root_dir, 'run', 'private_output.zip')
+            shutil.make_archive(os.path.splitext(private_output_file)[0], 'zip', output_dir)
+            private_output_id = "%s/private_output.zip" % (os.path.splitext(run_id)[0])
+            _upload(blob_service, container, private_output_id, private_output_file, **upload_options)
+            shutil.rmtree(private_dir, onerror=on_rm_error)
+
+        # Pack results and send them to Blob storage
+        logger.debug("Packing results...")
+        output_file = join(root_dir, 'run', 'output.zip')
+        shutil.make_archive(os.path.splitext(output_file)[0], 'zip', output_dir)
+        output_id = "%s/output.zip" % (os.path.splitext(run_id)[0])
+        _upload(blob_service, container, output_id, output_file, **upload_options)
+
+        # Check if the output folder contain an "html file" and copy the html file as detailed_results.html
+        # traverse root directory, and list directories as dirs and files as files
+        html_found = False
+        for root, dirs, files in os.walk(output_dir):
+            if not (html_found):
+                path = root.split('/')
+                for file in files:
+                    file_to_upload = os.path.join(root,file)
+                    file_ext = os.path.splitext(file_to_upload)[1]
+                    if file_ext.lower() ==".html":
+                        html_file_id = "%s/html/%s" % (os.path.splitext(run_id)[0],"detailed_results.html")
+                        _upload(blob_service, container, html_file_id, file_to_upload, "html", **upload_options)
+                        html_found = True
+
+        return (timed_out, exit_code, stderr_file, output_dir, output_id)
 
     def run(task_id, task_args):
         """
@@ -227,6 +853,9 @@ def get_run_func(config):
 
         task_id: The tracking ID for this task.
         task_args: The input arguments for this task:
+            bundle_id: The ID of the run bundle.
+            score_bundle_id: Optional ID of the scoring run bundle of a fused task, which is run
+                after the prediction run given by bundle_id, with the predictions staged locally.
         """
         run_id = task_args['bundle_id']
         execution_time_limit = task_args['execution_time_limit']
@@ -241,7 +870,7 @@ def get_run_func(config):
                                      reply_to_queue_name)
         root_dir = None
         current_dir = os.getcwd()
-        temp_dir = config.getLocalRoot()
+        temp_dir = local_root
         try:
            running_processes = subprocess.check_output(["fuser", temp_dir])
         except subprocess.CalledProcessError, e:
@@ -277,184 +906,29 @@ def get_run_func(config):
                 pass
 
             _send_update(queue, task_id, 'running', extra={
-                'metadata': debug_metadata
+                'metadata': debug_metadata,
+                'stage': 'predict' if is_predict_step else 'score',
             })
             # Create temporary directory for the run
-            root_dir = tempfile.mkdtemp(dir=config.getLocalRoot())
-            # Fetch and stage the bundles
+            root_dir = tempfile.mkdtemp(dir=local_root)
             blob_service = BlobService(config.getAzureStorageAccountName(),
                                        config.getAzureStorageAccountKey())
-            bundles = getBundle(root_dir, blob_service, container, run_id, 'run')
-            # Verify we have an input folder: create one if it's not in the bundle.
-            input_rel_path = join('run', 'input')
-            if input_rel_path not in bundles:
-                input_dir = join(root_dir, 'run', 'input')
-                if os.path.exists(input_dir) == False:
-                    os.mkdir(input_dir)
-            # Verify we have a program
-            prog_rel_path = join('run', 'program')
-            if prog_rel_path not in bundles:
-                raise Exception("Program bundle is not available.")
-
-            prog_info = bundles[prog_rel_path]
-            if prog_info is None:
-                raise Exception("Program metadata is not available.")
-
-            prog_cmd_list = []
-            if 'command' in prog_info:
-                if isinstance(prog_info['command'], type([])):
-                    prog_cmd_list = [_.strip() for _ in prog_info['command']]
-                else:
-                    prog_cmd_list = [prog_info['command'].strip()]
-            if len(prog_cmd_list) <= 0:
-                raise Exception("Program command is not specified.")
-
-            # Create output folder
-            output_dir = join(root_dir, 'run', 'output')
-            if os.path.exists(output_dir) == False:
-                os.mkdir(output_dir)
-            # Create temp folder
-            temp_dir = join(root_dir, 'run', 'temp')
-            if os.path.exists(temp_dir) == False:
-                os.mkdir(temp_dir)
-            # Report the list of folders and files staged
-            #
-            # Invoke custom evaluation program
-            run_dir = join(root_dir, 'run')
-            os.chdir(run_dir)
-            os.environ["PATH"] += os.pathsep + run_dir + "/program"
-            logger.debug("Execution directory: %s", run_dir)
-
-            if is_predict_step:
-                stdout_file_name = 'prediction_stdout_file.txt'
-                stderr_file_name = 'prediction_stderr_file.txt'
-            else:
-                stdout_file_name = 'stdout.txt'
-                stderr_file_name = 'stderr.txt'
-
-            stdout_file = join(run_dir, stdout_file_name)
-            stderr_file = join(run_dir, stderr_file_name)
-            stdout = open(stdout_file, "a+")
-            stderr = open(stderr_file, "a+")
-            prog_status = []
-
-            for prog_cmd_counter, prog_cmd in enumerate(prog_cmd_list):
-                # Update command-line with the real paths
-                logger.debug("CMD: %s", prog_cmd)
-                prog_cmd = prog_cmd.replace("$program", join(run_dir, 'program')) \
-                                    .replace("$input", join(run_dir, 'input')) \
-                                    .replace("$output", join(run_dir, 'output')) \
-                                    .replace("$tmp", join(run_dir, 'temp')) \
-                                    .replace("/", os.path.sep) \
-                                    .replace("\\", os.path.sep)
-                logger.debug("Invoking program: %s", prog_cmd)
-
-                startTime = time.time()
-                exit_code = None
-                timed_out = False
-
-                if 'Darwin' not in platform.platform():
-                    prog_cmd = prog_cmd.replace("python", join(run_dir, "/home/azureuser/anaconda/bin/python"))
-                    # Run as separate user
-                    evaluator_process = Popen(
-                        prog_cmd.split(' '),
-                        preexec_fn=demote(),  # this pre-execution function drops into a lower user
-                        stdout=stdout,
-                        stderr=stderr,
-                        env=os.environ
-                    )
-                else:
-                    evaluator_process = Popen(
-                        prog_cmd.split(' '),
-                        stdout=stdout,
-                        stderr=stderr,
-                        env=os.environ
-                    )
-
-                logger.debug("Started process, pid=%s" % evaluator_process.pid)
-
-                time_difference = time.time() - startTime
-                signal.signal(signal.SIGALRM, alarm_handler)
-                signal.alarm(int(math.fabs(math.ceil(execution_time_limit - time_difference))))
-
-                exit_code = None
-
-                logger.debug("Checking process, exit_code = %s" % exit_code)
-
-                try:
-                    while exit_code == None:
-                        time.sleep(1)
-                        exit_code = evaluator_process.poll()
-                except (ValueError, OSError):
-                    pass # tried to communicate with dead process
-                except ExecutionTimeLimitExceeded:
-                    exit_code = -1
-                    logger.info("Killed process for running too long!")
-                    stderr.write("Execution time limit exceeded!")
-                    evaluator_process.kill()
-                    timed_out = True
-
-                signal.alarm(0)
-
-                logger.debug("Exit Code: %d", exit_code)
-
-                endTime = time.time()
-                elapsedTime = endTime - startTime
-
-                if len(prog_cmd_list) == 1:
-                    # Overwrite prog_status array with dict
-                    prog_status = {
-                        'exitCode': exit_code,
-                        'elapsedTime': elapsedTime
-                    }
-                else:
-                    # otherwise we're doing multi-track and processing multiple commands so append to the array
-                    prog_status.append({
-                        'exitCode': exit_code,
-                        'elapsedTime': elapsedTime
-                    })
-                with open(join(output_dir, 'metadata'), 'w') as f:
-                    f.write(yaml.dump(prog_status, default_flow_style=False))
-
-            stdout.close()
-            stderr.close()
-
-            logger.debug("Saving output files")
-            stdout_id = "%s/%s" % (os.path.splitext(run_id)[0], stdout_file_name)
-            _upload(blob_service, container, stdout_id, stdout_file)
-            stderr_id = "%s/%s" % (os.path.splitext(run_id)[0], stderr_file_name)
-            _upload(blob_service, container, stderr_id, stderr_file)
-
-            private_dir = join(output_dir, 'private')
-            if os.path.exists(private_dir):
-                logger.debug("Packing private results...")
-                private_output_file = join(root_dir, 'run', 'private_output.zip')
-                shutil.make_archive(os.path.splitext(private_output_file)[0], 'zip', output_dir)
-                private_output_id = "%s/private_output.zip" % (os.path.splitext(run_id)[0])
-                _upload(blob_service, container, private_output_id, private_output_file)
-                shutil.rmtree(private_dir, onerror=on_rm_error)
-
-            # Pack results and send them to Blob storage
-            logger.debug("Packing results...")
-            output_file = join(root_dir, 'run', 'output.zip')
-            shutil.make_archive(os.path.splitext(output_file)[0], 'zip', output_dir)
-            output_id = "%s/output.zip" % (os.path.splitext(run_id)[0])
-            _upload(blob_service, container, output_id, output_file)
-
-            # Check if the output folder contain an "html file" and copy the html file as detailed_results.html
-            # traverse root directory, and list directories as dirs and files as files
-            html_found = False
-            for root, dirs, files in os.walk(output_dir):
-                if not (html_found):
-                    path = root.split('/')
-                    for file in files:
-                        file_to_upload = os.path.join(root,file)
-                        file_ext = os.path.splitext(file_to_upload)[1]
-                        if file_ext.lower() ==".html":
-                            html_file_id = "%s/html/%s" % (os.path.splitext(run_id)[0],"detailed_results.html")
-                            _upload(blob_service, container, html_file_id, file_to_upload, "html")
-                            html_found = True
-
+            # A fused task runs the scoring program on the predictions right after the prediction
+            # program, on this node: the predictions are uploaded but not downloaded again
+            stages = [(run_id, is_predict_step)]
+            if 'score_bundle_id' in task_args:
+                stages.append((task_args['score_bundle_id'], False))
+            local_bundles = {}
+            for (stage_run_id, stage_is_predict) in stages:
+                if stage_run_id != run_id:
+                    _send_update(queue, task_id, 'running', extra={'stage': 'score'})
+                (timed_out, exit_code, stderr_file, output_dir, output_id) = run_stage(
+                    root_dir, blob_service, container, stage_run_id, execution_time_limit, stage_is_predict,
+                    local_bundles
+                )
+                if timed_out or exit_code != 0:
+                    break
+                local_bundles[output_id] = output_dir
             # Save extra metadata
             debug_metadata["end_virtual_memory_usage"] = json.dumps(psutil.virtual_memory()._asdict())
             debug_metadata["end_swap_memory_usage"] = json.dumps(psutil.swap_memory()._asdict())
@@ -473,9 +947,13 @@ def get_run_func(config):
                     'metadata': debug_metadata
                 })
             else:
-                _send_update(queue, task_id, 'finished', extra={
+                extra = {
                     'metadata': debug_metadata
-                })
+                }
+                scores = _read_scores(output_dir)
+                if scores is not None:
+                    extra['scores'] = scores
+                _send_update(queue, task_id, 'finished', extra=extra)
         except Exception:
             if debug_metadata['end_virtual_memory_usage'] == None:
                 # We didnt' make it far enough to save end metadata... so do it!
@@ -499,13 +977,34 @@ def get_run_func(config):
                 logger.exception("Unable to clean-up local folder %s (task_id=%s)", root_dir, task_id)
     return run
 
-def main():
+def _slot_cpus(slot, slot_count, cpu_count):
+    """Returns the CPU cores of a slot, an even share of the cores of the machine."""
+    cores_per_slot = max(1, cpu_count // slot_count)
+    return [(slot * cores_per_slot + i) % cpu_count for i in range(cores_per_slot)]
+
+
+def _has_free_resources(min_free_cores, min_free_memory):
+    """Returns whether the machine has at least the given idle CPU cores and available memory in bytes."""
+    idle_cores = psutil.cpu_count() * (100.0 - psutil.cpu_percent(interval=1)) / 100.0
+    if idle_cores < min_free_cores:
+        logger.debug("Not enough idle cores: %.1f" % idle_cores)
+        return False
+    available_memory = psutil.virtual_memory().available
+    if available_memory < min_free_memory:
+        logger.debug("Not enough available memory: %s" % available_memory)
+        return False
+    return True
+
+
+def start_slot(config, slot):
     """
-    Setup the worker and start it.
+    Starts the worker of an execution slot, which listens to the queue and performs one run at a time.
     """
-    config = WorkerConfig()
-
-    logging.config.dictConfig(config.getLoggerDictConfig())
+    if config.getSlotCpuPinning():
+        cpus = _slot_cpus(slot, config.getSlotCount(), psutil.cpu_count())
+        # The programs of the runs inherit the affinity
+        psutil.Process().cpu_affinity(cpus)
+        logger.info("Pinned slot %s to cores %s." % (slot, cpus))
 
     # queue to listen to for notifications of tasks to perform
     queue = AzureServiceBusQueue(config.getAzureServiceBusNamespace(),
@@ -516,13 +1015,37 @@ def main():
                                  config.getAzureServiceBusQueue())
     # map task type to function to accomplish the task
     vtable = {
-        'run' : get_run_func(config)
+        'run' : get_run_func(config, slot)
     }
+    admit = None
+    (min_free_cores, min_free_memory) = (config.getSlotMinFreeCores(), config.getSlotMinFreeMemory())
+    if min_free_cores > 0 or min_free_memory > 0:
+        admit = lambda: _has_free_resources(min_free_cores, min_free_memory)
     # create and start the worker
-    worker = BaseWorker(queue, vtable, logger)
-    logger.info("Starting compute worker.")
+    worker = BaseWorker(queue, vtable, logger, admit=admit)
+    logger.info("Starting compute worker slot %s." % slot)
     worker.start()
 
+
+def main():
+    """
+    Setup the worker and start it.
+    """
+    config = WorkerConfig()
+
+    logging.config.dictConfig(config.getLoggerDictConfig())
+
+    slot_count = config.getSlotCount()
+    if slot_count <= 1:
+        start_slot(config, 0)
+        return
+    # Runs change the working directory and use alarms, so each slot runs in its own process
+    slots = [multiprocessing.Process(target=start_slot, args=(config, slot)) for slot in range(slot_count)]
+    for process in slots:
+        process.start()
+    for process in slots:
+        process.join()
+
 if __name__ == "__main__":
 
     main()